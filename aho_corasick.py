@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+"""
+Автомат Ахо-Корасик для поиска ключевых слов в названиях товаров
+
+Все ключевые слова нескольких словарей (группы: бренды, типы продуктов)
+собираются в один автомат. За один проход по строке для каждой группы
+находится ключевое слово с наивысшим приоритетом (наименьшим номером)
+среди встретившихся - это то же самое, что первый успешный
+"if keyword in text" при переборе словаря по порядку.
+"""
+
+from collections import deque
+from typing import Any, Dict, List, Sequence, Tuple
+
+
+class AhoCorasick:
+    """
+    Автомат по группам ключевых слов
+
+    groups: {имя группы: [(ключевое слово, значение), ...]} - порядок
+    в списке задаёт приоритет, как при переборе в цикле.
+    """
+
+    def __init__(self, groups: Dict[str, Sequence[Tuple[str, Any]]]):
+        self._group_names = list(groups)
+        self._values: List[List[Any]] = []
+
+        # Бор: переходы, ссылки неудач и лучшие совпадения в каждом состоянии
+        goto: List[Dict[str, int]] = [{}]
+        best: List[Dict[int, int]] = [{}]
+
+        for group_index, keywords in enumerate(groups.values()):
+            values = []
+            for priority, (keyword, value) in enumerate(keywords):
+                values.append(value)
+                if not keyword:
+                    continue
+                state = 0
+                for ch in keyword:
+                    next_state = goto[state].get(ch)
+                    if next_state is None:
+                        next_state = len(goto)
+                        goto[state][ch] = next_state
+                        goto.append({})
+                        best.append({})
+                    state = next_state
+                if priority < best[state].get(group_index, priority + 1):
+                    best[state][group_index] = priority
+            self._values.append(values)
+
+        # Полный автомат: переходы по всем символам алфавита, чтобы
+        # проход по строке был одним поиском в словаре на символ
+        delta: List[Dict[str, int]] = [dict(goto[0])] + [None] * (len(goto) - 1)
+        fail = [0] * len(goto)
+        queue = deque(goto[0].values())
+        while queue:
+            state = queue.popleft()
+            delta[state] = dict(delta[fail[state]])
+            delta[state].update(goto[state])
+            for group_index, priority in best[fail[state]].items():
+                if priority < best[state].get(group_index, priority + 1):
+                    best[state][group_index] = priority
+            for ch, child in goto[state].items():
+                fail[child] = delta[fail[state]].get(ch, 0)
+                queue.append(child)
+
+        self._delta = delta
+        self._outputs = [tuple(found.items()) if found else None for found in best]
+
+    def first_matches(self, text: str) -> Dict[str, Any]:
+        """
+        Значения ключевых слов с наивысшим приоритетом для каждой группы,
+        встретившихся в text как подстрока. Группы без совпадений не попадают.
+        """
+        delta = self._delta
+        outputs = self._outputs
+        found: Dict[int, int] = {}
+        state = 0
+
+        for ch in text:
+            state = delta[state].get(ch, 0)
+            output = outputs[state]
+            if output is not None:
+                for group_index, priority in output:
+                    if priority < found.get(group_index, priority + 1):
+                        found[group_index] = priority
+
+        return {
+            self._group_names[group_index]: self._values[group_index][priority]
+            for group_index, priority in found.items()
+        }
@@ -6,8 +6,6 @@
 
 import sqlite3
 import os
-import re
-from dataclasses import dataclass
 from typing import Optional, List, Dict, Tuple
 from flask import Flask, render_template, request, jsonify, redirect, url_for, flash, session
 from datetime import datetime
@@ -20,12 +18,32 @@ from auth import (
     link_telegram_with_code, unlink_telegram, get_user_stats
 )
 
+# Нормализация текста и поисковый индекс
+from text_utils import normalize_text, tokenize_query
+from store_db import ensure_store_schema
+import db_pool
+from product_attributes import (
+    ProductAttributes, pop_attributes, ATTRIBUTE_COLUMNS_SQL, ATTRIBUTES_JOIN_SQL
+)
+from search_index import get_search_index, relevance_score
+from search_fts import ensure_fts_index, search_products_fts, count_products_fts
+from catalog_pages import (
+    SORT_COLUMNS, decode_cursor, fetch_page, page_cursors
+)
+from store_summary import get_store_summary
+from matching import get_catalog_index, find_similar_in_index, get_cross_store_matches, other_store
+
 # Импорт конфигурации
 try:
     from config import TELEGRAM_BOT_USERNAME
 except ImportError:
     TELEGRAM_BOT_USERNAME = 'PricioNotifyBot'
 
+try:
+    from config import SEARCH_BACKEND
+except ImportError:
+    SEARCH_BACKEND = 'index'
+
 app = Flask(__name__)
 app.secret_key = 'pricio-secret-key-change-in-production-2024'  # Для сессий
 
@@ -40,36 +58,14 @@ DATABASES = {
 # УЛУЧШЕННЫЙ ПОИСК
 # ============================================================================
 
-def normalize_text(text: str) -> str:
-    """Нормализация текста для поиска (Python-сторона)"""
-    if not text:
-        return ""
-    # Приводим к нижнему регистру (работает с кириллицей!)
-    text = text.lower()
-    # Заменяем ё на е
-    text = text.replace('ё', 'е')
-    # Убираем лишние пробелы
-    text = ' '.join(text.split())
-    return text
-
-
-def tokenize_query(query: str) -> List[str]:
-    """Разбиваем запрос на токены (слова)"""
-    query = normalize_text(query)
-    # Разбиваем по пробелам и знакам препинания
-    tokens = re.split(r'[\s,.\-_/\\()]+', query)
-    # Фильтруем пустые и короткие токены
-    tokens = [t for t in tokens if len(t) >= 2]
-    return tokens
-
-
-def smart_search_products(conn, search_query: str, category: str = None, limit: int = 500) -> Tuple[List, int]:
+def smart_search_products(conn, search_query: str, category: str = None, limit: int = 500,
+                          store_id: str = None) -> Tuple[List, int]:
     """
     Улучшенный поиск товаров с ранжированием
     
-    SQLite LOWER() не работает с кириллицей, поэтому:
-    1. Загружаем все товары (или по категории)
-    2. Фильтруем и ранжируем на Python
+    SQLite LOWER() не работает с кириллицей, поэтому фильтрация на Python:
+    - если передан store_id - через in-memory индекс магазина (search_index)
+    - иначе полным перебором товаров (или по категории)
     """
     if not search_query or not search_query.strip():
         return [], 0
@@ -78,6 +74,28 @@ def smart_search_products(conn, search_query: str, category: str = None, limit:
     if not tokens:
         return [], 0
     
+    if store_id in DATABASES:
+        index = get_search_index(DATABASES[store_id]['file'])
+        ranked = index.search(search_query, category)
+        page = ranked[:limit]
+        if not page:
+            return [], len(ranked)
+        
+        placeholders = ','.join('?' * len(page))
+        rows = conn.execute(
+            f"SELECT * FROM products WHERE id IN ({placeholders})",
+            [doc_id for doc_id, _ in page]
+        ).fetchall()
+        rows_by_id = {row['id']: dict(row) for row in rows}
+        
+        results = []
+        for doc_id, relevance in page:
+            product = rows_by_id.get(doc_id)
+            if product:
+                product['relevance'] = relevance
+                results.append(product)
+        return results, len(ranked)
+    
     normalized_query = normalize_text(search_query)
     
     # Загружаем товары из базы
@@ -93,34 +111,13 @@ def smart_search_products(conn, search_query: str, category: str = None, limit:
     for row in all_products:
         product = dict(row)
         name = product.get('name', '')
-        name_normalized = normalize_text(name)
+        name_normalized = product.get('name_normalized') or normalize_text(name)
         cat_normalized = normalize_text(product.get('category', '') or '')
         
         # Подсчитываем релевантность
-        relevance = 0
-        
-        # Точное совпадение всей фразы
-        if normalized_query in name_normalized:
-            relevance = 100
-            # Бонус если название начинается с запроса
-            if name_normalized.startswith(normalized_query):
-                relevance = 110
-            # Бонус за точное совпадение слова
-            if normalized_query == name_normalized or f" {normalized_query} " in f" {name_normalized} ":
-                relevance = 120
-        else:
-            # Проверяем сколько токенов найдено
-            matches = sum(1 for t in tokens if t in name_normalized)
-            
-            if matches == len(tokens):
-                # Все токены найдены
-                relevance = 80
-            elif matches > 0:
-                # Часть токенов найдена
-                relevance = 30 + matches * 15
-            elif normalized_query in cat_normalized:
-                # Совпадение с категорией
-                relevance = 20
+        matches = sum(1 for t in tokens if t in name_normalized)
+        relevance = relevance_score(normalized_query, name_normalized, matches,
+                                    len(tokens), cat_normalized)
         
         if relevance > 0:
             product['relevance'] = relevance
@@ -136,430 +133,135 @@ def smart_search_products(conn, search_query: str, category: str = None, limit:
     return results[:limit], total
 
 
-def count_search_results(conn, search_query: str, category: str = None) -> int:
+def use_fts_search(conn, store_id: str) -> bool:
+    """Включён ли FTS5-поиск и готов ли индекс для магазина"""
+    if SEARCH_BACKEND != 'fts5' or store_id not in DATABASES:
+        return False
+    return ensure_fts_index(conn, DATABASES[store_id]['file'])
+
+
+def count_search_results(conn, search_query: str, category: str = None, store_id: str = None) -> int:
     """Подсчёт результатов поиска"""
-    results, total = smart_search_products(conn, search_query, category, limit=10000)
+    if use_fts_search(conn, store_id):
+        return count_products_fts(conn, search_query, category)
+    results, total = smart_search_products(conn, search_query, category, limit=10000, store_id=store_id)
     return total
 
 
 # ============================================================================
-# ПАРСИНГ АТРИБУТОВ ТОВАРА
+# ПОИСК ПОХОЖИХ ТОВАРОВ
 # ============================================================================
 
-@dataclass
-class ProductAttributes:
-    """Структурированные атрибуты товара"""
-    product_type: Optional[str] = None   # молоко, сыр, колбаса
-    brand: Optional[str] = None          # Простоквашино, Mucho Mas
-    volume_ml: Optional[float] = None    # объём в мл
-    weight_g: Optional[float] = None     # вес в граммах
-    fat_percent: Optional[float] = None  # жирность
-    quantity: Optional[int] = None       # количество в упаковке
-
-
-# Словарь типов продуктов для нормализации
-PRODUCT_TYPES = {
-    'молоко': ['молоко', 'молочко'],
-    'кефир': ['кефир'],
-    'йогурт': ['йогурт', 'йогу|рт'],
-    'творог': ['творог', 'творожок', 'творожный', 'творожная', 'творожное'],
-    'сметана': ['сметана'],
-    'сливки': ['сливки'],
-    'сыр': ['сыр', 'сырок', 'сырный', 'сырная'],
-    'масло': ['масло'],
-    'колбаса': ['колбаса', 'колбасный', 'колбасная', 'колбаски'],
-    'сосиски': ['сосиски', 'сосиска', 'сардельки', 'сарделька'],
-    'ветчина': ['ветчина'],
-    'бекон': ['бекон'],
-    'курица': ['курица', 'куриный', 'куриная', 'куриное', 'цыплёнок', 'цыпленок'],
-    'индейка': ['индейка', 'индюшиный', 'индюшиная'],
-    'свинина': ['свинина', 'свиной', 'свиная', 'свиное'],
-    'говядина': ['говядина', 'говяжий', 'говяжья', 'говяжье'],
-    'фарш': ['фарш'],
-    'рыба': ['рыба', 'рыбный', 'рыбная', 'рыбное'],
-    'лосось': ['лосось', 'сёмга', 'семга', 'форель'],
-    'креветки': ['креветки', 'креветка'],
-    'хлеб': ['хлеб', 'хлебец', 'хлебцы'],
-    'батон': ['батон', 'багет'],
-    'булка': ['булка', 'булочка', 'булочки'],
-    'вино': ['вино'],
-    'пиво': ['пиво'],
-    'водка': ['водка'],
-    'виски': ['виски'],
-    'коньяк': ['коньяк'],
-    'сок': ['сок', 'нектар'],
-    'вода': ['вода', 'минералка', 'минеральная'],
-    'лимонад': ['лимонад', 'газировка'],
-    'чай': ['чай'],
-    'кофе': ['кофе'],
-    'шоколад': ['шоколад', 'шоколадка', 'шоколадный', 'шоколадная'],
-    'конфеты': ['конфеты', 'конфета'],
-    'печенье': ['печенье'],
-    'торт': ['торт'],
-    'мороженое': ['мороженое', 'пломбир', 'эскимо'],
-    'чипсы': ['чипсы'],
-    'орехи': ['орехи', 'орех', 'арахис', 'миндаль', 'фундук', 'кешью', 'фисташки'],
-    'яйца': ['яйца', 'яйцо'],
-    'макароны': ['макароны', 'паста', 'спагетти', 'лапша'],
-    'рис': ['рис'],
-    'гречка': ['гречка', 'гречневая'],
-    'овсянка': ['овсянка', 'овсяная', 'овсяные'],
-    'мука': ['мука'],
-    'сахар': ['сахар'],
-    'соль': ['соль'],
-    'бананы': ['бананы', 'банан'],
-    'яблоки': ['яблоки', 'яблоко'],
-    'апельсины': ['апельсины', 'апельсин'],
-    'мандарины': ['мандарины', 'мандарин'],
-    'лимоны': ['лимоны', 'лимон'],
-    'виноград': ['виноград'],
-    'помидоры': ['помидоры', 'помидор', 'томаты', 'томат'],
-    'огурцы': ['огурцы', 'огурец'],
-    'картофель': ['картофель', 'картошка'],
-    'морковь': ['морковь', 'морковка'],
-    'лук': ['лук'],
-    'капуста': ['капуста'],
-}
-
-# Известные бренды (русские)
-RUSSIAN_BRANDS = {
-    'простоквашино', 'домик в деревне', 'вкуснотеево', 'савушкин', 'брест-литовск',
-    'черкизово', 'мираторг', 'останкино', 'велком', 'папа может',
-    'добрый', 'любимый', 'фруктовый сад', 'моя семья', 'j7', 'rich',
-    'макфа', 'барилла', 'щебекинские',
-    'lay\'s', 'lays', 'pringles', 'cheetos',
-    'аленка', 'бабаевский', 'красный октябрь', 'коркунов', 'merci',
-    'bonduelle', 'heinz', 'calve',
-}
-
-# Стоп-слова (не определяют тип продукта)
-STOP_WORDS = {
-    'магнит', 'пятёрочка', 'пятерочка', 'для', 'без', 'или', 'the', 'штук', 'шт',
-    'упаковка', 'пакет', 'бзмж', 'premium', 'extra', 'new', 'global', 'village',
-    'напиток', 'продукт', 'изделие', 'товар', 'набор', 'ассорти', 'микс',
-    'добавлением', 'натуральный', 'свежий', 'вкусный', 'домашний', 'классический',
-    'молочный', 'молочная', 'молочное', 'детский', 'детская', 'взрослый',
-    'гавайский', 'тропический', 'летняя', 'летний', 'садовая', 'садовый',
-    'лесная', 'лесной', 'красное', 'красный', 'белое', 'белый', 'зеленый', 'зелёный',
-    'фасованное', 'фасованный', 'отборные', 'отборный', 'сокосодержащий',
-    'восстановленный', 'протеиновый', 'протеиновое', 'высокобелковый',
-    'энергетический', 'газированный', 'негазированный', 'безалкогольный',
-    'с', 'и', 'в', 'на', 'из', 'по', 'со'
-}
+# Базы, схема которых уже проверена в этом процессе
+_schema_checked = set()
 
 
-def parse_product_attributes(name: str) -> ProductAttributes:
-    """Извлечение структурированных атрибутов из названия товара"""
-    name_lower = name.lower()
-    attrs = ProductAttributes()
-    
-    # Извлекаем объём: 750мл, 1л, 1.5л, 0.5 л
-    volume_match = re.search(r'(\d+(?:[.,]\d+)?)\s*(?:мл|ml)\b', name_lower)
-    if volume_match:
-        attrs.volume_ml = float(volume_match.group(1).replace(',', '.'))
-    else:
-        volume_match = re.search(r'(\d+(?:[.,]\d+)?)\s*л(?:итр|\b)', name_lower)
-        if volume_match:
-            attrs.volume_ml = float(volume_match.group(1).replace(',', '.')) * 1000
-    
-    # Извлекаем вес: 500г, 1кг, 1.2кг
-    weight_match = re.search(r'(\d+(?:[.,]\d+)?)\s*(?:г|гр|грамм)(?!\w)', name_lower)
-    if weight_match:
-        attrs.weight_g = float(weight_match.group(1).replace(',', '.'))
-    else:
-        weight_match = re.search(r'(\d+(?:[.,]\d+)?)\s*кг\b', name_lower)
-        if weight_match:
-            attrs.weight_g = float(weight_match.group(1).replace(',', '.')) * 1000
-    
-    # Извлекаем жирность: 3.2%, 2,5%
-    fat_match = re.search(r'(\d+(?:[.,]\d+)?)\s*%', name_lower)
-    if fat_match:
-        attrs.fat_percent = float(fat_match.group(1).replace(',', '.'))
-    
-    # Извлекаем количество: 6шт, x12
-    qty_match = re.search(r'(\d+)\s*(?:шт|штук)|x(\d+)', name_lower)
-    if qty_match:
-        attrs.quantity = int(qty_match.group(1) or qty_match.group(2))
-    
-    # Извлекаем бренд (латиница - приоритет)
-    latin_brands = re.findall(r'\b([A-Z][a-zA-Z\']+(?:\s+[A-Z][a-zA-Z\']+)?)\b', name)
-    if latin_brands:
-        # Берём самый длинный бренд из латиницы
-        attrs.brand = max(latin_brands, key=len)
-    
-    # Проверяем известные русские бренды
-    if not attrs.brand:
-        for brand in RUSSIAN_BRANDS:
-            if brand in name_lower:
-                attrs.brand = brand.title()
-                break
-    
-    # Определяем тип продукта
-    for product_type, keywords in PRODUCT_TYPES.items():
-        for keyword in keywords:
-            if keyword in name_lower:
-                attrs.product_type = product_type
-                break
-        if attrs.product_type:
-            break
-    
-    # Если тип не найден - берём первое русское слово
-    if not attrs.product_type:
-        words = re.findall(r'[а-яёА-ЯЁ]{4,}', name_lower)
-        words = [w for w in words if w not in STOP_WORDS]
-        if words:
-            attrs.product_type = words[0]
-    
-    return attrs
-
-
-def stem_russian(word: str) -> str:
-    """Простой стемминг для русских слов - убираем окончания"""
-    if len(word) < 4:
-        return word
-    endings = ['ами', 'ями', 'ах', 'ях', 'ов', 'ев', 'ей', 'ий', 'ый', 'ая', 'яя', 'ое', 'ее',
-               'ы', 'и', 'а', 'я', 'у', 'ю', 'е', 'о']
-    for ending in endings:
-        if word.endswith(ending) and len(word) - len(ending) >= 3:
-            return word[:-len(ending)]
-    return word
-
+def get_db(store: str = '5ka', readonly: bool = True):
+    """
+    Получение соединения с БД из пула (db_pool.py).
+    Для чтения в веб-запросах - соединение только для чтения.
+    conn.close() возвращает соединение в пул.
+    """
+    db_file = DATABASES.get(store, DATABASES['5ka'])['file']
+    if db_file not in _schema_checked:
+        conn = db_pool.connect(db_file)
+        if conn is None:
+            return None
+        # Старые базы могут быть без name_normalized/tokens;
+        # FTS-индекс создаётся здесь же - дальше соединения только для чтения
+        ensure_store_schema(conn)
+        if SEARCH_BACKEND == 'fts5':
+            ensure_fts_index(conn, db_file)
+        conn.close()
+        _schema_checked.add(db_file)
+    return db_pool.connect(db_file, readonly=readonly)
 
-# ============================================================================
-# СКОРИНГ ПОХОЖЕСТИ
-# ============================================================================
 
-def calculate_similarity_score(attrs1: ProductAttributes, attrs2: ProductAttributes,
-                                name1: str, name2: str) -> int:
+def get_products_by_ids(keys: List[Tuple[str, str]]) -> Dict[Tuple[str, str], Dict]:
     """
-    Вычисляет оценку похожести товаров от 0 до 100.
-    Чем выше - тем более похожие товары.
+    Товары по парам (store_id, product_id): одно соединение
+    и один запрос на магазин.
     """
-    score = 0
-    
-    # Нормализуем названия
-    name1_norm = normalize_text(name1)
-    name2_norm = normalize_text(name2)
-    
-    # Извлекаем слова (минимум 3 буквы)
-    words1 = set(re.findall(r'[а-яёa-z]{3,}', name1_norm))
-    words2 = set(re.findall(r'[а-яёa-z]{3,}', name2_norm))
-    words1 -= STOP_WORDS
-    words2 -= STOP_WORDS
-    
-    # Получаем первое значимое слово (обычно это тип продукта)
-    first_word1 = name1_norm.split()[0] if name1_norm else ""
-    first_word2 = name2_norm.split()[0] if name2_norm else ""
-    
-    # 1. Первое слово (тип продукта) - самый важный критерий
-    first_word_match = False
-    if first_word1 and first_word2:
-        if first_word1 == first_word2:
-            score += 35
-            first_word_match = True
-        elif stem_russian(first_word1) == stem_russian(first_word2):
-            score += 30
-            first_word_match = True
-        elif first_word1 in first_word2 or first_word2 in first_word1:
-            score += 25  # Одно слово содержит другое
-            first_word_match = True
-    
-    # Если первые слова совсем не совпадают, проверяем product_type
-    if not first_word_match and attrs1.product_type and attrs2.product_type:
-        if attrs1.product_type == attrs2.product_type:
-            score += 30
-            first_word_match = True
-        elif stem_russian(attrs1.product_type) == stem_russian(attrs2.product_type):
-            score += 25
-            first_word_match = True
-    
-    # Если нет совпадения по типу/первому слову - товары не похожи
-    if not first_word_match:
-        # Но даём шанс если много общих слов
-        common_words = words1 & words2
-        if len(common_words) >= 2:
-            score += 20  # Бонус за общие слова
-        else:
-            return 0
+    product_ids_by_store = {}
+    for store_id, product_id in keys:
+        product_ids_by_store.setdefault(store_id, set()).add(product_id)
     
-    # 2. Бренд (очень важно для сравнения цен!)
-    if attrs1.brand and attrs2.brand:
-        if attrs1.brand.lower() == attrs2.brand.lower():
-            score += 35  # Тот же бренд - большой бонус
-        else:
-            score += 5   # Разные бренды - минимальный бонус
-    elif attrs1.brand or attrs2.brand:
-        score += 3  # У одного есть бренд, у другого нет
-    else:
-        score += 10  # Оба без бренда - возможно базовые продукты
-    
-    # 3. Объём/вес (важно для корректного сравнения)
-    if attrs1.volume_ml and attrs2.volume_ml:
-        ratio = min(attrs1.volume_ml, attrs2.volume_ml) / max(attrs1.volume_ml, attrs2.volume_ml)
-        if ratio > 0.95:
-            score += 12
-        elif ratio > 0.8:
-            score += 8
-        elif ratio > 0.5:
-            score += 4
-    elif attrs1.weight_g and attrs2.weight_g:
-        ratio = min(attrs1.weight_g, attrs2.weight_g) / max(attrs1.weight_g, attrs2.weight_g)
-        if ratio > 0.95:
-            score += 12
-        elif ratio > 0.8:
-            score += 8
-        elif ratio > 0.5:
-            score += 4
-    
-    # 4. Жирность (для молочки)
-    if attrs1.fat_percent and attrs2.fat_percent:
-        if abs(attrs1.fat_percent - attrs2.fat_percent) < 0.5:
-            score += 8
-        elif abs(attrs1.fat_percent - attrs2.fat_percent) < 1.5:
-            score += 4
-    
-    # 5. Пересечение слов в названии (fuzzy matching)
-    if words1 and words2:
-        intersection = len(words1 & words2)
-        union = len(words1 | words2)
-        if union > 0:
-            jaccard = intersection / union
-            score += int(jaccard * 15)  # До 15 баллов за совпадение слов
-    
-    return min(score, 100)
-
-
-# ============================================================================
-# ПОИСК ПОХОЖИХ ТОВАРОВ
-# ============================================================================
-
-def get_db(store: str = '5ka'):
-    """Получение соединения с БД"""
-    db_file = DATABASES.get(store, DATABASES['5ka'])['file']
-    if not os.path.exists(db_file):
-        return None
-    conn = sqlite3.connect(db_file)
-    conn.row_factory = sqlite3.Row
-    return conn
+    products = {}
+    for store_id, product_ids in product_ids_by_store.items():
+        conn = get_db(store_id)
+        if not conn:
+            continue
+        product_ids = list(product_ids)
+        # Ограничение SQLite на число параметров запроса
+        for start in range(0, len(product_ids), 500):
+            chunk = product_ids[start:start + 500]
+            rows = conn.execute(
+                f"SELECT * FROM products WHERE product_id IN ({','.join('?' * len(chunk))})",
+                chunk
+            ).fetchall()
+            for row in rows:
+                products[(store_id, row['product_id'])] = dict(row)
+        conn.close()
+    return products
 
 
 def get_similar_products_v2(store_id: str, product_name: str, product_id: str, 
-                            current_price: float, category: str = None, limit: int = 6) -> List[Dict]:
+                            current_price: float, category: str = None, limit: int = 6,
+                            source_attrs: ProductAttributes = None,
+                            candidates: str = 'blocking') -> List[Dict]:
     """
     Улучшенный поиск похожих товаров с многоуровневым скорингом.
     Возвращает список товаров с дополнительными полями:
     - similarity_score: оценка похожести (0-100)
     - price_diff: разница в цене
     - is_cheaper: дешевле ли этот товар
+    
+    Атрибуты кандидатов берутся из таблицы product_attributes,
+    кандидаты - из индекса каталога: блокирующего (blocking.py)
+    или MinHash/LSH (lsh.py) при candidates='lsh'.
     """
     conn = get_db(store_id)
     if not conn:
         return []
-    
-    # Парсим атрибуты исходного товара
-    source_attrs = parse_product_attributes(product_name)
-    
-    # Нормализуем название для поиска
-    source_name_normalized = normalize_text(product_name)
-    source_words = set(tokenize_query(product_name))
-    
-    # Формируем поисковые термы
-    search_terms = set()
-    
-    # 1. Все слова из названия (минимум 3 буквы)
-    for word in source_words:
-        if len(word) >= 3:
-            search_terms.add(word)
-            # Добавляем стемм
-            stemmed = stem_russian(word)
-            if len(stemmed) >= 3:
-                search_terms.add(stemmed)
-    
-    # 2. Тип продукта
-    if source_attrs.product_type:
-        search_terms.add(source_attrs.product_type.lower())
-        stemmed = stem_russian(source_attrs.product_type.lower())
-        if len(stemmed) >= 3:
-            search_terms.add(stemmed)
-    
-    # 3. Бренд
-    if source_attrs.brand:
-        search_terms.add(source_attrs.brand.lower())
-    
-    # Если нет терминов для поиска - берём первое слово названия
-    if not search_terms:
-        first_word = source_name_normalized.split()[0] if source_name_normalized else ""
-        if len(first_word) >= 3:
-            search_terms.add(first_word)
-    
-    # Загружаем все товары и фильтруем на Python (SQLite LOWER не работает с кириллицей)
-    all_products = conn.execute("SELECT * FROM products").fetchall()
-    
-    candidates = []
-    seen_ids = {product_id}  # Исключаем текущий товар
-    
-    for row in all_products:
-        if row['product_id'] in seen_ids:
-            continue
-        
-        name_normalized = normalize_text(row['name'])
-        
-        # Проверяем совпадение с любым поисковым термом
-        match_found = False
-        for term in search_terms:
-            if term in name_normalized:
-                match_found = True
-                break
-        
-        if match_found:
-            seen_ids.add(row['product_id'])
-            candidates.append(dict(row))
-    
     conn.close()
     
-    # Скорим всех кандидатов
-    scored_candidates = []
-    for candidate in candidates:
-        cand_attrs = parse_product_attributes(candidate['name'])
-        score = calculate_similarity_score(source_attrs, cand_attrs, product_name, candidate['name'])
-        
-        if score > 20:  # Минимальный порог релевантности
-            cand_price = candidate.get('current_price', 0) or 0
-            price_diff = cand_price - current_price if current_price else 0
-            
-            scored_candidates.append({
-                **candidate,
-                'similarity_score': score,
-                'price_diff': price_diff,
-                'is_cheaper': price_diff < -0.01,
-                'is_exact_match': score >= 70,  # Высокий скор = точный аналог
-                # Нормализованная цена за единицу
-                'price_per_unit': calculate_price_per_unit(candidate),
-            })
-    
-    # Сортируем: сначала по скору, потом по цене
-    scored_candidates.sort(key=lambda x: (-x['similarity_score'], x.get('current_price', 0) or 0))
+    index = get_catalog_index(DATABASES[store_id]['file'], candidates)
+    if index is None:
+        return []
     
-    return scored_candidates[:limit]
+    return find_similar_in_index(index, product_name, product_id, current_price,
+                                 source_attrs=source_attrs, limit=limit)
 
 
-def calculate_price_per_unit(product: Dict) -> Optional[Dict]:
-    """Вычисляет цену за единицу (литр или кг)"""
-    attrs = parse_product_attributes(product.get('name', ''))
-    price = product.get('current_price', 0) or 0
-    
-    if not price:
-        return None
-    
-    if attrs.volume_ml and attrs.volume_ml > 0:
-        price_per_liter = price / attrs.volume_ml * 1000
-        return {'value': price_per_liter, 'unit': 'л', 'display': f"{price_per_liter:.2f} ₽/л"}
-    
-    if attrs.weight_g and attrs.weight_g > 0:
-        price_per_kg = price / attrs.weight_g * 1000
-        return {'value': price_per_kg, 'unit': 'кг', 'display': f"{price_per_kg:.2f} ₽/кг"}
+def get_cross_store_similar(source_store: str, product_name: str, product_id: str,
+                            current_price: float, limit: int = 6,
+                            source_attrs: ProductAttributes = None,
+                            candidates: str = 'blocking') -> List[Dict]:
+    """
+    Аналоги товара в другом магазине.
+    Берутся из предрасчитанной таблицы product_matches, а если для товара
+    сопоставление ещё не считалось - ищутся на лету (candidates - генератор
+    кандидатов для поиска на лету).
+    """
+    target_store = other_store(source_store)
+    
+    source_conn = get_db(source_store)
+    target_conn = get_db(target_store)
+    matches = None
+    if source_conn and target_conn:
+        matches = get_cross_store_matches(source_conn, target_conn, product_id, target_store,
+                                          current_price, limit=limit)
+    for conn in (source_conn, target_conn):
+        if conn:
+            conn.close()
     
-    return None
+    if matches is None:
+        matches = get_similar_products_v2(
+            target_store, product_name, product_id,
+            current_price, limit=limit, source_attrs=source_attrs,
+            candidates=candidates
+        )
+    return matches
 
 
 def find_exact_match_cross_store(product_name: str, product_id: str, 
@@ -567,12 +269,15 @@ def find_exact_match_cross_store(product_name: str, product_id: str,
     """
     Поиск точного аналога товара в другом магазине.
     Возвращает лучшее совпадение или None.
+    
+    Точный аналог почти всегда имеет похожее название, поэтому
+    на лету кандидаты берутся из MinHash/LSH индекса.
     """
-    target_store = 'magnit' if source_store == '5ka' else '5ka'
+    target_store = other_store(source_store)
     
-    similar = get_similar_products_v2(
-        target_store, product_name, product_id, 
-        current_price, limit=1
+    similar = get_cross_store_similar(
+        source_store, product_name, product_id,
+        current_price, limit=1, candidates='lsh'
     )
     
     if similar and similar[0].get('is_exact_match'):
@@ -591,59 +296,30 @@ def find_exact_match_cross_store(product_name: str, product_id: str,
 
 def init_db(store: str):
     """Инициализация базы данных"""
-    conn = get_db(store)
+    conn = get_db(store, readonly=False)
     if not conn:
         return
     
-    conn.execute('''
-        CREATE TABLE IF NOT EXISTS products (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            product_id TEXT UNIQUE NOT NULL,
-            name TEXT NOT NULL,
-            category TEXT,
-            current_price REAL DEFAULT 0,
-            min_price REAL DEFAULT 0,
-            max_price REAL DEFAULT 0,
-            rating REAL DEFAULT 0,
-            reviews INTEGER DEFAULT 0,
-            image_url TEXT,
-            first_seen TIMESTAMP,
-            last_updated TIMESTAMP
-        )
-    ''')
-    
-    conn.execute('''
-        CREATE TABLE IF NOT EXISTS price_history (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            product_id TEXT NOT NULL,
-            price REAL NOT NULL,
-            old_price REAL,
-            recorded_at TIMESTAMP
-        )
-    ''')
+    ensure_store_schema(conn)
+    
+    if SEARCH_BACKEND == 'fts5':
+        ensure_fts_index(conn, DATABASES[store]['file'])
     
-    conn.commit()
     conn.close()
 
 
 def get_all_stats():
-    """Получение статистики по всем магазинам"""
+    """Получение статистики по всем магазинам (из сводки store_stats)"""
     stats = {}
     for store_id, store_info in DATABASES.items():
-        conn = get_db(store_id)
-        if conn:
-            try:
-                count = conn.execute("SELECT COUNT(*) FROM products").fetchone()[0]
-                stats[store_id] = {
-                    'name': store_info['name'],
-                    'color': store_info['color'],
-                    'count': count
-                }
-            except:
-                stats[store_id] = {'name': store_info['name'], 'color': store_info['color'], 'count': 0}
-            conn.close()
-        else:
-            stats[store_id] = {'name': store_info['name'], 'color': store_info['color'], 'count': 0}
+        count = 0
+        try:
+            store_stats = get_store_summary(store_info['file']).stats()
+            if store_stats:
+                count = store_stats['product_count']
+        except sqlite3.Error:
+            pass
+        stats[store_id] = {'name': store_info['name'], 'color': store_info['color'], 'count': count}
     return stats
 
 
@@ -659,6 +335,34 @@ def index():
     return render_template('home.html', stores=stats, user=user, active_store=None)
 
 
+def build_page_links(store_id: str, page: int, total_pages: int, page_args: Dict,
+                     cursors: Dict[int, Optional[str]] = None) -> Dict:
+    """
+    Ссылки пагинации: номера страниц вокруг текущей, первая, последняя.
+    С cursors - ссылки по токенам курсора, иначе по номеру страницы.
+    """
+    def page_url(target: int) -> str:
+        if cursors is not None:
+            return url_for('store_products', store_id=store_id, cursor=cursors.get(target), **page_args)
+        return url_for('store_products', store_id=store_id,
+                       page=target if target > 1 else None, **page_args)
+    
+    links = []
+    for p in range(1, total_pages + 1):
+        if p == page:
+            links.append({'label': p, 'url': None, 'active': True})
+        elif p == 1 or p == total_pages or (page - 2 <= p <= page + 2):
+            links.append({'label': p, 'url': page_url(p), 'active': False})
+        elif p == page - 3 or p == page + 3:
+            links.append({'label': '...', 'url': None, 'active': False})
+    
+    return {
+        'links': links,
+        'prev_url': page_url(page - 1) if page > 1 else None,
+        'next_url': page_url(page + 1) if page < total_pages else None,
+    }
+
+
 @app.route('/store/<store_id>')
 def store_products(store_id):
     """Страница товаров магазина"""
@@ -677,6 +381,7 @@ def store_products(store_id):
                                current_category='',
                                page=1,
                                total_pages=0,
+                               pagination=None,
                                total_products=0,
                                store_name=store_name,
                                store_id=store_id,
@@ -691,49 +396,54 @@ def store_products(store_id):
     page = int(request.args.get('page', 1))
     per_page = 50
     
-    # Получаем категории
-    categories_rows = conn.execute(
-        "SELECT DISTINCT category FROM products WHERE category IS NOT NULL AND category != '' ORDER BY category"
-    ).fetchall()
-    categories = [row['category'] for row in categories_rows]
+    # Параметры, которые переносятся в ссылки пагинации
+    page_args = {
+        'category': category or None,
+        'search': search or None,
+        'sort': request.args.get('sort'),
+        'order': request.args.get('order'),
+    }
+    
+    # Категории и количество товаров - из сводки магазина (кэш до изменения базы)
+    summary = get_store_summary(DATABASES[store_id]['file'])
+    categories = [item['name'] for item in summary.categories()]
     
     # Если есть поисковый запрос - используем умный поиск
     if search:
-        all_results, total = smart_search_products(conn, search, category, limit=500)
-        
-        # Пагинация результатов
-        start = (page - 1) * per_page
-        end = start + per_page
-        products = all_results[start:end]
+        if use_fts_search(conn, store_id):
+            # Поиск, подсчёт и пагинация в SQLite
+            products, total = search_products_fts(conn, search, category,
+                                                  limit=per_page, offset=(page - 1) * per_page)
+        else:
+            all_results, total = smart_search_products(conn, search, category, limit=500,
+                                                        store_id=store_id)
+            
+            # Пагинация результатов
+            start = (page - 1) * per_page
+            end = start + per_page
+            products = all_results[start:end]
         total_pages = (total + per_page - 1) // per_page
+        pagination = build_page_links(store_id, page, total_pages, page_args)
     else:
-        # Обычный запрос без поиска
-        query = "SELECT * FROM products WHERE 1=1"
-        params = []
-        
-        if category:
-            query += " AND category = ?"
-            params.append(category)
-        
-        valid_sorts = ['name', 'current_price', 'last_updated', 'category', 'min_price', 'max_price', 'rating']
-        if sort in valid_sorts:
-            query += f" ORDER BY {sort} {'DESC' if order == 'desc' else 'ASC'}"
-        else:
-            query += " ORDER BY last_updated DESC"
-        
-        query += f" LIMIT {per_page} OFFSET {(page - 1) * per_page}"
+        # Обычный запрос без поиска: keyset-пагинация по колонке сортировки и product_id
+        if sort not in SORT_COLUMNS:
+            sort, order = 'last_updated', 'desc'
+        order = 'desc' if order == 'desc' else 'asc'
         
-        products = [dict(row) for row in conn.execute(query, params).fetchall()]
+        cursor = decode_cursor(request.args.get('cursor', ''))
+        if cursor is not None and (cursor['s'], cursor['o']) != (sort, order):
+            # Токен от другой сортировки - начинаем с первой страницы
+            cursor = None
+        if cursor is not None:
+            page = cursor['p']
         
-        # Подсчёт общего количества
-        count_query = "SELECT COUNT(*) FROM products WHERE 1=1"
-        count_params = []
-        if category:
-            count_query += " AND category = ?"
-            count_params.append(category)
-        
-        total = conn.execute(count_query, count_params).fetchone()[0]
+        total = summary.category_count(category) if category else summary.stats()['product_count']
         total_pages = (total + per_page - 1) // per_page
+        
+        products = fetch_page(conn, category, sort, order, per_page,
+                              cursor=cursor, page=page, total=total)
+        cursors = page_cursors(products, sort, order, page, total_pages, per_page)
+        pagination = build_page_links(store_id, page, total_pages, page_args, cursors)
     
     conn.close()
     
@@ -744,6 +454,7 @@ def store_products(store_id):
                            current_category=category,
                            page=page,
                            total_pages=total_pages,
+                           pagination=pagination,
                            total_products=total,
                            store_name=store_name,
                            store_id=store_id,
@@ -765,7 +476,8 @@ def product_detail(store_id, product_id):
         return "База данных не найдена", 404
     
     product = conn.execute(
-        "SELECT * FROM products WHERE product_id = ?", (product_id,)
+        f"SELECT p.*, {ATTRIBUTE_COLUMNS_SQL} FROM products p {ATTRIBUTES_JOIN_SQL} "
+        "WHERE p.product_id = ?", (product_id,)
     ).fetchone()
     
     if not product:
@@ -784,21 +496,21 @@ def product_detail(store_id, product_id):
     product_dict = dict(product)
     current_price = product_dict.get('current_price', 0) or 0
     
-    # Парсим атрибуты текущего товара
-    product_attrs = parse_product_attributes(product_dict['name'])
-    price_per_unit = calculate_price_per_unit(product_dict)
+    # Атрибуты текущего товара (из product_attributes)
+    product_attrs, price_per_unit = pop_attributes(product_dict)
     
     # Похожие товары из этого магазина
     similar_same_store = get_similar_products_v2(
         store_id, product_dict['name'], product_id, 
-        current_price, product_dict.get('category'), limit=6
+        current_price, product_dict.get('category'), limit=6,
+        source_attrs=product_attrs
     )
     
     # Похожие товары из другого магазина
-    other_store_id = 'magnit' if store_id == '5ka' else '5ka'
-    similar_other_store = get_similar_products_v2(
-        other_store_id, product_dict['name'], product_id,
-        current_price, limit=6
+    other_store_id = other_store(store_id)
+    similar_other_store = get_cross_store_similar(
+        store_id, product_dict['name'], product_id,
+        current_price, limit=6, source_attrs=product_attrs
     )
     
     # Лучший аналог в другом магазине (для сравнения)
@@ -854,7 +566,8 @@ def api_compare(product_id):
         return jsonify({'error': 'Store not found'}), 404
     
     product = conn.execute(
-        "SELECT * FROM products WHERE product_id = ?", (product_id,)
+        f"SELECT p.*, {ATTRIBUTE_COLUMNS_SQL} FROM products p {ATTRIBUTES_JOIN_SQL} "
+        "WHERE p.product_id = ?", (product_id,)
     ).fetchone()
     
     if not product:
@@ -864,11 +577,12 @@ def api_compare(product_id):
     conn.close()
     
     product_dict = dict(product)
-    other_store_id = 'magnit' if store_id == '5ka' else '5ka'
+    product_attrs, _ = pop_attributes(product_dict)
+    other_store_id = other_store(store_id)
     
-    similar = get_similar_products_v2(
-        other_store_id, product_dict['name'], product_id,
-        product_dict.get('current_price', 0), limit=5
+    similar = get_cross_store_similar(
+        store_id, product_dict['name'], product_id,
+        product_dict.get('current_price', 0), limit=5, source_attrs=product_attrs
     )
     
     return jsonify({
@@ -963,34 +677,27 @@ def favorites_page():
     favorites_list = get_favorites(user['id'])
     alerts_list = get_price_alerts(user['id'])
     
+    # Товары избранного и подписок - одним запросом на магазин
+    products = get_products_by_ids(
+        [(item['store_id'], item['product_id']) for item in favorites_list + alerts_list]
+    )
+    alert_keys = {(alert['store_id'], alert['product_id']) for alert in alerts_list}
+    
     # Обогащаем данные избранного информацией о товарах
     enriched_favorites = []
     for fav in favorites_list:
-        conn = get_db(fav['store_id'])
-        if conn:
-            product = conn.execute(
-                "SELECT * FROM products WHERE product_id = ?", 
-                (fav['product_id'],)
-            ).fetchone()
-            conn.close()
-            
-            if product:
-                item = dict(fav)
-                item.update(dict(product))
-                item['has_alert'] = has_price_alert(user['id'], fav['store_id'], fav['product_id'])
-                enriched_favorites.append(item)
+        product = products.get((fav['store_id'], fav['product_id']))
+        if product:
+            item = dict(fav)
+            item.update(product)
+            item['has_alert'] = (fav['store_id'], fav['product_id']) in alert_keys
+            enriched_favorites.append(item)
     
     # Обогащаем данные уведомлений
     enriched_alerts = []
     for alert in alerts_list:
-        conn = get_db(alert['store_id'])
-        if conn:
-            product = conn.execute(
-                "SELECT name, current_price FROM products WHERE product_id = ?", 
-                (alert['product_id'],)
-            ).fetchone()
-            conn.close()
-            
+        if alert['store_id'] in DATABASES:
+            product = products.get((alert['store_id'], alert['product_id']))
             item = dict(alert)
             if product:
                 item['product_name'] = product['name']
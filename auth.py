@@ -5,6 +5,8 @@
 
 import sqlite3
 import os
+import db_pool
+from migrations import Migration, run_migrations
 from datetime import datetime, timedelta
 from werkzeug.security import generate_password_hash, check_password_hash
 from functools import wraps
@@ -13,14 +15,33 @@ from flask import session, redirect, url_for, flash, request
 # База данных пользователей
 USERS_DB = 'users.db'
 
+# Миграции схемы (migrations.py). Новые миграции - только в конец списка
+USERS_MIGRATIONS = [
+    Migration(1, 'Индексы списков пользователя и поиска по Telegram', (
+        'CREATE INDEX IF NOT EXISTS idx_favorites_user_added ON favorites(user_id, added_at)',
+        'CREATE INDEX IF NOT EXISTS idx_alerts_user_active ON price_alerts(user_id, is_active, created_at)',
+        'CREATE INDEX IF NOT EXISTS idx_users_telegram ON users(telegram_chat_id)',
+    )),
+]
+
+# Горячие запросы для отчёта о миграции
+USERS_PLAN_QUERIES = {
+    'Избранное пользователя': (
+        'SELECT store_id, product_id, added_at FROM favorites '
+        'WHERE user_id = ? ORDER BY added_at DESC', (0,)),
+    'Подписки пользователя': (
+        'SELECT * FROM price_alerts WHERE user_id = ? AND is_active = 1 '
+        'ORDER BY created_at DESC', (0,)),
+    'Пользователь по Telegram': (
+        'SELECT id, username FROM users WHERE telegram_chat_id = ?', ('',)),
+}
+
 
 def get_users_db():
-    """Получить подключение к базе пользователей"""
+    """Получить подключение к базе пользователей (из пула db_pool)"""
     if not os.path.exists(USERS_DB):
         init_users_db()
-    conn = sqlite3.connect(USERS_DB)
-    conn.row_factory = sqlite3.Row
-    return conn
+    return db_pool.connect(USERS_DB)
 
 
 def init_users_db():
@@ -90,6 +111,7 @@ def init_users_db():
     cursor.execute('CREATE INDEX IF NOT EXISTS idx_alerts_active ON price_alerts(is_active)')
     
     conn.commit()
+    run_migrations(conn, USERS_MIGRATIONS, USERS_PLAN_QUERIES)
     conn.close()
     print("[OK] База данных пользователей инициализирована")
 
@@ -340,66 +362,6 @@ def has_price_alert(user_id: int, store_id: str, product_id: str) -> bool:
     return result is not None
 
 
-def check_price_alerts_for_product(store_id: str, product_id: str, new_price: float, old_price: float) -> list:
-    """
-    Проверить подписки для товара при изменении цены
-    Возвращает список пользователей для уведомления
-    
-    ⚠️ ЗАГЛУШКА: В будущем здесь будет интеграция с Telegram ботом
-    """
-    if new_price >= old_price:
-        return []  # Цена не снизилась
-    
-    conn = get_users_db()
-    
-    # Находим всех подписчиков
-    alerts = conn.execute('''
-        SELECT pa.*, u.username, u.email, u.telegram_chat_id
-        FROM price_alerts pa
-        JOIN users u ON pa.user_id = u.id
-        WHERE pa.store_id = ? AND pa.product_id = ? AND pa.is_active = 1
-    ''', (store_id, product_id)).fetchall()
-    
-    notifications = []
-    
-    for alert in alerts:
-        should_notify = False
-        
-        # Проверяем условия уведомления
-        if alert['notify_any_decrease']:
-            should_notify = True
-        elif alert['target_price'] and new_price <= alert['target_price']:
-            should_notify = True
-        
-        if should_notify:
-            notifications.append({
-                'user_id': alert['user_id'],
-                'username': alert['username'],
-                'email': alert['email'],
-                'telegram_chat_id': alert['telegram_chat_id'],
-                'old_price': old_price,
-                'new_price': new_price,
-                'target_price': alert['target_price']
-            })
-            
-            # Обновляем запись
-            conn.execute('''
-                UPDATE price_alerts 
-                SET last_notified_at = ?, last_price = ?
-                WHERE id = ?
-            ''', (datetime.now(), new_price, alert['id']))
-    
-    conn.commit()
-    conn.close()
-    
-    # ⚠️ ЗАГЛУШКА: Здесь будет отправка уведомлений через Telegram бота
-    # TODO: Интеграция с Telegram Bot API
-    for n in notifications:
-        print(f"[NOTIFY] Уведомление для {n['username']}: цена снизилась {old_price} руб -> {new_price} руб")
-    
-    return notifications
-
-
 def update_telegram_chat_id(user_id: int, chat_id: str) -> dict:
     """Привязать Telegram для уведомлений"""
     conn = get_users_db()
@@ -0,0 +1,219 @@
+# -*- coding: utf-8 -*-
+"""
+Векторный скоринг похожести на NumPy
+
+Каталог один раз раскладывается в массивы: идентификаторы первого
+слова, типа и бренда, объём/вес/жирность как float-массивы и
+posting lists слов (разреженное представление множеств слов через
+словарь идентификаторов). Скоринг одного исходного товара против
+блока кандидатов считается целиком в массивах и даёт ровно те же
+целые баллы, что matching.calculate_similarity_score.
+
+NumPy - необязательная зависимость: без неё используется скалярный
+скоринг. Проверка совпадения и замер: python -m benchmarks.batch_scoring
+"""
+
+from typing import Dict, List, Sequence
+
+from product_attributes import ProductAttributes, STOP_WORDS, stem_russian
+from text_utils import extract_words
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+def numpy_available() -> bool:
+    """Установлен ли NumPy"""
+    return np is not None
+
+
+class _Vocabulary:
+    """Строка -> последовательный идентификатор"""
+
+    def __init__(self):
+        self.ids: Dict[str, int] = {}
+        self.values: List[str] = []
+
+    def add(self, value: str) -> int:
+        value_id = self.ids.get(value)
+        if value_id is None:
+            value_id = len(self.values)
+            self.ids[value] = value_id
+            self.values.append(value)
+        return value_id
+
+    def get(self, value: str) -> int:
+        """Идентификатор или -2 (не совпадает ни с чем, -1 - пустое значение)"""
+        return self.ids.get(value, -2)
+
+
+class CatalogArrays:
+    """
+    Массивы признаков каталога для векторного скоринга.
+    Элементы каталога - matching.CatalogItem.
+    """
+
+    def __init__(self, catalog: Sequence):
+        size = len(catalog)
+        self.size = size
+
+        self._first_words = _Vocabulary()
+        self._types = _Vocabulary()
+        self._type_stems = _Vocabulary()
+        self._brands = _Vocabulary()
+        self._words = _Vocabulary()
+
+        first_word_ids = np.empty(size, dtype=np.int64)
+        type_ids = np.full(size, -1, dtype=np.int64)
+        type_stem_ids = np.full(size, -1, dtype=np.int64)
+        brand_ids = np.full(size, -1, dtype=np.int64)
+        self.volume = np.zeros(size, dtype=np.float64)
+        self.weight = np.zeros(size, dtype=np.float64)
+        self.fat = np.zeros(size, dtype=np.float64)
+        word_counts = np.zeros(size, dtype=np.int64)
+        postings: List[List[int]] = []
+
+        for position, item in enumerate(catalog):
+            name_normalized = item.name_normalized
+            first_word_ids[position] = self._first_words.add(
+                name_normalized.split()[0] if name_normalized else ""
+            )
+
+            attrs = item.attrs
+            if attrs.product_type:
+                type_ids[position] = self._types.add(attrs.product_type)
+                type_stem_ids[position] = self._type_stems.add(stem_russian(attrs.product_type))
+            if attrs.brand:
+                brand_ids[position] = self._brands.add(attrs.brand.lower())
+            # Как в скалярном скоринге: None и 0 - "нет значения"
+            self.volume[position] = attrs.volume_ml or 0
+            self.weight[position] = attrs.weight_g or 0
+            self.fat[position] = attrs.fat_percent or 0
+
+            words = item.words if item.words is not None else extract_words(name_normalized)
+            words = set(words) - STOP_WORDS
+            word_counts[position] = len(words)
+            for word in words:
+                word_id = self._words.add(word)
+                if word_id == len(postings):
+                    postings.append([])
+                postings[word_id].append(position)
+
+        self.first_word_ids = first_word_ids
+        self.type_ids = type_ids
+        self.type_stem_ids = type_stem_ids
+        self.brand_ids = brand_ids
+        self.word_counts = word_counts
+        self._postings = [np.array(p, dtype=np.intp) for p in postings]
+        self._first_word_stems = [stem_russian(w) for w in self._first_words.values]
+
+    def _first_word_points(self, first_word1: str, stem1: str, word_id: int) -> int:
+        """Баллы за первое слово (как в calculate_similarity_score)"""
+        first_word2 = self._first_words.values[word_id]
+        if not first_word2:
+            return 0
+        if first_word1 == first_word2:
+            return 35
+        if stem1 == self._first_word_stems[word_id]:
+            return 30
+        if first_word1 in first_word2 or first_word2 in first_word1:
+            return 25
+        return 0
+
+    def scores(self, positions: Sequence[int], attrs1: ProductAttributes,
+               name1_normalized: str, words1: List[str] = None):
+        """
+        Оценки похожести исходного товара с товарами каталога на позициях positions
+
+        Returns:
+            np.ndarray целых баллов 0-100 в порядке positions
+        """
+        pos = np.asarray(positions, dtype=np.intp)
+        count = len(pos)
+        score = np.zeros(count, dtype=np.int64)
+        if not count:
+            return score
+
+        words1 = set(words1 if words1 is not None else extract_words(name1_normalized))
+        words1 -= STOP_WORDS
+
+        # 1. Первое слово: баллы по уникальным словам блока
+        matched = np.zeros(count, dtype=bool)
+        first_word1 = name1_normalized.split()[0] if name1_normalized else ""
+        if first_word1:
+            stem1 = stem_russian(first_word1)
+            unique_ids, inverse = np.unique(self.first_word_ids[pos], return_inverse=True)
+            table = np.array([self._first_word_points(first_word1, stem1, word_id)
+                              for word_id in unique_ids.tolist()], dtype=np.int64)
+            points = table[inverse]
+            score += points
+            matched = points > 0
+
+        # Тип продукта, если первые слова не совпали
+        if attrs1.product_type:
+            type_ids = self.type_ids[pos]
+            candidates = ~matched & (type_ids >= 0)
+            same_type = candidates & (type_ids == self._types.get(attrs1.product_type))
+            same_stem = candidates & ~same_type & (
+                self.type_stem_ids[pos] == self._type_stems.get(stem_russian(attrs1.product_type))
+            )
+            score += 30 * same_type + 25 * same_stem
+            matched |= same_type | same_stem
+
+        # Пересечение слов по posting lists
+        word_postings = [self._postings[self._words.ids[w]] for w in words1 if w in self._words.ids]
+        if word_postings:
+            common = np.bincount(np.concatenate(word_postings), minlength=self.size)[pos]
+        else:
+            common = np.zeros(count, dtype=np.int64)
+
+        # Без совпадения типа - только при двух общих словах
+        rejected = ~matched & (common < 2)
+        score += 20 * (~matched & ~rejected)
+
+        # 2. Бренд
+        brand_ids = self.brand_ids[pos]
+        has_brand2 = brand_ids >= 0
+        if attrs1.brand:
+            same_brand = brand_ids == self._brands.get(attrs1.brand.lower())
+            score += np.where(has_brand2, np.where(same_brand, 35, 5), 3)
+        else:
+            score += np.where(has_brand2, 3, 10)
+
+        # 3. Объём/вес
+        both_volume = np.zeros(count, dtype=bool)
+        if attrs1.volume_ml:
+            volume2 = self.volume[pos]
+            both_volume = volume2 != 0
+            score += self._ratio_points(attrs1.volume_ml, volume2, both_volume)
+        if attrs1.weight_g:
+            weight2 = self.weight[pos]
+            score += self._ratio_points(attrs1.weight_g, weight2, ~both_volume & (weight2 != 0))
+
+        # 4. Жирность
+        if attrs1.fat_percent:
+            fat2 = self.fat[pos]
+            diff = np.abs(attrs1.fat_percent - fat2)
+            has_fat = fat2 != 0
+            score += np.where(has_fat & (diff < 0.5), 8,
+                              np.where(has_fat & (diff < 1.5), 4, 0))
+
+        # 5. Jaccard по словам
+        if words1:
+            count2 = self.word_counts[pos]
+            union = np.where(count2 > 0, len(words1) + count2 - common, 1)
+            jaccard = common / union
+            score += np.where(count2 > 0, (jaccard * 15).astype(np.int64), 0)
+
+        score = np.minimum(score, 100)
+        score[rejected] = 0
+        return score
+
+    @staticmethod
+    def _ratio_points(value1: float, values2, mask):
+        """Баллы за близость объёма/веса: 12 / 8 / 4"""
+        ratio = np.minimum(value1, values2) / np.maximum(value1, values2)
+        points = np.where(ratio > 0.95, 12, np.where(ratio > 0.8, 8, np.where(ratio > 0.5, 4, 0)))
+        return np.where(mask, points, 0)
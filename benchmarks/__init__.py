@@ -0,0 +1,7 @@
+# -*- coding: utf-8 -*-
+"""
+Замеры производительности и качества
+
+Запуск из корня проекта:
+    python -m benchmarks.<имя_модуля>
+"""
@@ -0,0 +1,220 @@
+# -*- coding: utf-8 -*-
+"""
+Пакетная проверка подписок (notification_service.evaluate_alerts)
+против проверки по одной
+
+Генерирует базы магазинов и пользователей с N активными подписками
+во временном каталоге и проходит их двумя способами:
+    - прежний: get_product_info (SELECT) на каждую подписку и
+      UPDATE + commit после каждого уведомления;
+    - пакетный: товары по магазинам IN-запросами, should_notify
+      в памяти, все обновления одной транзакцией.
+Отправка считается успешной (Telegram не нужен). Сравнивает
+уведомления, итоговые цены подписок и время.
+
+Запуск:
+    python -m benchmarks.alert_evaluation
+    python -m benchmarks.alert_evaluation --alerts 50000
+"""
+
+import argparse
+import os
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+from contextlib import redirect_stdout
+from datetime import datetime, timedelta
+
+import notification_service
+from notification_service import (evaluate_alerts, get_active_alerts, get_store_db,
+                                  get_users_db, save_alert_updates, should_notify)
+from store_db import ensure_store_schema
+
+USERS_SCHEMA = '''
+    CREATE TABLE users (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        username TEXT,
+        telegram_chat_id TEXT
+    );
+    CREATE TABLE price_alerts (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL,
+        store_id TEXT NOT NULL,
+        product_id TEXT NOT NULL,
+        target_price REAL,
+        notify_any_decrease INTEGER DEFAULT 1,
+        is_active INTEGER DEFAULT 1,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        last_notified_at TIMESTAMP,
+        last_price REAL,
+        UNIQUE(user_id, store_id, product_id)
+    );
+'''
+
+
+def get_product_info(store_id, product_id):
+    """Прежняя реализация: отдельный запрос на каждый товар"""
+    conn = get_store_db(store_id)
+    if not conn:
+        return None
+    product = conn.execute(
+        'SELECT name, current_price as price FROM products WHERE product_id = ?',
+        (product_id,)
+    ).fetchone()
+    conn.close()
+    return dict(product) if product else None
+
+
+def update_alert_after_notification(alert_id, new_price):
+    """Прежняя реализация: commit на каждое обновление подписки"""
+    conn = get_users_db()
+    conn.execute('''
+        UPDATE price_alerts
+        SET last_notified_at = ?, last_price = ?
+        WHERE id = ?
+    ''', (datetime.now(), new_price, alert_id))
+    conn.commit()
+    conn.close()
+
+
+def run_legacy(alerts):
+    """Прежний цикл check_and_notify по одной подписке"""
+    notified = []
+    for alert in alerts:
+        product = get_product_info(alert['store_id'], alert['product_id'])
+        if not product:
+            continue
+        should, reason, old_price = should_notify(alert, product['price'])
+        if reason == 'first_check':
+            update_alert_after_notification(alert['alert_id'], product['price'])
+            continue
+        if should:
+            notified.append((alert['alert_id'], old_price, product['price'], reason))
+            update_alert_after_notification(alert['alert_id'], product['price'])
+    return notified
+
+
+def run_batched(alerts):
+    """evaluate_alerts и одна транзакция обновлений"""
+    notifications, updates = evaluate_alerts(alerts)
+    for item in notifications:
+        updates.append((datetime.now(), item['new_price'], item['alert_id']))
+    save_alert_updates(updates)
+    return [(item['alert_id'], item['old_price'], item['new_price'], item['reason'])
+            for item in notifications]
+
+
+def generate(tmp, alert_count, products_per_store, seed=1):
+    """Базы магазинов и пользователей с подписками"""
+    rng = random.Random(seed)
+    store_paths = {}
+    prices = {}
+    for store_id in ('5ka', 'magnit'):
+        path = os.path.join(tmp, f'{store_id}.db')
+        conn = sqlite3.connect(path)
+        ensure_store_schema(conn)
+        rows = []
+        for i in range(products_per_store):
+            price = round(rng.uniform(30, 900), 2)
+            prices[(store_id, str(i))] = price
+            rows.append((str(i), f'Товар {store_id} {i}', 'Категория', price, price, price))
+        conn.executemany(
+            'INSERT INTO products (product_id, name, category, current_price, min_price, max_price) '
+            'VALUES (?, ?, ?, ?, ?, ?)', rows)
+        conn.commit()
+        conn.close()
+        store_paths[store_id] = path
+
+    users_path = os.path.join(tmp, 'users.db')
+    conn = sqlite3.connect(users_path)
+    conn.executescript(USERS_SCHEMA)
+    user_count = max(1, alert_count // 20)
+    conn.executemany('INSERT INTO users (username, telegram_chat_id) VALUES (?, ?)',
+                     [(f'user{i}', str(100000 + i)) for i in range(user_count)])
+
+    recent = datetime.now() - timedelta(minutes=20)
+    old = datetime.now() - timedelta(days=2)
+    alerts = set()
+    rows = []
+    while len(rows) < alert_count:
+        user_id = rng.randint(1, user_count)
+        store_id = rng.choice(['5ka', 'magnit'])
+        # Часть подписок - на товары, которых уже нет в базе
+        product_id = str(rng.randrange(int(products_per_store * 1.02)))
+        if (user_id, store_id, product_id) in alerts:
+            continue
+        alerts.add((user_id, store_id, product_id))
+        price = prices.get((store_id, product_id), 100.0)
+        roll = rng.random()
+        last_price = None if roll < 0.1 else round(price * rng.choice([0.9, 1.0, 1.005, 1.1, 1.3]), 2)
+        rows.append((user_id, store_id, product_id,
+                     round(price * rng.uniform(0.8, 1.2), 2), int(rng.random() < 0.6),
+                     rng.choice([None, old, recent]), last_price))
+    conn.executemany(
+        'INSERT INTO price_alerts (user_id, store_id, product_id, target_price, notify_any_decrease, '
+        'last_notified_at, last_price) VALUES (?, ?, ?, ?, ?, ?, ?)', rows)
+    conn.commit()
+    conn.close()
+    return store_paths, users_path
+
+
+def final_prices(users_path):
+    conn = sqlite3.connect(users_path)
+    rows = conn.execute('SELECT id, last_price FROM price_alerts ORDER BY id').fetchall()
+    conn.close()
+    return rows
+
+
+def main():
+    """Точка входа"""
+    parser = argparse.ArgumentParser(description='Пакетная проверка подписок против проверки по одной')
+    parser.add_argument('--alerts', type=int, default=20000, help='Активных подписок')
+    parser.add_argument('--products', type=int, default=20000, help='Товаров в каждом магазине')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp, open(os.devnull, 'w') as devnull:
+        # Отчёт миграций и строки [SKIP]/[INIT] не нужны
+        with redirect_stdout(devnull):
+            store_paths, users_path = generate(tmp, args.alerts, args.products)
+        notification_service.STORE_DATABASES = store_paths
+
+        results = {}
+        for label, run in (('legacy', run_legacy), ('batched', run_batched)):
+            path = os.path.join(tmp, f'users_{label}.db')
+            shutil.copy(users_path, path)
+            notification_service.USERS_DB = path
+            alerts = get_active_alerts()
+
+            with redirect_stdout(devnull):
+                started = time.perf_counter()
+                notified = run(alerts)
+                elapsed = time.perf_counter() - started
+            results[label] = (notified, elapsed, final_prices(path))
+
+    legacy_notified, legacy_time, legacy_prices = results['legacy']
+    batched_notified, batched_time, batched_prices = results['batched']
+
+    print("=" * 60)
+    print(f"  ПРОВЕРКА ПОДПИСОК: {args.alerts} активных")
+    print("=" * 60)
+    print(f"по одной: {legacy_time:.2f} с  (уведомлений {len(legacy_notified)})")
+    print(f"пакетно:  {batched_time:.2f} с  (уведомлений {len(batched_notified)})")
+    print(f"ускорение: x{legacy_time / batched_time:.1f}")
+
+    mismatches = 0
+    if sorted(legacy_notified) != sorted(batched_notified):
+        mismatches += 1
+        print("[!] Уведомления различаются")
+    if legacy_prices != batched_prices:
+        mismatches += 1
+        print("[!] Цены подписок после проверки различаются")
+    if mismatches:
+        sys.exit(1)
+    print("Уведомления и цены подписок совпадают")
+
+
+if __name__ == '__main__':
+    main()
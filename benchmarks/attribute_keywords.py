@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+"""
+Автомат Ахо-Корасик против перебора словарей в parse_product_attributes
+
+Прогоняет названия товаров из баз магазинов через прежние циклы
+"for keyword in ...: if keyword in name_lower" и через
+product_attributes.KEYWORD_AUTOMATON, проверяет совпадение бренда
+и типа продукта и сравнивает время.
+
+Запуск:
+    python -m benchmarks.attribute_keywords
+    python -m benchmarks.attribute_keywords --repeat 5
+"""
+
+import argparse
+import sys
+import time
+
+from product_attributes import KEYWORD_AUTOMATON, PRODUCT_TYPES, RUSSIAN_BRANDS
+from matching import connect_store
+from store_db import STORE_DATABASES
+
+
+def keywords_by_loops(name_lower: str):
+    """Прежняя реализация: бренд и тип перебором словарей"""
+    brand = None
+    for candidate in RUSSIAN_BRANDS:
+        if candidate in name_lower:
+            brand = candidate
+            break
+
+    product_type = None
+    for candidate, keywords in PRODUCT_TYPES.items():
+        for keyword in keywords:
+            if keyword in name_lower:
+                product_type = candidate
+                break
+        if product_type:
+            break
+
+    return brand, product_type
+
+
+def keywords_by_automaton(name_lower: str):
+    """Один проход автомата"""
+    found = KEYWORD_AUTOMATON.first_matches(name_lower)
+    return found.get('brand'), found.get('type')
+
+
+def main():
+    """Точка входа"""
+    parser = argparse.ArgumentParser(description='Ахо-Корасик против перебора словарей')
+    parser.add_argument('--repeat', type=int, default=3, help='Повторов замера')
+    args = parser.parse_args()
+
+    names = []
+    for store_id in STORE_DATABASES:
+        conn = connect_store(store_id)
+        if conn:
+            names += [row[0].lower() for row in conn.execute('SELECT name FROM products').fetchall()]
+            conn.close()
+    if not names:
+        print("[!] Нет товаров в базах")
+        sys.exit(1)
+
+    mismatches = [
+        (name, expected, found)
+        for name in names
+        for expected, found in [(keywords_by_loops(name), keywords_by_automaton(name))]
+        if expected != found
+    ]
+
+    timings = {}
+    for label, function in (('циклы', keywords_by_loops), ('автомат', keywords_by_automaton)):
+        best = None
+        for _ in range(args.repeat):
+            started = time.perf_counter()
+            for name in names:
+                function(name)
+            elapsed = time.perf_counter() - started
+            best = elapsed if best is None else min(best, elapsed)
+        timings[label] = best
+
+    patterns = len(RUSSIAN_BRANDS) + sum(len(keywords) for keywords in PRODUCT_TYPES.values())
+    print("=" * 60)
+    print(f"  КЛЮЧЕВЫЕ СЛОВА: {len(names)} названий, {patterns} шаблонов")
+    print("=" * 60)
+    for label, elapsed in timings.items():
+        print(f"{label:>8}: {elapsed / len(names) * 1e6:.2f} мкс на название")
+    print(f"Ускорение: x{timings['циклы'] / timings['автомат']:.1f}")
+    print(f"Расхождений: {len(mismatches)}")
+    for name, expected, found in mismatches[:10]:
+        print(f"  {name[:40]}: {expected} != {found}")
+
+    if mismatches:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
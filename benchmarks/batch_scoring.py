@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+"""
+Векторный скоринг (batch_scoring.py) против скалярного
+
+Для случайной выборки товаров считает оценки похожести со всем
+каталогом другого магазина обоими способами, проверяет, что целые
+баллы совпадают, и сравнивает время.
+
+Запуск:
+    python -m benchmarks.batch_scoring
+    python -m benchmarks.batch_scoring --source magnit --sample 200
+"""
+
+import argparse
+import random
+import sys
+import time
+
+from batch_scoring import CatalogArrays, numpy_available
+from matching import calculate_similarity_score, connect_store, load_catalog, other_store
+
+
+def main():
+    """Точка входа"""
+    parser = argparse.ArgumentParser(description='Векторный скоринг против скалярного')
+    parser.add_argument('--source', choices=['5ka', 'magnit'], default='5ka',
+                        help='Магазин исходных товаров')
+    parser.add_argument('--sample', type=int, default=100, help='Размер выборки')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    if not numpy_available():
+        print("[!] NumPy не установлен: pip install numpy")
+        sys.exit(1)
+
+    target = other_store(args.source)
+    source_conn = connect_store(args.source)
+    target_conn = connect_store(target)
+    if not source_conn or not target_conn:
+        print("[!] Нет базы магазина")
+        sys.exit(1)
+
+    sources = load_catalog(source_conn)
+    catalog = load_catalog(target_conn)
+    source_conn.close()
+    target_conn.close()
+
+    random.seed(args.seed)
+    sample = random.sample(sources, min(args.sample, len(sources)))
+    positions = list(range(len(catalog)))
+
+    started = time.time()
+    arrays = CatalogArrays(catalog)
+    build_time = time.time() - started
+
+    scalar_time = vector_time = 0.0
+    mismatches = []
+    for source in sample:
+        name = source.product['name']
+
+        started = time.time()
+        expected = [
+            calculate_similarity_score(
+                source.attrs, item.attrs, name, item.product['name'],
+                name1_normalized=source.name_normalized,
+                name2_normalized=item.name_normalized,
+                words2=item.words
+            )
+            for item in catalog
+        ]
+        scalar_time += time.time() - started
+
+        started = time.time()
+        scores = arrays.scores(positions, source.attrs, source.name_normalized).tolist()
+        vector_time += time.time() - started
+
+        for item, score, reference in zip(catalog, scores, expected):
+            if score != reference:
+                mismatches.append((name, item.product['name'], reference, score))
+
+    pairs = len(sample) * len(catalog)
+    print("=" * 60)
+    print(f"  ВЕКТОРНЫЙ СКОРИНГ: {args.source} -> {target}")
+    print("=" * 60)
+    print(f"Пар товаров: {pairs} ({len(sample)} x {len(catalog)})")
+    print(f"Построение массивов: {build_time * 1000:.0f} мс")
+    print(f"Скалярный: {scalar_time / len(sample) * 1000:.1f} мс на товар "
+          f"({pairs / scalar_time:,.0f} пар/сек)")
+    print(f"Векторный: {vector_time / len(sample) * 1000:.2f} мс на товар "
+          f"({pairs / vector_time:,.0f} пар/сек)")
+    print(f"Ускорение: x{scalar_time / vector_time:.0f}")
+    print(f"Расхождений: {len(mismatches)}")
+
+    for name1, name2, reference, score in mismatches[:10]:
+        print(f"  {name1[:30]} / {name2[:30]}: {reference} != {score}")
+
+    if mismatches:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+"""
+Полнота блокирующего индекса против полного перебора
+
+Для случайной выборки товаров сравнивает результаты поиска похожих
+(similarity_score > 20) по всему каталогу и по кандидатам из блоков.
+
+Запуск:
+    python -m benchmarks.blocking_recall
+    python -m benchmarks.blocking_recall --source magnit --sample 1000
+"""
+
+import argparse
+import random
+import sys
+import time
+
+from blocking import BlockingIndex
+from matching import (
+    MATCHES_TOP_N, connect_store, load_catalog, other_store,
+    find_similar_products, find_similar_in_index
+)
+
+
+def main():
+    """Точка входа"""
+    parser = argparse.ArgumentParser(description='Полнота блокирующего индекса')
+    parser.add_argument('--source', choices=['5ka', 'magnit'], default='5ka',
+                        help='Магазин исходных товаров')
+    parser.add_argument('--target', choices=['5ka', 'magnit'],
+                        help='Магазин кандидатов (по умолчанию - другой)')
+    parser.add_argument('--sample', type=int, default=500, help='Размер выборки')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    target = args.target or other_store(args.source)
+    source_conn = connect_store(args.source)
+    target_conn = connect_store(target)
+    if not source_conn or not target_conn:
+        print("[!] Нет базы магазина")
+        sys.exit(1)
+
+    sources = load_catalog(source_conn)
+    catalog = load_catalog(target_conn)
+    source_conn.close()
+    target_conn.close()
+
+    started = time.time()
+    index = BlockingIndex(catalog)
+    build_time = time.time() - started
+
+    random.seed(args.seed)
+    sample = random.sample(sources, min(args.sample, len(sources)))
+
+    expected_total = found_total = 0
+    top_identical = 0
+    candidates_total = 0
+    brute_time = block_time = 0.0
+    missed = []
+
+    for source in sample:
+        product = source.product
+        params = (product['name'], product['product_id'], product.get('current_price', 0) or 0)
+
+        started = time.time()
+        expected = find_similar_products(catalog, *params, source_attrs=source.attrs,
+                                         limit=len(catalog))
+        brute_time += time.time() - started
+
+        started = time.time()
+        found = find_similar_in_index(index, *params, source_attrs=source.attrs,
+                                      limit=len(catalog))
+        block_time += time.time() - started
+
+        candidates_total += len(index.candidates(source.name_normalized, source.attrs))
+
+        expected_ids = {item['product_id'] for item in expected}
+        found_ids = {item['product_id'] for item in found}
+        expected_total += len(expected_ids)
+        found_total += len(expected_ids & found_ids)
+
+        top = lambda items: [(i['product_id'], i['similarity_score']) for i in items[:MATCHES_TOP_N]]
+        if top(expected) == top(found):
+            top_identical += 1
+
+        for item in expected:
+            if item['product_id'] not in found_ids and len(missed) < 10:
+                missed.append((product['name'], item['name'], item['similarity_score']))
+
+    sizes = sorted(index.block_sizes().values())
+    recall = found_total / expected_total if expected_total else 1.0
+
+    print("=" * 60)
+    print(f"  БЛОКИРУЮЩИЙ ИНДЕКС: {args.source} -> {target}")
+    print("=" * 60)
+    print(f"Каталог: {len(catalog)} товаров, блоков: {len(sizes)}, "
+          f"построение {build_time * 1000:.0f} мс")
+    if sizes:
+        print(f"Размер блока: медиана {sizes[len(sizes) // 2]}, максимум {sizes[-1]}")
+    print(f"Выборка: {len(sample)} товаров")
+    print(f"Кандидатов в среднем: {candidates_total / len(sample):.0f} из {len(catalog)}")
+    print(f"Полнота (score > 20): {recall:.4f} ({found_total}/{expected_total})")
+    print(f"Top-{MATCHES_TOP_N} совпадает: {top_identical}/{len(sample)}")
+    print(f"Полный перебор: {brute_time / len(sample) * 1000:.1f} мс/товар")
+    print(f"Блоки:          {block_time / len(sample) * 1000:.1f} мс/товар")
+
+    if missed:
+        print("\nПропущено (пример):")
+        for source_name, name, score in missed:
+            print(f"  [{score}] {source_name[:35]} -> {name[:35]}")
+
+
+if __name__ == '__main__':
+    main()
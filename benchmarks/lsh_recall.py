@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+"""
+MinHash/LSH против полного перебора
+
+Для случайной выборки товаров сравнивает поиск аналогов в другом
+магазине по всему каталогу и по кандидатам из LSH-индекса
+с разными параметрами bands x rows.
+
+Запуск:
+    python -m benchmarks.lsh_recall
+    python -m benchmarks.lsh_recall --params 16x2,32x2,32x3 --sample 1000
+"""
+
+import argparse
+import random
+import sys
+import time
+
+from lsh import LSH_BANDS, LSH_ROWS, LSH_SHINGLE_SIZE, MinHashLSH
+from matching import (
+    connect_store, load_catalog, other_store,
+    find_similar_products, find_similar_in_index
+)
+
+
+def parse_params(value: str):
+    """'16x2,32x3' -> [(16, 2), (32, 3)]"""
+    params = []
+    for part in value.split(','):
+        bands, rows = part.lower().split('x')
+        params.append((int(bands), int(rows)))
+    return params
+
+
+def main():
+    """Точка входа"""
+    parser = argparse.ArgumentParser(description='Полнота и скорость MinHash/LSH')
+    parser.add_argument('--source', choices=['5ka', 'magnit'], default='5ka',
+                        help='Магазин исходных товаров')
+    parser.add_argument('--params', default=f'8x2,16x2,{LSH_BANDS}x{LSH_ROWS},32x3,20x4',
+                        help='Список bands x rows через запятую')
+    parser.add_argument('--shingle-size', type=int, default=LSH_SHINGLE_SIZE)
+    parser.add_argument('--sample', type=int, default=300, help='Размер выборки')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    target = other_store(args.source)
+    source_conn = connect_store(args.source)
+    target_conn = connect_store(target)
+    if not source_conn or not target_conn:
+        print("[!] Нет базы магазина")
+        sys.exit(1)
+
+    sources = load_catalog(source_conn)
+    catalog = load_catalog(target_conn)
+    source_conn.close()
+    target_conn.close()
+
+    random.seed(args.seed)
+    sample = random.sample(sources, min(args.sample, len(sources)))
+
+    # Эталон: полный перебор каталога
+    expected = {}
+    started = time.time()
+    for source in sample:
+        product = source.product
+        expected[product['product_id']] = find_similar_products(
+            catalog, product['name'], product['product_id'],
+            product.get('current_price', 0) or 0,
+            source_attrs=source.attrs, limit=len(catalog)
+        )
+    brute_time = time.time() - started
+
+    print("=" * 72)
+    print(f"  MinHash/LSH: {args.source} -> {target}, каталог {len(catalog)}, "
+          f"выборка {len(sample)}")
+    print("=" * 72)
+    print(f"Полный перебор: {brute_time / len(sample) * 1000:.1f} мс/товар")
+    print()
+    print(f"{'bands x rows':>12} {'построение':>10} {'кандидатов':>10} "
+          f"{'точные':>8} {'top-1':>8} {'score>20':>9} {'мс/товар':>9}")
+
+    for bands, rows in parse_params(args.params):
+        started = time.time()
+        index = MinHashLSH(catalog, bands=bands, rows=rows, shingle_size=args.shingle_size)
+        build_time = time.time() - started
+
+        candidates_total = 0
+        exact_total = exact_found = 0
+        top_total = top_found = 0
+        all_total = all_found = 0
+        started = time.time()
+        for source in sample:
+            product = source.product
+            found = find_similar_in_index(
+                index, product['name'], product['product_id'],
+                product.get('current_price', 0) or 0,
+                source_attrs=source.attrs, limit=len(catalog)
+            )
+            found_ids = {item['product_id'] for item in found}
+            reference = expected[product['product_id']]
+
+            exact = [item for item in reference if item['is_exact_match']]
+            exact_total += len(exact)
+            exact_found += sum(item['product_id'] in found_ids for item in exact)
+
+            all_total += len(reference)
+            all_found += sum(item['product_id'] in found_ids for item in reference)
+
+            if reference:
+                top_total += 1
+                top_found += bool(found) and found[0]['product_id'] == reference[0]['product_id']
+        query_time = time.time() - started
+
+        for source in sample:
+            candidates_total += len(index.candidates(source.name_normalized, source.attrs,
+                                                     source.words))
+
+        ratio = lambda found, total: found / total if total else 1.0
+        print(f"{f'{bands} x {rows}':>12} {build_time * 1000:>8.0f}мс "
+              f"{candidates_total / len(sample):>10.0f} "
+              f"{ratio(exact_found, exact_total):>8.3f} {ratio(top_found, top_total):>8.3f} "
+              f"{ratio(all_found, all_total):>9.3f} {query_time / len(sample) * 1000:>9.1f}")
+
+
+if __name__ == '__main__':
+    main()
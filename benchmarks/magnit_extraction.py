@@ -0,0 +1,293 @@
+# -*- coding: utf-8 -*-
+"""
+Извлечение карточек Магнита одним execute_script против find_element
+
+Открывает сохранённую страницу категории в headless Chrome и
+извлекает товары тремя способами:
+    - разбором каждой карточки через find_element (один запрос к
+      WebDriver на поле) - для сравнения времени;
+    - прежним скриптом scrape_category (LEGACY_EXTRACT_JS) - эталон полей;
+    - MagnitScraper.extract_products (один запрос на страницу).
+Сравнивает время и поля прежнего скрипта с extract_products
+(скидка и отзывы - новые поля, их прежний скрипт не извлекал).
+
+Без --html страница генерируется по разметке карточек magnit.ru
+(N карточек, часть без скидки, рейтинга, с нечисловой ценой, ценой
+за кг или узким неразрывным пробелом между разрядами).
+Сохранённая из браузера страница категории: --html path/to/page.html
+
+Запуск:
+    python -m benchmarks.magnit_extraction
+    python -m benchmarks.magnit_extraction --cards 1000
+    python -m benchmarks.magnit_extraction --html magnit_category.html
+
+Нужны selenium, webdriver-manager и Chrome.
+"""
+
+import argparse
+import os
+import random
+import re
+import sys
+import tempfile
+import time
+from typing import Dict
+
+from selenium.webdriver.common.by import By
+
+from scraper_magnit import PRODUCT_CARD_SELECTOR, MagnitScraper
+from scraper_snapshots import start_headless_driver
+
+WORDS = ['Молоко', 'Кефир', 'Сыр', 'Хлеб', 'Сок', 'Вода', 'Гречка', 'Рис', 'Яблоки', 'Печенье']
+
+CARD_TEMPLATE = '''
+<article data-test-id="v-product-preview" class="unit-catalog-product-preview">
+  <a href="/product/{id}-{slug}?shopCode=992301"{title}>
+    <img src="https://magnit.ru/img/{id}.jpg" alt="">
+    {badge}
+    <div class="unit-catalog-product-preview-prices">
+      <span class="unit-catalog-product-preview-prices__regular">{price}&nbsp;₽{unit}</span>
+      {sale}
+    </div>
+    <div class="unit-catalog-product-preview-title">{name}</div>
+    {rating}
+  </a>
+</article>
+'''
+
+
+# Прежний скрипт scrape_category (эталон полей и разбора цен)
+LEGACY_EXTRACT_JS = '''
+    var products = [];
+    var articles = document.querySelectorAll('article[data-test-id="v-product-preview"]');
+
+    articles.forEach(function(article) {
+        try {
+            var product = {};
+
+            // Ссылка и ID
+            var link = article.querySelector('a[href*="/product/"]');
+            if (link) {
+                product.url = link.href || '';
+                product.name = link.title || '';
+                var match = product.url.match(/\\/product\\/(\\d+)/);
+                if (match) product.id = match[1];
+            }
+
+            // Название (альт)
+            if (!product.name) {
+                var titleEl = article.querySelector('.unit-catalog-product-preview-title');
+                if (titleEl) product.name = titleEl.textContent.trim();
+            }
+
+            // Цена
+            var priceEl = article.querySelector('.unit-catalog-product-preview-prices__regular');
+            if (priceEl) {
+                var priceText = priceEl.textContent.replace('₽', '').replace(/\\s/g, '').replace(',', '.');
+                product.price = parseFloat(priceText) || 0;
+            }
+
+            // Старая цена
+            var oldPriceEl = article.querySelector('.unit-catalog-product-preview-prices__sale');
+            if (oldPriceEl) {
+                var oldPriceText = oldPriceEl.textContent.replace('₽', '').replace(/\\s/g, '').replace(',', '.');
+                product.old_price = parseFloat(oldPriceText) || product.price || 0;
+            } else {
+                product.old_price = product.price || 0;
+            }
+
+            // Рейтинг
+            var ratingEl = article.querySelector('.unit-catalog-product-preview-rating-score');
+            if (ratingEl) product.rating = parseFloat(ratingEl.textContent) || 0;
+
+            // Изображение
+            var img = article.querySelector('img');
+            if (img) product.image_url = img.src || '';
+
+            if (product.id && product.name) {
+                products.push(product);
+            }
+        } catch(e) {}
+    });
+
+    return products;
+'''
+
+
+def parse_product_legacy(article, category_name: str) -> Dict:
+    """Разбор карточки через find_element на каждое поле (для сравнения времени)"""
+    product = {
+        "id": "",
+        "name": "",
+        "price": 0,
+        "old_price": 0,
+        "discount": "",
+        "rating": 0,
+        "reviews": 0,
+        "category": category_name,
+        "url": "",
+        "image_url": ""
+    }
+
+    try:
+        # Ссылка и название
+        try:
+            link = article.find_element(By.CSS_SELECTOR, 'a[href*="/product/"]')
+            href = link.get_attribute("href") or ""
+            product["url"] = href
+            product["name"] = link.get_attribute("title") or ""
+
+            match = re.search(r'/product/(\d+)', href)
+            if match:
+                product["id"] = match.group(1)
+        except:
+            pass
+
+        if not product["name"]:
+            try:
+                title_el = article.find_element(By.CSS_SELECTOR, '.unit-catalog-product-preview-title')
+                product["name"] = title_el.text.strip()
+            except:
+                pass
+
+        # Цена
+        try:
+            price_el = article.find_element(By.CSS_SELECTOR, '.unit-catalog-product-preview-prices__regular')
+            price_text = price_el.text.replace('₽', '').replace(' ', '').replace(',', '.').strip()
+            product["price"] = float(price_text)
+        except:
+            pass
+
+        # Старая цена
+        try:
+            old_price_el = article.find_element(By.CSS_SELECTOR, '.unit-catalog-product-preview-prices__sale')
+            old_price_text = old_price_el.text.replace('₽', '').replace(' ', '').replace(',', '.').strip()
+            product["old_price"] = float(old_price_text)
+        except:
+            product["old_price"] = product["price"]
+
+        # Скидка
+        try:
+            discount_el = article.find_element(By.CSS_SELECTOR, '[data-test-id="v-catalog-badge"]')
+            product["discount"] = discount_el.text.strip()
+        except:
+            pass
+
+        # Рейтинг
+        try:
+            rating_el = article.find_element(By.CSS_SELECTOR, '.unit-catalog-product-preview-rating-score')
+            product["rating"] = float(rating_el.text.strip())
+        except:
+            pass
+
+        # Отзывы
+        try:
+            reviews_el = article.find_element(By.CSS_SELECTOR, '.unit-catalog-product-preview-rating-comments')
+            match = re.search(r'(\d+)', reviews_el.text)
+            if match:
+                product["reviews"] = int(match.group(1))
+        except:
+            pass
+
+        # Изображение
+        try:
+            img = article.find_element(By.CSS_SELECTOR, 'img')
+            product["image_url"] = img.get_attribute("src") or ""
+        except:
+            pass
+
+    except:
+        pass
+
+    return product
+
+
+def generate_page(cards: int, seed: int = 1) -> str:
+    """Страница категории с карточками в разметке magnit.ru"""
+    rng = random.Random(seed)
+    items = []
+    for i in range(cards):
+        price = rng.uniform(30, 3000)
+        roll = rng.random()
+        # Разряды - пробелом, неразрывным или узким неразрывным
+        separator = rng.choice([' ', '&nbsp;', '\u202f'])
+        price_text = f"{int(price):,}".replace(',', separator) + f",{rng.randint(0, 99):02d}"
+        unit = '/кг' if roll > 0.9 else ''
+        items.append(CARD_TEMPLATE.format(
+            id=100000 + i,
+            slug=f'tovar-{i}',
+            title=f' title="{rng.choice(WORDS)} {i}"' if roll < 0.5 else '',
+            name=f"{rng.choice(WORDS)} {rng.choice(WORDS).lower()} {rng.randint(1, 999)} г",
+            price=price_text if roll > 0.05 else 'Нет в наличии',
+            unit=unit,
+            badge=f'<div data-test-id="v-catalog-badge">-{rng.randint(5, 50)}%</div>' if roll < 0.3 else '',
+            sale=(f'<span class="unit-catalog-product-preview-prices__sale">{int(price * 1.2)}&nbsp;₽</span>'
+                  if roll < 0.3 else ''),
+            rating=(f'<div class="unit-catalog-product-preview-rating">'
+                    f'<span class="unit-catalog-product-preview-rating-score">{rng.uniform(3, 5):.1f}</span>'
+                    f'<span class="unit-catalog-product-preview-rating-comments">{rng.randint(1, 900)} отзывов</span>'
+                    f'</div>' if roll < 0.7 else ''),
+        ))
+    return ('<!DOCTYPE html><html><head><meta charset="utf-8"></head><body><main>'
+            + ''.join(items) + '</main></body></html>')
+
+
+def main():
+    """Точка входа"""
+    parser = argparse.ArgumentParser(description='Извлечение карточек Магнита: execute_script против find_element')
+    parser.add_argument('--html', help='Сохранённая страница категории (по умолчанию - сгенерированная)')
+    parser.add_argument('--cards', type=int, default=1000, help='Карточек в сгенерированной странице')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = args.html
+        if not path:
+            path = os.path.join(tmp, 'magnit_category.html')
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(generate_page(args.cards))
+
+        scraper = MagnitScraper(headless=True)
+        scraper.driver = start_headless_driver()
+        try:
+            scraper.driver.get('file://' + os.path.abspath(path))
+
+            started = time.perf_counter()
+            articles = scraper.driver.find_elements(By.CSS_SELECTOR, PRODUCT_CARD_SELECTOR)
+            per_card = [parse_product_legacy(article, 'Тест') for article in articles]
+            per_card_time = time.perf_counter() - started
+
+            started = time.perf_counter()
+            legacy = scraper.driver.execute_script(LEGACY_EXTRACT_JS)
+            legacy_time = time.perf_counter() - started
+
+            started = time.perf_counter()
+            batched = scraper.extract_products('Тест')
+            batched_time = time.perf_counter() - started
+        finally:
+            scraper.stop()
+
+    print("=" * 60)
+    print(f"  ИЗВЛЕЧЕНИЕ КАРТОЧЕК МАГНИТА: {len(articles)} на странице")
+    print("=" * 60)
+    print(f"find_element:     {per_card_time:.2f} с  ({len(per_card)} карточек)")
+    print(f"прежний скрипт:   {legacy_time:.2f} с  ({len(legacy)} товаров)")
+    print(f"extract_products: {batched_time:.2f} с  ({len(batched)} товаров)")
+    print(f"ускорение против find_element: x{per_card_time / max(batched_time, 1e-9):.0f}")
+
+    mismatches = 0
+    for old, new in zip(legacy, batched):
+        # Поля прежнего скрипта (без цены, если её не было в карточке)
+        differ = sorted(key for key in old if old[key] != new.get(key))
+        if differ:
+            mismatches += 1
+            if mismatches <= 5:
+                print(f"[!] {old['id']}: {differ}")
+    mismatches += abs(len(legacy) - len(batched))
+    if mismatches:
+        print(f"[!] Различаются товаров: {mismatches}")
+        sys.exit(1)
+    print("Поля совпадают с прежним скриптом")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,211 @@
+# -*- coding: utf-8 -*-
+"""
+Сводки уведомлений (NOTIFICATION_DIGEST) в день акции
+
+Базы - как в benchmarks.alert_evaluation (около 20 подписок на
+пользователя) плюс несколько пользователей с сотнями подписок.
+Большая доля цен снижается (акция), подписки проверяются полной
+проверкой и уведомления ставятся в очередь двумя способами:
+    - по сообщению на товар;
+    - сводкой на чат (страницы до TELEGRAM_MESSAGE_LIMIT символов).
+Сравнивает число сообщений в очереди (= запросов к Bot API) и
+проверяет: длина страниц, лимит MAX_DAILY_NOTIFICATIONS на чат в день,
+каждое снижение цены - ровно в одном сообщении (сверх лимита - на
+следующий день).
+
+Затем очередь без сводок разбирается обработчиком (claim_due/mark_sent,
+как drain_outbox, без Telegram) сегодня и "на следующий день" (время
+отправки в очереди сдвигается на сутки): отложенные по лимиту
+снижения уходят на следующий день.
+
+Запуск:
+    python -m benchmarks.notification_digest
+    python -m benchmarks.notification_digest --alerts 50000 --promo 0.6
+"""
+
+import argparse
+import os
+import random
+import re
+import sqlite3
+import sys
+import tempfile
+from collections import Counter
+from contextlib import redirect_stdout
+from datetime import date, timedelta
+
+import notification_service
+from benchmarks.alert_evaluation import generate, run_batched
+from notification_outbox import claim_due, mark_sent
+from notification_service import (TELEGRAM_MESSAGE_LIMIT, enqueue_notifications,
+                                  get_active_alerts)
+from product_storage import open_store_db, upsert_products
+
+try:
+    from config import MAX_DAILY_NOTIFICATIONS
+except ImportError:
+    MAX_DAILY_NOTIFICATIONS = 50
+
+# Пользователи с большим числом подписок: (user_id, подписок)
+HEAVY_USERS = [(1, 200), (2, 500)]
+
+
+def add_heavy_users(users_path, products_per_store, seed=3):
+    """Подписки пользователей, следящих за сотнями товаров"""
+    rng = random.Random(seed)
+    conn = sqlite3.connect(users_path)
+    for user_id, count in HEAVY_USERS:
+        product_ids = rng.sample(range(products_per_store), count)
+        conn.executemany(
+            'INSERT OR IGNORE INTO price_alerts (user_id, store_id, product_id, notify_any_decrease) '
+            'VALUES (?, ?, ?, 1)',
+            [(user_id, '5ka', str(product_id)) for product_id in product_ids])
+    conn.commit()
+    conn.close()
+
+
+def promo(store_paths, share, seed=4):
+    """Акция: у доли товаров цена снижается на 10-40%"""
+    rng = random.Random(seed)
+    for path in store_paths.values():
+        conn = open_store_db(path)
+        rows = conn.execute('SELECT product_id, name, category, current_price FROM products').fetchall()
+        products = [
+            {'id': product_id, 'name': name, 'category': category,
+             'price': round(price * rng.uniform(0.6, 0.9), 2), 'old_price': price}
+            for product_id, name, category, price in rng.sample(rows, int(len(rows) * share))
+        ]
+        upsert_products(conn, products, '2026-01-01T12:00:00')
+        conn.close()
+
+
+def run(users_path, copy_path, digest):
+    """Полная проверка с постановкой в очередь на копии базы пользователей"""
+    with sqlite3.connect(users_path) as src, sqlite3.connect(copy_path) as dst:
+        src.backup(dst)
+    notification_service.USERS_DB = copy_path
+    notification_service.NOTIFICATION_DIGEST = digest
+    enqueue_notifications(get_active_alerts())
+
+    conn = sqlite3.connect(copy_path)
+    messages = conn.execute(
+        'SELECT chat_id, payload, substr(next_attempt_at, 1, 10) FROM notification_outbox'
+    ).fetchall()
+    conn.close()
+    return messages
+
+
+def deliver_due(path):
+    """Обработчик очереди без Telegram: всё, чему пора, отмечается отправленным"""
+    conn = sqlite3.connect(path)
+    conn.row_factory = sqlite3.Row
+    delivered = []
+    while True:
+        entries = claim_due(conn)
+        if not entries:
+            break
+        for entry in entries:
+            mark_sent(conn, entry['id'])
+        delivered.extend((entry['chat_id'], entry['payload']) for entry in entries)
+    conn.close()
+    return delivered
+
+
+def next_day(path):
+    """Прошли сутки: время отправки записей очереди сдвигается назад"""
+    conn = sqlite3.connect(path)
+    conn.execute("UPDATE notification_outbox SET next_attempt_at = datetime(next_attempt_at, '-1 day') "
+                 "WHERE state = 'pending'")
+    conn.commit()
+    conn.close()
+
+
+def main():
+    """Точка входа"""
+    parser = argparse.ArgumentParser(description='Сводки уведомлений в день акции')
+    parser.add_argument('--alerts', type=int, default=20000, help='Активных подписок')
+    parser.add_argument('--products', type=int, default=20000, help='Товаров в каждом магазине')
+    parser.add_argument('--promo', type=float, default=0.5, help='Доля товаров со сниженной ценой')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp, open(os.devnull, 'w') as devnull:
+        with redirect_stdout(devnull):
+            store_paths, users_path = generate(tmp, args.alerts, args.products)
+            add_heavy_users(users_path, args.products)
+            notification_service.STORE_DATABASES = store_paths
+            notification_service.USERS_DB = users_path
+            # Установившееся состояние: last_price у всех подписок, без недавних уведомлений
+            run_batched(get_active_alerts())
+            conn = sqlite3.connect(users_path)
+            conn.execute('UPDATE price_alerts SET last_notified_at = NULL')
+            conn.commit()
+            conn.close()
+            promo(store_paths, args.promo)
+            notifications, _ = notification_service.evaluate_alerts(get_active_alerts())
+
+            single_path = os.path.join(tmp, 'users_single.db')
+            single = run(users_path, single_path, digest=False)
+            digest = run(users_path, os.path.join(tmp, 'users_digest.db'), digest=True)
+            
+            # Очередь без сводок: сегодня, затем на следующий день
+            sent_today = deliver_due(single_path)
+            next_day(single_path)
+            sent_next_day = deliver_due(single_path)
+
+    # Товар в сообщении узнаётся по ссылке /store/<магазин>/product/<id>
+    link_re = re.compile(r'/store/([^/]+)/product/([^\'"]+)')
+    expected = Counter((item['telegram_chat_id'], item['store_id'], item['product_id'])
+                       for item in notifications)
+
+    def covered(messages):
+        return Counter((chat_id, *link) for chat_id, payload, *_ in messages
+                       for link in link_re.findall(payload))
+
+    today = date.today().isoformat()
+    tomorrow = (date.today() + timedelta(days=1)).isoformat()
+    single_items = covered(single)
+    digest_items = covered(digest)
+    busiest = max(max(Counter((chat_id, day) for chat_id, _, day in messages).values(), default=0)
+                  for messages in (single, digest))
+    longest = max((len(payload) for _, payload, _ in digest), default=0)
+    deferred = {mode: sum(1 for *_, day in messages if day > today)
+                for mode, messages in (('single', single), ('digest', digest))}
+    expected_today = Counter((chat_id, payload) for chat_id, payload, day in single if day <= today)
+    expected_next_day = Counter((chat_id, payload) for chat_id, payload, day in single if day == tomorrow)
+
+    print("=" * 60)
+    print(f"  СВОДКИ УВЕДОМЛЕНИЙ: {len(notifications)} снижений цен, "
+          f"{len({chat_id for chat_id, *_ in expected})} чатов")
+    print("=" * 60)
+    print(f"по сообщению на товар: {len(single):6} сообщений ({sum(single_items.values())} товаров)")
+    print(f"сводкой:               {len(digest):6} сообщений ({sum(digest_items.values())} товаров)")
+    print(f"запросов к Bot API меньше в {len(single) / max(len(digest), 1):.1f} раза")
+    print(f"самая длинная страница: {longest} символов, больше всего сообщений в чат за день: "
+          f"{busiest}")
+    print(f"отложено по лимиту на следующие дни: сводкой {deferred['digest']} сообщений, "
+          f"по сообщению на товар {deferred['single']}")
+    print(f"очередь без сводок: отправлено сегодня {len(sent_today)}, "
+          f"на следующий день {len(sent_next_day)}")
+
+    mismatches = 0
+    if longest > TELEGRAM_MESSAGE_LIMIT:
+        mismatches += 1
+        print(f"[!] Страница длиннее {TELEGRAM_MESSAGE_LIMIT} символов")
+    if busiest > MAX_DAILY_NOTIFICATIONS:
+        mismatches += 1
+        print(f"[!] Больше {MAX_DAILY_NOTIFICATIONS} сообщений в чат за день")
+    if digest_items != expected or single_items != expected:
+        mismatches += 1
+        print("[!] Снижение цены потеряно, повторяется или лишнее")
+    if Counter(sent_today) != expected_today or Counter(sent_next_day) != expected_next_day:
+        mismatches += 1
+        print("[!] Отложенные по лимиту сообщения отправлены не в свой день")
+    if not deferred['single']:
+        print("[*] Лимит сообщений не достигнут - проверка следующего дня ничего не показывает")
+    if mismatches:
+        sys.exit(1)
+    print("Каждое снижение цены - ровно в одном сообщении, сверх лимита - на следующий день")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,191 @@
+# -*- coding: utf-8 -*-
+"""
+Очередь уведомлений (notification_outbox.py): сбои и восстановление
+
+Базы и события цен - как в benchmarks.price_events, отправка - настоящим
+python-telegram-bot на сервер-заглушку Bot API из
+benchmarks.telegram_delivery, который к тому же отвечает 502 на первую
+попытку части чатов. Сценарий:
+    1. проверка подписок по событиям ставит уведомления в очередь
+       (время проверки не зависит от скорости Telegram);
+    2. повторная обработка тех же событий (сбой до сохранения позиции) -
+       в очередь ничего не добавляется;
+    3. отправка прерывается на середине - взятые записи возвращаются;
+    4. обработчик "падает", взяв записи, - через OUTBOX_CLAIM_TIMEOUT
+       они снова в очереди;
+    5. очередь отправляется до конца двумя обработчиками сразу с
+       повторами после 502; взятая запись без продления считается
+       брошенной уже через секунду (OUTBOX_CLAIM_TIMEOUT), а отправка
+       пачки идёт дольше - записи держатся продлением (renew_claims).
+Проверяет, что каждое уведомление доставлено и отмечено отправленным
+ровно один раз (повтор возможен только для запроса, прерванного в
+момент отправки на шаге 3).
+
+Запуск:
+    python -m benchmarks.notification_outbox
+    python -m benchmarks.notification_outbox --latency 0.3
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from collections import Counter
+from contextlib import redirect_stdout
+from datetime import datetime, timedelta
+from functools import partial
+
+import notification_outbox
+import notification_service
+from benchmarks.alert_evaluation import generate, run_batched
+from benchmarks.price_events import change_prices
+from benchmarks.telegram_delivery import TOKEN, FakeBotApi
+from notification_outbox import STATE_SENDING, STATE_SENT, claim_due, outbox_counts
+from notification_service import (drain_outbox, get_active_alerts, get_users_db, last_price_event_id,
+                                  process_price_events, save_event_cursor)
+from telegram_delivery import TELEGRAM_GLOBAL_RATE, TELEGRAM_PER_CHAT_RATE, make_bot
+
+
+class FlakyBotApi(FakeBotApi):
+    """Заглушка Bot API, отвечающая 502 на первое сообщение в каждый третий чат"""
+
+    def reset(self):
+        super().reset()
+        self.failed_chats = set()
+
+    def handle(self, path, body):
+        chat_id = body.decode().partition('chat_id=')[2].partition('&')[0]
+        if path.endswith('/sendMessage') and int(chat_id or 0) % 3 == 0:
+            with self.lock:
+                first = chat_id not in self.failed_chats
+                self.failed_chats.add(chat_id)
+            if first:
+                time.sleep(self.latency)
+                return 502, {'ok': False, 'error_code': 502, 'description': 'Bad Gateway'}
+        return super().handle(path, body)
+
+
+def outbox_rows():
+    conn = get_users_db()
+    rows = conn.execute('SELECT chat_id, payload, state FROM notification_outbox').fetchall()
+    conn.close()
+    return rows
+
+
+async def _two_workers():
+    """Два обработчика: первый берёт очередь, второй опрашивает её, пока первый отправляет"""
+    first = asyncio.create_task(drain_outbox())
+    while not first.done():
+        await asyncio.sleep(0.2)
+        await drain_outbox()
+    await first
+
+
+def _timed(run):
+    started = time.perf_counter()
+    result = run()
+    return result, time.perf_counter() - started
+
+
+def main():
+    """Точка входа"""
+    parser = argparse.ArgumentParser(description='Очередь уведомлений: сбои и восстановление')
+    parser.add_argument('--alerts', type=int, default=4000, help='Активных подписок')
+    parser.add_argument('--products', type=int, default=4000, help='Товаров в каждом магазине')
+    parser.add_argument('--changed', type=float, default=0.3, help='Доля товаров с новой ценой')
+    parser.add_argument('--latency', type=float, default=0.15, help='Задержка ответа Bot API, с')
+    args = parser.parse_args()
+
+    # Быстрые повторы вместо минут
+    notification_outbox.OUTBOX_RETRY_BASE = 0.2
+    notification_service.TELEGRAM_BOT_TOKEN = TOKEN
+
+    with tempfile.TemporaryDirectory() as tmp, open(os.devnull, 'w') as devnull, \
+            FlakyBotApi(args.latency, TELEGRAM_GLOBAL_RATE, TELEGRAM_PER_CHAT_RATE) as api:
+        notification_service.make_bot = partial(make_bot, base_url=api.base_url)
+        with redirect_stdout(devnull):
+            store_paths, users_path = generate(tmp, args.alerts, args.products)
+            notification_service.STORE_DATABASES = store_paths
+            notification_service.USERS_DB = users_path
+            run_batched(get_active_alerts())
+            for store_id in store_paths:
+                save_event_cursor(store_id, last_price_event_id(store_id))
+            change_prices(store_paths, args.changed)
+
+            # 1. Проверка подписок: только очередь, без Telegram
+            _, detect_time = _timed(process_price_events)
+            queued = len(outbox_rows())
+
+            # 2. Те же события ещё раз
+            for store_id in store_paths:
+                save_event_cursor(store_id, 0)
+            process_price_events()
+            requeued = len(outbox_rows()) - queued
+
+            # 3. Прерванная отправка
+            try:
+                asyncio.run(asyncio.wait_for(drain_outbox(), timeout=1.0))
+            except asyncio.TimeoutError:
+                pass
+            conn = get_users_db()
+            after_cancel = outbox_counts(conn)
+            # Доставлены, но не отмечены: прерваны в момент отправки
+            # (сервер заканчивает запросы, начатые до отмены)
+            time.sleep(args.latency * 2)
+            marked = {(chat_id, payload) for chat_id, payload, state in outbox_rows() if state == STATE_SENT}
+            interrupted = {key for key in api.delivered if key not in marked}
+
+            # 4. Обработчик взял записи и упал
+            abandoned = len(claim_due(conn, limit=20))
+            conn.execute('UPDATE notification_outbox SET claimed_at = ? WHERE state = ?',
+                         (datetime.now() - timedelta(hours=1), STATE_SENDING))
+            conn.commit()
+            conn.close()
+
+            # 5. Отправка до конца двумя обработчиками, короткий таймаут взятых записей
+            notification_outbox.OUTBOX_CLAIM_TIMEOUT = 1.0
+            notification_service.OUTBOX_RENEW_INTERVAL = 0.25
+            started = time.perf_counter()
+            while True:
+                asyncio.run(_two_workers())
+                conn = get_users_db()
+                counts = outbox_counts(conn)
+                conn.close()
+                if set(counts) <= {STATE_SENT, 'failed'}:
+                    break
+                time.sleep(0.2)
+            send_time = time.perf_counter() - started
+
+        rows = outbox_rows()
+        delivered = api.delivered
+
+    expected = Counter((chat_id, payload) for chat_id, payload, _ in rows)
+    lost = sum(1 for key in expected if not delivered.get(key))
+    duplicates = sum(count - 1 for count in delivered.values() if count > 1)
+    unexpected = sum(count - 1 - (key in interrupted) for key, count in delivered.items()
+                     if count > 1 + (key in interrupted))
+    not_sent = sum(1 for _, _, state in rows if state != STATE_SENT)
+
+    print("=" * 60)
+    print(f"  ОЧЕРЕДЬ УВЕДОМЛЕНИЙ: {queued} уведомлений, задержка Bot API {args.latency * 1000:.0f} мс")
+    print("=" * 60)
+    print(f"проверка подписок и постановка в очередь: {detect_time:.2f} с")
+    print(f"повторная обработка тех же событий: добавлено {requeued}")
+    print(f"после прерванной отправки: {dict(sorted(after_cancel.items()))}")
+    print(f"брошено упавшим обработчиком: {abandoned}, возвращены по таймауту")
+    print(f"отправка очереди до конца (2 обработчика): {send_time:.2f} с, "
+          f"ответов 502: {len(api.failed_chats)}, 429: {api.rejected}")
+    print(f"доставлено: {len(expected) - lost}/{len(expected)}, повторов: {duplicates} "
+          f"(прервано в момент отправки: {len(interrupted)}), не отмечено отправленными: {not_sent}")
+
+    mismatches = lost + not_sent + requeued + unexpected + after_cancel.get(STATE_SENDING, 0)
+    if mismatches:
+        print("[!] Уведомления потеряны, не отмечены или поставлены повторно")
+        sys.exit(1)
+    print("Каждое уведомление доставлено и отмечено отправленным")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+"""
+Проверка подписок по событиям цен (price_events) против полной проверки
+
+Генерирует базы магазинов и пользователей (как benchmarks.alert_evaluation),
+доводит подписки до установившегося состояния полной проверкой и
+имитирует прогон скрапера: у доли товаров меняется цена
+(product_storage.upsert_products пишет price_events). Затем подписки
+проверяются двумя способами:
+    - полная проверка: все активные подписки (check_and_notify);
+    - по событиям: только подписки на товары из новых событий
+      (process_price_events).
+Сравнивает уведомления и время, а также стоимость прохода без
+изменений цен (события не появились).
+
+Запуск:
+    python -m benchmarks.price_events
+    python -m benchmarks.price_events --alerts 50000 --changed 0.005
+"""
+
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from contextlib import redirect_stdout
+
+import notification_service
+from benchmarks.alert_evaluation import generate, run_batched
+from notification_service import (alerts_for_events, evaluate_alerts, get_active_alerts,
+                                  get_event_cursor, get_price_events, last_price_event_id,
+                                  save_event_cursor)
+from product_storage import open_store_db, upsert_products
+
+
+def change_prices(store_paths, share: float, seed: int = 2) -> int:
+    """Прогон скрапера: у доли товаров цена меняется (чаще снижается)"""
+    rng = random.Random(seed)
+    changed = 0
+    for store_id, path in store_paths.items():
+        conn = open_store_db(path)
+        rows = conn.execute('SELECT product_id, name, category, current_price FROM products').fetchall()
+        products = [
+            {'id': product_id, 'name': name, 'category': category,
+             'price': round(price * rng.choice([0.7, 0.85, 0.95, 1.1]), 2), 'old_price': price}
+            for product_id, name, category, price in rng.sample(rows, int(len(rows) * share))
+        ]
+        changed += upsert_products(conn, products, '2026-01-01T12:00:00').price_changed
+        conn.close()
+    return changed
+
+
+def run_full():
+    """Все активные подписки"""
+    notifications, _ = evaluate_alerts(get_active_alerts())
+    return notifications
+
+
+def run_events():
+    """Только подписки на товары из новых событий цен"""
+    notifications = []
+    for store_id in notification_service.STORE_DATABASES:
+        cursor = get_event_cursor(store_id)
+        while True:
+            events = get_price_events(store_id, cursor)
+            if not events:
+                break
+            alerts = alerts_for_events(store_id, events)
+            notifications.extend(evaluate_alerts(alerts)[0])
+            cursor = events[-1]['id']
+        save_event_cursor(store_id, cursor)
+    return notifications
+
+
+def _key(notifications):
+    return sorted((item['alert_id'], item['old_price'], item['new_price'], item['reason'])
+                  for item in notifications)
+
+
+def _timed(run):
+    started = time.perf_counter()
+    result = run()
+    return result, time.perf_counter() - started
+
+
+def main():
+    """Точка входа"""
+    parser = argparse.ArgumentParser(description='Проверка подписок по событиям цен против полной проверки')
+    parser.add_argument('--alerts', type=int, default=20000, help='Активных подписок')
+    parser.add_argument('--products', type=int, default=20000, help='Товаров в каждом магазине')
+    parser.add_argument('--changed', type=float, default=0.01, help='Доля товаров с новой ценой')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp, open(os.devnull, 'w') as devnull:
+        with redirect_stdout(devnull):
+            store_paths, users_path = generate(tmp, args.alerts, args.products)
+            notification_service.STORE_DATABASES = store_paths
+            notification_service.USERS_DB = users_path
+
+            # Установившееся состояние: подписки проверены, события прочитаны
+            run_batched(get_active_alerts())
+            for store_id in store_paths:
+                save_event_cursor(store_id, last_price_event_id(store_id))
+
+            changed = change_prices(store_paths, args.changed)
+            # Копия с учётом WAL (соединения db_pool)
+            events_users = os.path.join(tmp, 'users_events.db')
+            with sqlite3.connect(users_path) as src, sqlite3.connect(events_users) as dst:
+                src.backup(dst)
+
+            full, full_time = _timed(run_full)
+            notification_service.USERS_DB = events_users
+            by_events, events_time = _timed(run_events)
+
+            # Без новых событий
+            _, full_idle_time = _timed(run_full)
+            idle, events_idle_time = _timed(run_events)
+
+    print("=" * 60)
+    print(f"  ПОДПИСКИ ПО СОБЫТИЯМ ЦЕН: {args.alerts} подписок, изменилось цен {changed}")
+    print("=" * 60)
+    print(f"полная проверка: {full_time:.3f} с  (уведомлений {len(full)})")
+    print(f"по событиям:     {events_time:.3f} с  (уведомлений {len(by_events)})")
+    print(f"ускорение: x{full_time / max(events_time, 1e-9):.0f}")
+    print(f"без изменений цен: полная {full_idle_time:.3f} с, по событиям {events_idle_time * 1000:.1f} мс")
+
+    mismatches = 0
+    if _key(full) != _key(by_events):
+        mismatches += 1
+        print("[!] Уведомления различаются")
+    if idle:
+        mismatches += 1
+        print("[!] Повторные уведомления без новых событий")
+    if mismatches:
+        sys.exit(1)
+    print("Уведомления совпадают")
+
+
+if __name__ == '__main__':
+    main()
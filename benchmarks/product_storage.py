@@ -0,0 +1,183 @@
+# -*- coding: utf-8 -*-
+"""
+Пакетное сохранение товаров (product_storage.py) против построчного
+
+Генерирует каталог из N товаров и сохраняет его во временные базы
+дважды: первый прогон - все товары новые, второй - часть цен
+изменилась, часть товаров новая, часть встречается дважды.
+Сравнивает счётчики, содержимое products и price_history
+с прежней обработкой по одному товару и время.
+
+Запуск:
+    python -m benchmarks.product_storage
+    python -m benchmarks.product_storage --products 100000
+"""
+
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+from product_storage import SaveCounts, open_store_db, upsert_products
+from store_db import ensure_store_schema
+from text_utils import normalize_product_name
+
+CATEGORIES = ['Молочная продукция', 'Напитки', 'Хлеб и выпечка', 'Овощи и фрукты', 'Бакалея']
+WORDS = ['молоко', 'кефир', 'сыр', 'хлеб', 'сок', 'вода', 'гречка', 'рис', 'яблоки', 'печенье']
+
+
+def save_row_by_row(conn, products, scraped_at) -> SaveCounts:
+    """Прежняя реализация: SELECT и UPDATE/INSERT на каждый товар"""
+    cursor = conn.cursor()
+    new_count = updated_count = price_changed_count = 0
+
+    for product in products:
+        product_id = product.get('id', '')
+        if not product_id:
+            continue
+        name = product.get('name', '')
+        price = product.get('price', 0)
+        old_price = product.get('old_price', 0)
+        category = product.get('category', '')
+        name_normalized, tokens = normalize_product_name(name)
+
+        cursor.execute('SELECT current_price, min_price, max_price FROM products WHERE product_id = ?', (product_id,))
+        existing = cursor.fetchone()
+        if existing:
+            old_db_price, min_price, max_price = existing
+            new_min = min(min_price, price) if min_price > 0 else price
+            new_max = max(max_price, price)
+            cursor.execute('''
+                UPDATE products
+                SET name = ?, name_normalized = ?, tokens = ?, category = ?, current_price = ?,
+                    min_price = ?, max_price = ?, last_updated = ?
+                WHERE product_id = ?
+            ''', (name, name_normalized, tokens, category, price, new_min, new_max, scraped_at, product_id))
+            updated_count += 1
+            if abs(old_db_price - price) > 0.01:
+                cursor.execute('''
+                    INSERT INTO price_history (product_id, price, old_price, recorded_at)
+                    VALUES (?, ?, ?, ?)
+                ''', (product_id, price, old_price, scraped_at))
+                price_changed_count += 1
+        else:
+            cursor.execute('''
+                INSERT INTO products (product_id, name, name_normalized, tokens, category, current_price,
+                                     min_price, max_price, first_seen, last_updated)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', (product_id, name, name_normalized, tokens, category, price, price, price, scraped_at, scraped_at))
+            cursor.execute('''
+                INSERT INTO price_history (product_id, price, old_price, recorded_at)
+                VALUES (?, ?, ?, ?)
+            ''', (product_id, price, old_price, scraped_at))
+            new_count += 1
+
+    conn.commit()
+    return SaveCounts(new_count, updated_count, price_changed_count)
+
+
+def generate_runs(count: int, seed: int = 1):
+    """Два прогона скрапера: исходный каталог и каталог после изменений"""
+    rng = random.Random(seed)
+    first = []
+    for i in range(count):
+        price = round(rng.uniform(30, 900), 2)
+        first.append({
+            'id': str(100000 + i),
+            'name': f"{rng.choice(WORDS).title()} {rng.choice(WORDS)} {rng.randint(1, 999)} г",
+            'price': price,
+            'old_price': round(price * 1.1, 2),
+            'category': rng.choice(CATEGORIES),
+        })
+
+    second = []
+    for product in first:
+        product = dict(product)
+        roll = rng.random()
+        if roll < 0.2:
+            product['price'] = round(product['price'] * rng.uniform(0.7, 1.3), 2)
+        elif roll < 0.25:
+            product['price'] = 0
+        second.append(product)
+    # Новые товары и повторы одного товара в разных категориях
+    for i in range(count // 20):
+        second.append({'id': str(100000 + count + i), 'name': f"Новинка {i}", 'price': 99.9,
+                       'old_price': 0, 'category': rng.choice(CATEGORIES)})
+    for product in rng.sample(second, count // 50):
+        repeat = dict(product, category=rng.choice(CATEGORIES))
+        repeat['price'] = round(repeat['price'] + rng.choice([0, 5]), 2)
+        second.append(repeat)
+    rng.shuffle(second)
+    return first, second
+
+
+def dump(conn):
+    """Содержимое таблиц для сравнения"""
+    products = conn.execute(
+        'SELECT id, product_id, name, name_normalized, tokens, category, current_price, '
+        'min_price, max_price, first_seen, last_updated FROM products ORDER BY id'
+    ).fetchall()
+    history = conn.execute(
+        'SELECT id, product_id, price, old_price, recorded_at FROM price_history ORDER BY id'
+    ).fetchall()
+    return products, history
+
+
+def run(save, db_path, runs):
+    """Оба прогона одной реализацией: счётчики и время каждого"""
+    if save is upsert_products:
+        conn = open_store_db(db_path)
+    else:
+        conn = sqlite3.connect(db_path)
+        ensure_store_schema(conn)
+    results = []
+    for number, products in enumerate(runs):
+        scraped_at = f'2024-01-0{number + 1}T10:00:00'
+        started = time.perf_counter()
+        counts = save(conn, products, scraped_at)
+        results.append((counts, time.perf_counter() - started))
+    state = dump(conn)
+    conn.close()
+    return results, state
+
+
+def main():
+    """Точка входа"""
+    parser = argparse.ArgumentParser(description='Пакетное сохранение товаров против построчного')
+    parser.add_argument('--products', type=int, default=50000, help='Товаров в каталоге')
+    args = parser.parse_args()
+
+    runs = generate_runs(args.products)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        legacy, legacy_state = run(save_row_by_row, os.path.join(tmp, 'legacy.db'), runs)
+        batched, batched_state = run(upsert_products, os.path.join(tmp, 'batched.db'), runs)
+
+    print("=" * 60)
+    print(f"  СОХРАНЕНИЕ ТОВАРОВ: {args.products} в каталоге")
+    print("=" * 60)
+    mismatches = 0
+    for number, ((legacy_counts, legacy_time), (batched_counts, batched_time)) in enumerate(zip(legacy, batched)):
+        same = legacy_counts == batched_counts
+        mismatches += not same
+        print(f"Прогон {number + 1}: {len(runs[number])} товаров")
+        print(f"  построчно: {legacy_time:.2f} с  {tuple(legacy_counts)}")
+        print(f"  пакетно:   {batched_time:.2f} с  {tuple(batched_counts)}")
+        print(f"  ускорение: x{legacy_time / batched_time:.1f}{'' if same else '  [!] счётчики различаются'}")
+
+    for label, legacy_rows, batched_rows in zip(('products', 'price_history'), legacy_state, batched_state):
+        if legacy_rows != batched_rows:
+            mismatches += 1
+            print(f"[!] {label}: содержимое различается")
+        else:
+            print(f"{label}: совпадает ({len(batched_rows)} строк)")
+
+    if mismatches:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+"""
+Извлечение товаров на записанных снимках страниц (scraper_snapshots.py)
+
+Открывает снимки в headless Chrome (file:// или локальный HTTP-сервер),
+запускает то же извлечение, что в скраперах:
+    - категория Пятёрочки: Scraper5ka._extract_products_js
+    - категория Магнита:   MagnitScraper.extract_products
+    - каталог:             parse_categories (у Пятёрочки ещё
+                           categories_from_next_data по сохранённому JSON)
+и сверяет результат с тем, что извлекла версия скрапера при записи.
+Скорость - товаров в секунду (только извлечение, без загрузки страницы).
+
+Снимки записываются скрапером:
+    python scraper_v2.py --record
+    python scraper_magnit.py --record
+
+Запуск:
+    python -m benchmarks.scraper_replay
+    python -m benchmarks.scraper_replay --store magnit --http
+    python -m benchmarks.scraper_replay --update   # принять новый результат
+
+Нужны selenium, webdriver-manager и Chrome.
+"""
+
+import argparse
+import sys
+import time
+from contextlib import nullcontext
+from typing import Dict, List
+
+from scraper_magnit import MagnitScraper
+from scraper_snapshots import (KIND_CATALOG, SNAPSHOT_DIR, SnapshotServer, load_expected,
+                               load_index, load_next_data, replay, save_expected,
+                               start_headless_driver)
+from scraper_v2 import Scraper5ka
+
+STORES = {
+    '5ka': lambda: Scraper5ka(),
+    'magnit': lambda: MagnitScraper(headless=True),
+}
+
+
+def extract(store: str, scraper, snapshot: Dict) -> List[Dict]:
+    """Извлечение со страницы снимка, как в скрапере"""
+    if snapshot['kind'] == KIND_CATALOG:
+        return scraper.parse_categories()
+    if store == '5ka':
+        return scraper._extract_products_js(snapshot['name'])
+    return scraper.extract_products(snapshot['name'])
+
+
+def _key(item: Dict):
+    return item.get('id') or item.get('url') or item.get('name')
+
+
+def compare(expected: List[Dict], actual: List[Dict]) -> Dict[str, int]:
+    """Расхождения с записанным результатом"""
+    expected_by_key = {_key(item): item for item in expected}
+    actual_by_key = {_key(item): item for item in actual}
+    return {
+        'missing': len(expected_by_key.keys() - actual_by_key.keys()),
+        'extra': len(actual_by_key.keys() - expected_by_key.keys()),
+        'changed': sum(1 for key in expected_by_key.keys() & actual_by_key.keys()
+                       if expected_by_key[key] != actual_by_key[key]),
+    }
+
+
+def replay_store(store: str, snapshot_dir: str, use_http: bool, update: bool) -> int:
+    """Снимки одного магазина. Возвращает число снимков с расхождениями"""
+    scraper = STORES[store]()
+    scraper.driver = start_headless_driver()
+    mismatches = 0
+    total_items = 0
+    total_time = 0.0
+
+    print(f"\n{store}:")
+    try:
+        with SnapshotServer(snapshot_dir) if use_http else nullcontext() as server:
+            for snapshot in replay(scraper.driver, snapshot_dir, store, server):
+                started = time.perf_counter()
+                items = extract(store, scraper, snapshot)
+                elapsed = time.perf_counter() - started
+                total_items += len(items)
+                total_time += elapsed
+
+                expected = load_expected(snapshot_dir, store, snapshot)
+                diff = compare(expected, items)
+
+                # Каталог Пятёрочки: тот же разбор по сохранённому __NEXT_DATA__ без браузера
+                next_data = load_next_data(snapshot_dir, store, snapshot)
+                if store == '5ka' and next_data is not None:
+                    if Scraper5ka.categories_from_next_data(next_data) != expected:
+                        diff['next_data'] = 1
+
+                bad = any(diff.values())
+                mismatches += bad
+                rate = len(items) / elapsed if elapsed else 0
+                status = '' if not bad else '  [!] ' + ', '.join(f'{k} {v}' for k, v in diff.items() if v)
+                print(f"  {snapshot['kind']:8} {snapshot['name'][:40]:40} {len(items):6} "
+                      f"{rate:10.0f}/с{status}")
+
+                if update and bad:
+                    save_expected(snapshot_dir, store, snapshot, items)
+    finally:
+        scraper.stop()
+
+    if total_time:
+        print(f"  Итого: {total_items} записей, {total_items / total_time:.0f}/с")
+    return mismatches
+
+
+def main():
+    """Точка входа"""
+    parser = argparse.ArgumentParser(description='Извлечение товаров на записанных снимках страниц')
+    parser.add_argument('--dir', default=SNAPSHOT_DIR, help=f'Каталог снимков (по умолчанию {SNAPSHOT_DIR})')
+    parser.add_argument('--store', choices=sorted(STORES), help='Только один магазин')
+    parser.add_argument('--http', action='store_true', help='Через локальный HTTP-сервер вместо file://')
+    parser.add_argument('--update', action='store_true',
+                        help='Записать текущий результат как ожидаемый (после намеренных изменений)')
+    args = parser.parse_args()
+
+    stores = [args.store] if args.store else sorted(STORES)
+    stores = [store for store in stores if load_index(args.dir, store)]
+    if not stores:
+        print(f"[!] Нет снимков в {args.dir}: запустите скрапер с --record")
+        sys.exit(1)
+
+    print("=" * 60)
+    print(f"  ВОСПРОИЗВЕДЕНИЕ СНИМКОВ: {args.dir} ({'http' if args.http else 'file://'})")
+    print("=" * 60)
+
+    mismatches = sum(replay_store(store, args.dir, args.http, args.update) for store in stores)
+
+    if mismatches and not args.update:
+        print(f"\n[!] Снимков с расхождениями: {mismatches}")
+        sys.exit(1)
+    if mismatches:
+        print(f"\nОбновлено ожидаемых результатов: {mismatches}")
+    else:
+        print("\nРезультаты совпадают с записанными")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,200 @@
+# -*- coding: utf-8 -*-
+"""
+Параллельная отправка уведомлений (telegram_delivery.DeliveryEngine)
+против отправки по одной
+
+Поднимает локальный сервер-заглушку Bot API с задержкой ответа и
+лимитами Telegram (общий на бота и на каждый чат; при превышении -
+429 с retry_after) и отправляет одну и ту же пачку уведомлений
+настоящим python-telegram-bot двумя способами:
+    - прежний: await send_message по одному сообщению, ошибка - пропуск;
+    - DeliveryEngine: параллельно в пределах лимитов, RetryAfter - повтор.
+Сравнивает доставленные сообщения, ответы 429 и скорость.
+
+Запуск:
+    python -m benchmarks.telegram_delivery
+    python -m benchmarks.telegram_delivery --messages 600 --latency 0.15
+"""
+
+import argparse
+import asyncio
+import http.server
+import json
+import math
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from urllib.parse import parse_qs
+
+from telegram import Bot
+
+from notification_service import format_notification, send_message
+from telegram_delivery import DeliveryEngine, Message, TokenBucket, make_bot
+from telegram_delivery import TELEGRAM_GLOBAL_RATE, TELEGRAM_PER_CHAT_RATE
+
+TOKEN = '123456:TEST'
+
+
+class FakeBotApi:
+    """Сервер-заглушка Bot API: getMe и sendMessage с лимитами Telegram"""
+
+    def __init__(self, latency: float, global_rate: float, per_chat_rate: float):
+        self.latency = latency
+        self.global_rate = global_rate
+        self.per_chat_rate = per_chat_rate
+        self.lock = threading.Lock()
+        self.reset()
+
+        api = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length') or 0)
+                status, payload = api.handle(self.path, self.rfile.read(length))
+                body = json.dumps(payload).encode()
+                try:
+                    self.send_response(status)
+                    self.send_header('Content-Type', 'application/json')
+                    self.send_header('Content-Length', str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+                except (BrokenPipeError, ConnectionResetError):
+                    # Клиент прервал запрос (отмена отправки)
+                    pass
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    def reset(self):
+        # Лимиты сервера - те же вёдра токенов с запасом в одну секунду
+        self.global_bucket = TokenBucket(self.global_rate, capacity=self.global_rate)
+        self.chat_buckets = {}
+        self.delivered = Counter()
+        self.rejected = 0
+
+    @property
+    def base_url(self) -> str:
+        return f'http://127.0.0.1:{self._server.server_address[1]}/bot'
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def handle(self, path: str, body: bytes):
+        time.sleep(self.latency)
+        method = path.rsplit('/', 1)[-1]
+        if method == 'getMe':
+            return 200, {'ok': True, 'result': {'id': 1, 'is_bot': True,
+                                                'first_name': 'Pricio', 'username': 'pricio_test_bot'}}
+        if method != 'sendMessage':
+            return 404, {'ok': False, 'error_code': 404, 'description': 'Not Found'}
+
+        params = {key: values[0] for key, values in parse_qs(body.decode()).items()}
+        chat_id = params['chat_id']
+        with self.lock:
+            chat_bucket = self.chat_buckets.setdefault(chat_id, TokenBucket(self.per_chat_rate))
+            # Небольшой допуск на неравномерность сети
+            wait = max(chat_bucket.reserve(), self.global_bucket.reserve())
+            if wait > 0.05:
+                # Отказ не расходует лимит
+                chat_bucket._tokens += 1
+                self.global_bucket._tokens += 1
+                self.rejected += 1
+                retry_after = max(1, math.ceil(wait))
+                return 429, {'ok': False, 'error_code': 429,
+                             'description': f'Too Many Requests: retry after {retry_after}',
+                             'parameters': {'retry_after': retry_after}}
+            self.delivered[(chat_id, params['text'])] += 1
+            message_id = sum(self.delivered.values())
+        return 200, {'ok': True, 'result': {
+            'message_id': message_id, 'date': int(time.time()),
+            'chat': {'id': int(chat_id), 'type': 'private'}, 'text': params['text']}}
+
+
+def generate(count: int, seed: int = 1):
+    """Уведомления: у части пользователей по несколько подписок сразу"""
+    rng = random.Random(seed)
+    users = max(1, count // 3)
+    messages = []
+    for i in range(count):
+        old_price = round(rng.uniform(50, 900), 2)
+        text = format_notification(f'Товар {i}', 'Пятёрочка', '5ka', str(i),
+                                   old_price, round(old_price * 0.9, 2))
+        messages.append(Message(str(100000 + rng.randrange(users)), text, i))
+    # Как из evaluate_alerts: подписки одного пользователя часто идут подряд
+    messages.sort(key=lambda message: message.chat_id)
+    return messages
+
+
+async def run_legacy(api: FakeBotApi, messages):
+    """Прежний цикл check_and_notify: по одному сообщению, ошибка - пропуск"""
+    bot = Bot(token=TOKEN, base_url=api.base_url)
+    sent = 0
+    async with bot:
+        for message in messages:
+            try:
+                await send_message(bot, message.chat_id, message.text)
+                sent += 1
+            except Exception:
+                pass
+    return sent
+
+
+async def run_engine(api: FakeBotApi, messages):
+    bot = make_bot(TOKEN, base_url=api.base_url)
+    async with bot:
+        engine = DeliveryEngine(lambda chat_id, text: send_message(bot, chat_id, text))
+        results = await engine.deliver(messages)
+    return sum(1 for result in results if result.ok)
+
+
+def main():
+    """Точка входа"""
+    parser = argparse.ArgumentParser(description='Параллельная отправка уведомлений против отправки по одной')
+    parser.add_argument('--messages', type=int, default=300, help='Уведомлений в пачке')
+    parser.add_argument('--latency', type=float, default=0.08, help='Задержка ответа сервера, с')
+    args = parser.parse_args()
+
+    messages = generate(args.messages)
+    expected = Counter((message.chat_id, message.text) for message in messages)
+
+    results = {}
+    with FakeBotApi(args.latency, TELEGRAM_GLOBAL_RATE, TELEGRAM_PER_CHAT_RATE) as api:
+        for label, run in (('legacy', run_legacy), ('engine', run_engine)):
+            api.reset()
+            started = time.perf_counter()
+            sent = asyncio.run(run(api, messages))
+            elapsed = time.perf_counter() - started
+            results[label] = (sent, elapsed, api.rejected, api.delivered == expected)
+
+    print("=" * 60)
+    print(f"  ОТПРАВКА УВЕДОМЛЕНИЙ: {len(messages)} сообщений, "
+          f"{len(set(message.chat_id for message in messages))} чатов")
+    print(f"  лимиты {TELEGRAM_GLOBAL_RATE}/с на бота, {TELEGRAM_PER_CHAT_RATE}/с на чат, "
+          f"задержка {args.latency * 1000:.0f} мс")
+    print("=" * 60)
+    for label, title in (('legacy', 'по одной:      '), ('engine', 'DeliveryEngine:')):
+        sent, elapsed, rejected, _ = results[label]
+        print(f"{title} {elapsed:6.2f} с  {sent / elapsed:6.1f} сообщ/с  "
+              f"доставлено {sent}/{len(messages)}, ответов 429: {rejected}")
+    print(f"ускорение: x{results['legacy'][1] / results['engine'][1]:.1f}")
+
+    sent, _, _, exact = results['engine']
+    if sent != len(messages) or not exact:
+        print("[!] DeliveryEngine доставил не все сообщения (или с повторами)")
+        sys.exit(1)
+    print("DeliveryEngine доставил все сообщения ровно по одному разу")
+
+
+if __name__ == '__main__':
+    main()
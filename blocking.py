@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+"""
+Блокирующий индекс для отбора кандидатов при поиске похожих товаров
+
+Товары каталога раскладываются по блокам:
+    s:<стем>        - стем первого слова названия и стем типа продукта
+    b:<бренд>       - бренд
+    p:<слово слово> - пара значимых слов названия
+Кандидаты для товара - объединение его блоков. Стоимость отбора
+пропорциональна размеру этих блоков, а не всего каталога.
+
+Скоринг даёт > 20 баллов только при совпадении первого слова или
+типа продукта, либо при двух общих словах, поэтому блоки покрывают
+результаты полного перебора. Не покрывается только редкий случай,
+когда первое слово одного названия содержит первое слово другого
+при разных стемах. Полноту можно проверить:
+    python -m benchmarks.blocking_recall
+"""
+
+from collections import defaultdict
+from itertools import combinations
+from typing import Dict, List, Set
+
+from product_attributes import ProductAttributes, STOP_WORDS, stem_russian
+from text_utils import extract_words
+
+
+def blocking_keys(name_normalized: str, attrs: ProductAttributes,
+                  words: List[str] = None) -> Set[str]:
+    """Ключи блоков товара"""
+    keys = set()
+
+    first_word = name_normalized.split()[0] if name_normalized else ""
+    if first_word:
+        keys.add('s:' + stem_russian(first_word))
+
+    if attrs.product_type:
+        keys.add('s:' + stem_russian(attrs.product_type.lower()))
+
+    if attrs.brand:
+        keys.add('b:' + attrs.brand.lower())
+
+    # Пары значимых слов: скоринг засчитывает два общих слова
+    # даже без совпадения типа продукта
+    significant = sorted(set(words if words is not None else extract_words(name_normalized)) - STOP_WORDS)
+    for pair in combinations(significant, 2):
+        keys.add('p:' + ' '.join(pair))
+
+    return keys
+
+
+class BlockingIndex:
+    """
+    Блоки каталога одного магазина.
+    Элементы каталога - объекты с полями name_normalized и attrs
+    (matching.CatalogItem).
+    """
+
+    def __init__(self, catalog: List):
+        self.catalog = catalog
+        self._blocks: Dict[str, List[int]] = defaultdict(list)
+        for position, item in enumerate(catalog):
+            for key in blocking_keys(item.name_normalized, item.attrs, item.words):
+                self._blocks[key].append(position)
+
+    def __len__(self):
+        return len(self.catalog)
+
+    def block_sizes(self) -> Dict[str, int]:
+        """Размеры блоков (для отчётов)"""
+        return {key: len(positions) for key, positions in self._blocks.items()}
+
+    def positions(self, name_normalized: str, attrs: ProductAttributes,
+                  words: List[str] = None) -> List[int]:
+        """Позиции в каталоге товаров из блоков исходного товара (по возрастанию)"""
+        positions = set()
+        for key in blocking_keys(name_normalized, attrs, words):
+            block = self._blocks.get(key)
+            if block:
+                positions.update(block)
+        return sorted(positions)
+
+    def candidates(self, name_normalized: str, attrs: ProductAttributes,
+                   words: List[str] = None) -> List:
+        """
+        Товары из блоков исходного товара.
+        Порядок совпадает с порядком каталога, как при полном переборе.
+        """
+        return [self.catalog[position] for position in self.positions(name_normalized, attrs, words)]
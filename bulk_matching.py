@@ -0,0 +1,370 @@
+# -*- coding: utf-8 -*-
+"""
+Пакетное сопоставление всего каталога между магазинами
+
+Товары исходного магазина делятся на диапазоны products.id (чанки)
+и обрабатываются в ProcessPoolExecutor. Снимок каталога другого
+магазина (индекс кандидатов и массивы скоринга) строится один раз
+в главном процессе и достаётся воркерам через fork без копирования;
+там, где fork недоступен, каждый воркер загружает снимок сам.
+
+Результаты чанка записываются в product_matches одной транзакцией
+вместе с отметкой в product_matches_checkpoints, поэтому прерванный
+пересчёт продолжается с незавершённых чанков.
+
+Запуск:
+    python bulk_matching.py                  # Обе стороны, все ядра
+    python bulk_matching.py --workers 8
+    python bulk_matching.py --source 5ka     # Только 5ka -> magnit
+    python bulk_matching.py --restart        # Начать заново, не продолжая прерванный
+    python bulk_matching.py --candidates lsh --bands 32 --rows 2
+"""
+
+import argparse
+import multiprocessing
+import os
+import sqlite3
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+from matching import (
+    CANDIDATE_INDEXES, MATCHES_TOP_N, CatalogItem, connect_store, load_catalog,
+    find_similar_in_index, get_catalog_arrays, other_store
+)
+from product_attributes import ATTRIBUTE_COLUMNS_SQL, ATTRIBUTES_JOIN_SQL
+from store_db import STORE_DATABASES, db_file_signature
+
+try:
+    from config import MATCH_WORKERS
+except ImportError:
+    MATCH_WORKERS = os.cpu_count() or 1
+
+# Товаров исходного магазина в одном чанке
+CHUNK_SIZE = 500
+
+# Снимок каталога другого магазина в текущем процессе: (ключ, индекс)
+_snapshot = None
+
+
+def _chunk_range_sql(column: str = 'id') -> str:
+    """Условие "товар в чанке" для диапазона [chunk_start, chunk_end)"""
+    return f'{column} >= ? AND (? IS NULL OR {column} < ?)'
+
+
+# ============================================================================
+# ВОРКЕРЫ
+# ============================================================================
+
+def _connect_readonly(db_file: str):
+    conn = sqlite3.connect(f'file:{db_file}?mode=ro', uri=True)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+
+def _init_snapshot(key: tuple):
+    """
+    Загружает снимок каталога, если в процессе его ещё нет.
+    При fork воркеры получают снимок главного процесса готовым.
+    """
+    global _snapshot
+    if _snapshot is not None and _snapshot[0] == key:
+        return
+
+    target_db, candidates, index_options, _ = key
+    conn = _connect_readonly(target_db)
+    try:
+        catalog = load_catalog(conn)
+    finally:
+        conn.close()
+
+    index = CANDIDATE_INDEXES[candidates](catalog, **dict(index_options))
+    # Массивы строятся до fork, чтобы воркеры их не пересчитывали
+    get_catalog_arrays(index)
+    _snapshot = (key, index)
+
+
+def _match_chunk(source_db: str, chunk_start: int, chunk_end: Optional[int],
+                 target_store: str, top_n: int, computed_at: str) -> Tuple[int, List, List]:
+    """
+    Сопоставление товаров одного чанка
+
+    Returns:
+        (chunk_start, строки product_matches, строки product_matches_computed)
+    """
+    index = _snapshot[1]
+
+    conn = _connect_readonly(source_db)
+    try:
+        rows = conn.execute(
+            f"SELECT p.*, {ATTRIBUTE_COLUMNS_SQL} FROM products p {ATTRIBUTES_JOIN_SQL} "
+            f"WHERE {_chunk_range_sql('p.id')} ORDER BY p.id",
+            (chunk_start, chunk_end, chunk_end)
+        ).fetchall()
+    finally:
+        conn.close()
+
+    match_rows = []
+    computed_rows = []
+    for row in rows:
+        source = CatalogItem(row)
+        product = source.product
+        current_price = product.get('current_price', 0) or 0
+        similar = find_similar_in_index(
+            index, product['name'], product['product_id'], current_price,
+            source_attrs=source.attrs, limit=top_n
+        )
+        for rank, match in enumerate(similar, 1):
+            match_rows.append((
+                product['product_id'], target_store, rank, match['product_id'],
+                match['similarity_score'], match['price_diff'], int(match['is_exact_match']),
+                computed_at
+            ))
+        computed_rows.append((product['product_id'], target_store, len(similar), computed_at))
+
+    return chunk_start, match_rows, computed_rows
+
+
+# ============================================================================
+# ЧЕКПОИНТЫ И ЗАПИСЬ
+# ============================================================================
+
+def plan_chunks(conn, chunk_size: int = CHUNK_SIZE) -> List[Tuple[int, Optional[int]]]:
+    """Диапазоны products.id по chunk_size товаров; последний - до конца таблицы"""
+    ids = [row[0] for row in conn.execute('SELECT id FROM products ORDER BY id').fetchall()]
+    starts = ids[::chunk_size]
+    if not starts:
+        return []
+    # Первый чанк захватывает и товары с меньшими id
+    starts[0] = 0
+    return list(zip(starts, starts[1:] + [None]))
+
+
+def _load_checkpoint(conn, target_store: str, restart: bool, chunk_size: int):
+    """
+    Незавершённый пересчёт или план нового
+
+    Returns:
+        (время начала пересчёта, необработанные чанки, всего чанков)
+    """
+    rows = conn.execute('''
+        SELECT chunk_start, chunk_end, run_started_at, completed_at
+        FROM product_matches_checkpoints
+        WHERE target_store = ?
+        ORDER BY chunk_start
+    ''', (target_store,)).fetchall()
+
+    pending = [(row['chunk_start'], row['chunk_end']) for row in rows if row['completed_at'] is None]
+    if pending and not restart:
+        run_started_at = rows[0]['run_started_at']
+        print(f"[*] Продолжаем пересчёт от {run_started_at}: "
+              f"осталось {len(pending)} из {len(rows)} чанков")
+        return run_started_at, pending, len(rows)
+
+    run_started_at = datetime.now().isoformat()
+    chunks = plan_chunks(conn, chunk_size)
+    conn.execute('DELETE FROM product_matches_checkpoints WHERE target_store = ?', (target_store,))
+    conn.executemany('''
+        INSERT INTO product_matches_checkpoints (target_store, chunk_start, chunk_end, run_started_at)
+        VALUES (?, ?, ?, ?)
+    ''', [(target_store, start, end, run_started_at) for start, end in chunks])
+    conn.commit()
+    return run_started_at, chunks, len(chunks)
+
+
+def _write_chunk(conn, target_store: str, chunk_start: int, chunk_end: Optional[int],
+                 match_rows: List, computed_rows: List):
+    """Заменяет сопоставления товаров чанка и отмечает чанк одной транзакцией"""
+    params = (target_store, chunk_start, chunk_end, chunk_end)
+    chunk_products = f'SELECT product_id FROM products WHERE {_chunk_range_sql()}'
+
+    conn.execute(f'DELETE FROM product_matches WHERE target_store = ? AND product_id IN ({chunk_products})',
+                 params)
+    conn.execute(f'DELETE FROM product_matches_computed WHERE target_store = ? AND product_id IN ({chunk_products})',
+                 params)
+    conn.executemany('''
+        INSERT OR REPLACE INTO product_matches
+        (product_id, target_store, rank, target_product_id, score, price_diff, is_exact_match, computed_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    ''', match_rows)
+    conn.executemany('''
+        INSERT OR REPLACE INTO product_matches_computed (product_id, target_store, match_count, computed_at)
+        VALUES (?, ?, ?, ?)
+    ''', computed_rows)
+    conn.execute('''
+        UPDATE product_matches_checkpoints SET completed_at = ?
+        WHERE target_store = ? AND chunk_start = ?
+    ''', (datetime.now().isoformat(), target_store, chunk_start))
+    conn.commit()
+
+
+def _finish_run(conn, target_store: str):
+    """Удаляет сопоставления исчезнувших товаров и чекпоинты"""
+    conn.execute('''
+        DELETE FROM product_matches
+        WHERE target_store = ? AND product_id NOT IN (SELECT product_id FROM products)
+    ''', (target_store,))
+    conn.execute('''
+        DELETE FROM product_matches_computed
+        WHERE target_store = ? AND product_id NOT IN (SELECT product_id FROM products)
+    ''', (target_store,))
+    conn.execute('DELETE FROM product_matches_checkpoints WHERE target_store = ?', (target_store,))
+    conn.commit()
+
+
+def _print_progress(label: str, done: int, total: int, chunks_done: int, chunks_total: int,
+                    started: float):
+    elapsed = time.time() - started
+    rate = done / elapsed if elapsed > 0 else 0
+    remaining = (total - done) / rate if rate else 0
+    percent = done * 100 // total if total else 100
+    print(f"\r    {label}: {done}/{total} ({percent}%) | чанков {chunks_done}/{chunks_total} | "
+          f"{rate:.0f} тов/сек | осталось ~{remaining:.0f} сек   ", end='', flush=True)
+
+
+# ============================================================================
+# ПЕРЕСЧЁТ
+# ============================================================================
+
+def compute_matches(source_store: str, target_store: str, top_n: int = MATCHES_TOP_N,
+                    candidates: str = 'blocking', workers: int = 1,
+                    restart: bool = False, chunk_size: int = CHUNK_SIZE,
+                    **index_options) -> int:
+    """
+    Пересчитывает product_matches для всех товаров source_store
+
+    Args:
+        candidates: генератор кандидатов из matching.CANDIDATE_INDEXES
+        workers: количество процессов (1 - без пула)
+        restart: не продолжать прерванный пересчёт, начать заново
+        index_options: параметры индекса (bands/rows для lsh)
+
+    Returns:
+        количество обработанных товаров
+    """
+    source_conn = connect_store(source_store)
+    target_conn = connect_store(target_store)
+    if not source_conn or not target_conn:
+        print(f"[SKIP] Нет базы для {source_store} -> {target_store}")
+        for conn in (source_conn, target_conn):
+            if conn:
+                conn.close()
+        return 0
+    target_conn.close()
+
+    started = time.time()
+    label = f"{source_store} -> {target_store}"
+    source_db = STORE_DATABASES[source_store]
+    run_started_at, chunks, chunks_total = _load_checkpoint(source_conn, target_store,
+                                                            restart, chunk_size)
+    chunk_ends = dict(chunks)
+    total = sum(
+        source_conn.execute(f'SELECT COUNT(*) FROM products WHERE {_chunk_range_sql()}',
+                            (start, end, end)).fetchone()[0]
+        for start, end in chunks
+    )
+
+    # Снимок каталога другого магазина - в главном процессе до запуска воркеров
+    target_db = STORE_DATABASES[target_store]
+    key = (target_db, candidates, tuple(sorted(index_options.items())), db_file_signature(target_db))
+    _init_snapshot(key)
+
+    tasks = [(source_db, start, end, target_store, top_n, run_started_at) for start, end in chunks]
+    done = matches = 0
+    chunks_done = chunks_total - len(chunks)
+
+    def save(result):
+        nonlocal done, matches, chunks_done
+        chunk_start, match_rows, computed_rows = result
+        _write_chunk(source_conn, target_store, chunk_start, chunk_ends[chunk_start],
+                     match_rows, computed_rows)
+        done += len(computed_rows)
+        matches += len(match_rows)
+        chunks_done += 1
+        _print_progress(label, done, total, chunks_done, chunks_total, started)
+
+    try:
+        if workers <= 1 or len(tasks) <= 1:
+            for task in tasks:
+                save(_match_chunk(*task))
+        else:
+            # fork отдаёт воркерам готовый снимок без копирования
+            context = None
+            if 'fork' in multiprocessing.get_all_start_methods():
+                context = multiprocessing.get_context('fork')
+            pool = ProcessPoolExecutor(max_workers=workers, mp_context=context,
+                                       initializer=_init_snapshot, initargs=(key,))
+            try:
+                futures = [pool.submit(_match_chunk, *task) for task in tasks]
+                for future in as_completed(futures):
+                    save(future.result())
+            except BaseException:
+                pool.shutdown(wait=False, cancel_futures=True)
+                raise
+            pool.shutdown()
+    except KeyboardInterrupt:
+        source_conn.close()
+        print(f"\n[!] Прервано: сохранено чанков {chunks_done}/{chunks_total}, "
+              f"повторный запуск продолжит пересчёт")
+        raise
+
+    _finish_run(source_conn, target_store)
+    source_conn.close()
+
+    print(f"\n[OK] {label}: {done} товаров, {matches} сопоставлений "
+          f"за {time.time() - started:.1f} сек")
+    return done
+
+
+def update_all_matches(top_n: int = MATCHES_TOP_N, candidates: str = 'blocking',
+                       workers: int = MATCH_WORKERS, restart: bool = True,
+                       **index_options):
+    """Пересчёт сопоставлений в обе стороны (после скрапинга)"""
+    for source_store in ('5ka', 'magnit'):
+        compute_matches(source_store, other_store(source_store), top_n, candidates,
+                        workers=workers, restart=restart, **index_options)
+
+
+def main():
+    """Точка входа"""
+    parser = argparse.ArgumentParser(description='Сопоставление товаров между магазинами')
+    parser.add_argument('--source', choices=list(STORE_DATABASES),
+                        help='Только товары этого магазина (по умолчанию - обе стороны)')
+    parser.add_argument('--top', type=int, default=MATCHES_TOP_N,
+                        help=f'Сколько аналогов хранить на товар (по умолчанию {MATCHES_TOP_N})')
+    parser.add_argument('--workers', type=int, default=MATCH_WORKERS,
+                        help=f'Количество процессов (по умолчанию {MATCH_WORKERS})')
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE,
+                        help=f'Товаров в чанке (по умолчанию {CHUNK_SIZE})')
+    parser.add_argument('--restart', action='store_true',
+                        help='Начать заново, не продолжая прерванный пересчёт')
+    parser.add_argument('--candidates', choices=list(CANDIDATE_INDEXES), default='blocking',
+                        help='Генератор кандидатов (по умолчанию blocking)')
+    parser.add_argument('--bands', type=int, help='LSH: количество полос')
+    parser.add_argument('--rows', type=int, help='LSH: хешей в полосе')
+    args = parser.parse_args()
+
+    index_options = {}
+    if args.candidates == 'lsh':
+        if args.bands:
+            index_options['bands'] = args.bands
+        if args.rows:
+            index_options['rows'] = args.rows
+
+    stores = [args.source] if args.source else ['5ka', 'magnit']
+    started = time.time()
+    try:
+        for source_store in stores:
+            compute_matches(source_store, other_store(source_store), args.top, args.candidates,
+                            workers=args.workers, restart=args.restart,
+                            chunk_size=args.chunk_size, **index_options)
+    except KeyboardInterrupt:
+        sys.exit(1)
+
+    print(f"[OK] Готово за {time.time() - started:.1f} сек")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+"""
+Постраничный вывод каталога магазина без OFFSET
+
+Страница выбирается по ключу (keyset): значение колонки сортировки
+и product_id последнего (или первого) товара соседней страницы.
+Состояние передаётся непрозрачным токеном курсора (base64 от JSON),
+поэтому глубокие страницы больших категорий не требуют пропуска
+всех предыдущих строк.
+
+Порядок - как у ORDER BY <колонка>, product_id в SQLite:
+при сортировке по возрастанию товары с NULL идут первыми,
+по убыванию - последними.
+
+Количество товаров берётся из сводки магазина (store_summary.py).
+"""
+
+import base64
+import binascii
+import json
+from typing import Dict, List, Optional, Tuple
+
+# Колонки, по которым можно сортировать каталог
+SORT_COLUMNS = ['name', 'current_price', 'last_updated', 'category', 'min_price', 'max_price', 'rating']
+
+# Направления курсора
+CURSOR_FORWARD = 'f'   # товары после якоря
+CURSOR_BACKWARD = 'b'  # товары перед якорем
+CURSOR_LAST = 'e'      # последняя страница
+
+
+# ============================================================================
+# ТОКЕНЫ КУРСОРА
+# ============================================================================
+
+def encode_cursor(sort: str, order: str, page: int, direction: str,
+                  anchor: Optional[Tuple] = None, skip: int = 0) -> str:
+    """Непрозрачный токен курсора для ссылки на страницу"""
+    data = {'s': sort, 'o': order, 'p': page, 'd': direction, 'k': skip}
+    if anchor is not None:
+        data['a'] = list(anchor)
+    raw = json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(token: str) -> Optional[Dict]:
+    """Разбор токена курсора. None если токен повреждён"""
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        data = json.loads(raw.decode('utf-8'))
+    except (binascii.Error, ValueError, UnicodeDecodeError):
+        return None
+
+    if not isinstance(data, dict) or data.get('d') not in (CURSOR_FORWARD, CURSOR_BACKWARD, CURSOR_LAST):
+        return None
+    if data.get('s') not in SORT_COLUMNS or data.get('o') not in ('asc', 'desc'):
+        return None
+    if not isinstance(data.get('p'), int) or not isinstance(data.get('k'), int):
+        return None
+    if data['p'] < 1 or data['k'] < 0:
+        return None
+
+    anchor = data.get('a')
+    if data['d'] != CURSOR_LAST:
+        if not isinstance(anchor, list) or len(anchor) != 2 or not isinstance(anchor[1], str):
+            return None
+        data['a'] = tuple(anchor)
+    return data
+
+
+# ============================================================================
+# ВЫБОРКА СТРАНИЦЫ
+# ============================================================================
+
+def _scan(conn, where: str, params: list, column: str, descending: bool,
+          anchor: Optional[Tuple], limit: int) -> List:
+    """
+    Первые limit товаров в порядке ORDER BY column, product_id
+    (по убыванию при descending) строго после якоря (значение, product_id).
+
+    NULL в колонке сортировки не сравнивается через row values, поэтому
+    товары с NULL и без NULL выбираются отдельными запросами по очереди.
+    """
+    direction = 'DESC' if descending else 'ASC'
+    compare = '<' if descending else '>'
+
+    null_segment = (f'{column} IS NULL', [])
+    value_segment = (f'{column} IS NOT NULL', [])
+
+    if anchor is None:
+        segments = [value_segment, null_segment] if descending else [null_segment, value_segment]
+    elif anchor[0] is None:
+        null_after = (f'{column} IS NULL AND product_id {compare} ?', [anchor[1]])
+        segments = [null_after] if descending else [null_after, value_segment]
+    else:
+        value_after = (f'({column}, product_id) {compare} (?, ?)', list(anchor))
+        segments = [value_after, null_segment] if descending else [value_after]
+
+    rows = []
+    for condition, condition_params in segments:
+        if len(rows) >= limit:
+            break
+        rows += conn.execute(
+            f'SELECT * FROM products WHERE {where} AND {condition} '
+            f'ORDER BY {column} {direction}, product_id {direction} LIMIT ?',
+            params + condition_params + [limit - len(rows)]
+        ).fetchall()
+    return rows
+
+
+def fetch_page(conn, category: str, sort: str, order: str, per_page: int,
+               cursor: Optional[Dict] = None, page: int = 1,
+               total: int = 0) -> List[Dict]:
+    """
+    Товары одной страницы каталога
+
+    Args:
+        cursor: разобранный токен (decode_cursor) или None
+        page: номер страницы без курсора (старые ссылки ?page=N, через OFFSET)
+        total: количество товаров - нужно для последней страницы
+    """
+    where = 'category = ?' if category else '1=1'
+    params = [category] if category else []
+    descending = order == 'desc'
+
+    if cursor is None:
+        skip = (page - 1) * per_page
+        rows = _scan(conn, where, params, sort, descending, None, skip + per_page)[skip:]
+    elif cursor['d'] == CURSOR_FORWARD:
+        skip = cursor['k']
+        rows = _scan(conn, where, params, sort, descending, cursor['a'], skip + per_page)[skip:]
+    elif cursor['d'] == CURSOR_BACKWARD:
+        # Идём от якоря в обратном порядке и разворачиваем
+        skip = cursor['k']
+        rows = _scan(conn, where, params, sort, not descending, cursor['a'], skip + per_page)[skip:]
+        rows.reverse()
+    else:
+        last_page_size = total - (total - 1) // per_page * per_page if total else per_page
+        rows = _scan(conn, where, params, sort, not descending, None, last_page_size)
+        rows.reverse()
+
+    return [dict(row) for row in rows]
+
+
+def page_cursors(products: List[Dict], sort: str, order: str, page: int,
+                 total_pages: int, per_page: int) -> Dict[int, Optional[str]]:
+    """
+    Токены для ссылок на соседние страницы (page +- 2), первую и последнюю.
+    Для первой страницы токен не нужен (None).
+    """
+    cursors = {1: None}
+    if not products:
+        return cursors
+
+    first = (products[0][sort], products[0]['product_id'])
+    last = (products[-1][sort], products[-1]['product_id'])
+
+    for target in range(max(2, page - 2), min(total_pages, page + 2) + 1):
+        if target > page:
+            cursors[target] = encode_cursor(sort, order, target, CURSOR_FORWARD,
+                                            last, (target - page - 1) * per_page)
+        elif target < page:
+            cursors[target] = encode_cursor(sort, order, target, CURSOR_BACKWARD,
+                                            first, (page - target - 1) * per_page)
+    if total_pages > 1:
+        cursors[total_pages] = encode_cursor(sort, order, total_pages, CURSOR_LAST)
+    return cursors
@@ -41,15 +41,75 @@ DATABASES = {
     }
 }
 
+# Настройки соединений SQLite (db_pool.py)
+SQLITE_MMAP_SIZE = int(os.environ.get('SQLITE_MMAP_SIZE', 256 * 1024 * 1024))  # байт
+SQLITE_CACHE_SIZE_KB = int(os.environ.get('SQLITE_CACHE_SIZE_KB', 16 * 1024))  # на соединение
+SQLITE_BUSY_TIMEOUT_MS = 5000
+
+# ============================================================================
+# СКРАПЕРЫ
+# ============================================================================
+
+# Браузеров при параллельном обходе категорий (scraper_pool.py, --workers)
+SCRAPER_WORKERS = int(os.environ.get('SCRAPER_WORKERS', 3))
+
+# Потолок запросов к сайту на все браузеры вместе:
+# загрузки страниц, прокрутки и клики "Показать ещё" в секунду
+SCRAPER_MAX_REQUESTS_PER_SECOND = float(os.environ.get('SCRAPER_MAX_REQUESTS_PER_SECOND', 2.0))
+
+# ============================================================================
+# ПОИСК
+# ============================================================================
+
+# Движок поиска товаров:
+#   'index' - in-memory инвертированный индекс (поиск подстрок)
+#   'fts5'  - SQLite FTS5 (поиск по префиксам слов, пагинация в SQL)
+SEARCH_BACKEND = os.environ.get('SEARCH_BACKEND', 'index')
+
+# ============================================================================
+# СОПОСТАВЛЕНИЕ ТОВАРОВ
+# ============================================================================
+
+# MinHash/LSH: сигнатура из LSH_BANDS * LSH_ROWS хешей.
+# Больше полос - выше полнота, больше строк в полосе - меньше кандидатов.
+LSH_BANDS = 32
+LSH_ROWS = 2
+
+# Шинглы из N подряд идущих слов названия (1 - отдельные слова)
+LSH_SHINGLE_SIZE = 1
+
+# Процессов для пакетного сопоставления (bulk_matching.py)
+MATCH_WORKERS = int(os.environ.get('MATCH_WORKERS', os.cpu_count() or 1))
+
 # ============================================================================
 # УВЕДОМЛЕНИЯ
 # ============================================================================
 
-# Интервал проверки цен (в секундах)
+# Интервал полной проверки подписок в режиме демона (в секундах)
 PRICE_CHECK_INTERVAL = 3600  # 1 час
 
+# Интервал чтения событий изменения цены (price_events) в режиме демона
+PRICE_EVENTS_POLL_INTERVAL = 60  # 1 минута
+
 # Минимальная разница цены для уведомления (в рублях)
 MIN_PRICE_DIFFERENCE = 1.0
 
-# Максимум уведомлений в день на пользователя
+# Максимум уведомлений в день на пользователя (сообщений; сводка - одно
+# сообщение на страницу)
 MAX_DAILY_NOTIFICATIONS = 50
+
+# Сводка: несколько снижений цен за одну проверку - одним сообщением
+# (по страницам) в чат вместо сообщения на каждый товар
+NOTIFICATION_DIGEST = True
+DIGEST_MIN_ITEMS = 2  # товаров, начиная с которых отправляется сводка
+
+# Отправка уведомлений (telegram_delivery.py): лимиты Bot API
+TELEGRAM_GLOBAL_RATE = 30        # сообщений в секунду на бота
+TELEGRAM_PER_CHAT_RATE = 1.0     # сообщений в секунду в один чат
+TELEGRAM_SEND_CONCURRENCY = 16   # одновременных запросов к Bot API
+
+# Очередь уведомлений (notification_outbox.py): повторы после ошибок отправки
+OUTBOX_MAX_ATTEMPTS = 8      # попыток до состояния failed
+OUTBOX_RETRY_BASE = 30       # секунд до первого повтора, дальше вдвое больше
+OUTBOX_RETRY_MAX = 3600      # максимальная пауза между попытками
+OUTBOX_POLL_INTERVAL = 5     # проверка очереди в режиме демона (секунды)
@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+"""
+Пул соединений SQLite
+
+Для каждой базы и режима (чтение / запись) в каждом потоке держится
+несколько готовых соединений с настроенными PRAGMA: WAL, mmap_size,
+cache_size, temp_store=memory, busy_timeout. Соединение, полученное
+из пула, закрывается как обычно (conn.close()) - при этом оно
+возвращается в пул, а не закрывается по-настоящему.
+
+Соединения только для чтения открываются в режиме mode=ro.
+Раз в HEALTH_CHECK_INTERVAL секунд соединение проверяется перед
+выдачей: файл базы на месте (тот же inode) и SELECT 1 проходит.
+
+Используется веб-приложением (app.get_db), auth.get_users_db,
+notification_service и telegram_bot.
+"""
+
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Optional
+
+try:
+    from config import SQLITE_MMAP_SIZE, SQLITE_CACHE_SIZE_KB, SQLITE_BUSY_TIMEOUT_MS
+except ImportError:
+    SQLITE_MMAP_SIZE = 256 * 1024 * 1024
+    SQLITE_CACHE_SIZE_KB = 16 * 1024
+    SQLITE_BUSY_TIMEOUT_MS = 5000
+
+# Свободных соединений на поток и базу
+MAX_IDLE_PER_THREAD = 4
+
+# Интервал проверки соединения перед выдачей (секунды)
+HEALTH_CHECK_INTERVAL = 30
+
+
+class PooledConnection(sqlite3.Connection):
+    """Соединение, которое при close() возвращается в свой пул"""
+
+    _pool = None
+    _inode = None
+    _checked_at = 0.0
+
+    def close(self):
+        pool = self._pool
+        if pool is None or not pool.release(self):
+            self.close_connection()
+
+    def close_connection(self):
+        """Закрыть соединение по-настоящему"""
+        self._pool = None
+        super().close()
+
+
+class ConnectionPool:
+    """Пул соединений одной базы в одном режиме"""
+
+    def __init__(self, db_path: str, readonly: bool = False, must_exist: bool = True):
+        self.db_path = db_path
+        self.readonly = readonly
+        self.must_exist = must_exist
+        self._local = threading.local()
+
+    def _idle(self):
+        idle = getattr(self._local, 'idle', None)
+        if idle is None:
+            idle = self._local.idle = []
+        return idle
+
+    def _file_inode(self) -> Optional[int]:
+        try:
+            return os.stat(self.db_path).st_ino
+        except OSError:
+            return None
+
+    def _open(self) -> Optional[PooledConnection]:
+        inode = self._file_inode()
+        if inode is None and (self.must_exist or self.readonly):
+            return None
+
+        if self.readonly:
+            conn = sqlite3.connect(f'file:{self.db_path}?mode=ro', uri=True,
+                                   factory=PooledConnection)
+        else:
+            conn = sqlite3.connect(self.db_path, factory=PooledConnection)
+            # WAL сохраняется в файле базы - читатели не блокируют запись
+            conn.execute('PRAGMA journal_mode=WAL')
+            inode = self._file_inode()
+
+        conn.execute(f'PRAGMA busy_timeout = {SQLITE_BUSY_TIMEOUT_MS}')
+        conn.execute(f'PRAGMA mmap_size = {SQLITE_MMAP_SIZE}')
+        conn.execute(f'PRAGMA cache_size = -{SQLITE_CACHE_SIZE_KB}')
+        conn.execute('PRAGMA temp_store = MEMORY')
+        conn.row_factory = sqlite3.Row
+
+        conn._pool = self
+        conn._inode = inode
+        conn._checked_at = time.monotonic()
+        return conn
+
+    def _healthy(self, conn: PooledConnection) -> bool:
+        now = time.monotonic()
+        if now - conn._checked_at < HEALTH_CHECK_INTERVAL:
+            return True
+        if self._file_inode() != conn._inode:
+            # Файл базы удалён или заменён
+            return False
+        try:
+            conn.execute('SELECT 1').fetchone()
+        except sqlite3.Error:
+            return False
+        conn._checked_at = now
+        return True
+
+    def connect(self) -> Optional[PooledConnection]:
+        """
+        Соединение из пула текущего потока или новое.
+        None если файла базы нет.
+        """
+        idle = self._idle()
+        while idle:
+            conn = idle.pop()
+            if self._healthy(conn):
+                return conn
+            conn.close_connection()
+        return self._open()
+
+    def release(self, conn: PooledConnection) -> bool:
+        """Вернуть соединение в пул (False - пул полон, соединение надо закрыть)"""
+        idle = self._idle()
+        if len(idle) >= MAX_IDLE_PER_THREAD:
+            return False
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            return False
+        conn.row_factory = sqlite3.Row
+        idle.append(conn)
+        return True
+
+
+# Пулы по (путь к базе, только чтение)
+_pools: Dict[tuple, ConnectionPool] = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(db_path: str, readonly: bool = False, must_exist: bool = True) -> ConnectionPool:
+    """Пул для базы (создаётся при первом обращении)"""
+    key = (db_path, readonly)
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = ConnectionPool(db_path, readonly=readonly, must_exist=must_exist)
+            _pools[key] = pool
+        return pool
+
+
+def connect(db_path: str, readonly: bool = False, must_exist: bool = True) -> Optional[PooledConnection]:
+    """Соединение с базой из пула текущего потока"""
+    return get_pool(db_path, readonly, must_exist).connect()
@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+"""
+MinHash/LSH индекс для поиска почти одинаковых названий товаров
+
+Название раскладывается на шинглы из слов (extract_words без стоп-слов,
+как в Jaccard-компоненте скоринга). MinHash-сигнатура из bands * rows
+хешей режется на bands полос по rows значений; товары с совпадающей
+полосой попадают в кандидаты. Вероятность попасть в кандидаты для пары
+с Jaccard-сходством s равна 1 - (1 - s^rows)^bands.
+
+Используется как генератор кандидатов для точных аналогов в другом
+магазине и для пакетного сопоставления (python matching.py --candidates lsh).
+Сравнение с полным перебором: python -m benchmarks.lsh_recall
+"""
+
+import random
+import zlib
+from collections import defaultdict
+from typing import Dict, List, Set, Tuple
+
+from product_attributes import ProductAttributes, STOP_WORDS
+from text_utils import extract_words
+
+try:
+    from config import LSH_BANDS, LSH_ROWS, LSH_SHINGLE_SIZE
+except ImportError:
+    LSH_BANDS = 32
+    LSH_ROWS = 2
+    LSH_SHINGLE_SIZE = 1
+
+# Простое число Мерсенна для универсального хеширования
+_MERSENNE_PRIME = (1 << 61) - 1
+
+
+def word_shingles(words: List[str], size: int = 1) -> Set[str]:
+    """
+    Шинглы из значимых слов названия.
+    Если слов меньше size - один шингл из всех слов.
+    """
+    words = [word for word in words if word not in STOP_WORDS]
+    if size <= 1:
+        return set(words)
+    if len(words) <= size:
+        return {' '.join(words)} if words else set()
+    return {' '.join(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+
+class MinHashLSH:
+    """
+    LSH-индекс каталога одного магазина.
+    Элементы каталога - объекты с полями name_normalized и words
+    (matching.CatalogItem).
+    """
+
+    def __init__(self, catalog: List, bands: int = LSH_BANDS, rows: int = LSH_ROWS,
+                 shingle_size: int = LSH_SHINGLE_SIZE, seed: int = 1):
+        self.catalog = catalog
+        self.bands = bands
+        self.rows = rows
+        self.shingle_size = shingle_size
+
+        rng = random.Random(seed)
+        self._permutations = [
+            (rng.randrange(1, _MERSENNE_PRIME), rng.randrange(0, _MERSENNE_PRIME))
+            for _ in range(bands * rows)
+        ]
+        # Шинглы часто повторяются между товарами - кэшируем их хеши
+        self._hash_cache: Dict[str, Tuple[int, ...]] = {}
+        self._buckets: Dict[Tuple, List[int]] = defaultdict(list)
+
+        for position, item in enumerate(catalog):
+            for key in self._band_keys(self._shingles(item.name_normalized, item.words)):
+                self._buckets[key].append(position)
+
+    def __len__(self):
+        return len(self.catalog)
+
+    def _shingles(self, name_normalized: str, words: List[str] = None) -> Set[str]:
+        if words is None:
+            words = extract_words(name_normalized)
+        return word_shingles(words, self.shingle_size)
+
+    def _shingle_hashes(self, shingle: str) -> Tuple[int, ...]:
+        hashes = self._hash_cache.get(shingle)
+        if hashes is None:
+            x = zlib.crc32(shingle.encode('utf-8'))
+            hashes = tuple((a * x + b) % _MERSENNE_PRIME for a, b in self._permutations)
+            self._hash_cache[shingle] = hashes
+        return hashes
+
+    def signature(self, shingles: Set[str]) -> Tuple[int, ...]:
+        """MinHash-сигнатура множества шинглов"""
+        return tuple(map(min, zip(*(self._shingle_hashes(s) for s in shingles))))
+
+    def _band_keys(self, shingles: Set[str]) -> List[Tuple]:
+        if not shingles:
+            return []
+        signature = self.signature(shingles)
+        rows = self.rows
+        return [(band, signature[band * rows:(band + 1) * rows]) for band in range(self.bands)]
+
+    def positions(self, name_normalized: str, attrs: ProductAttributes = None,
+                  words: List[str] = None) -> List[int]:
+        """Позиции в каталоге товаров, совпавших хотя бы в одной полосе (по возрастанию)"""
+        positions = set()
+        for key in self._band_keys(self._shingles(name_normalized, words)):
+            bucket = self._buckets.get(key)
+            if bucket:
+                positions.update(bucket)
+        return sorted(positions)
+
+    def candidates(self, name_normalized: str, attrs: ProductAttributes = None,
+                   words: List[str] = None) -> List:
+        """
+        Товары, совпавшие с исходным хотя бы в одной полосе.
+        Порядок совпадает с порядком каталога, как при полном переборе.
+        """
+        return [self.catalog[position] for position in self.positions(name_normalized, attrs, words)]
@@ -0,0 +1,468 @@
+# -*- coding: utf-8 -*-
+"""
+Сопоставление товаров между магазинами
+
+Скоринг похожести, отбор кандидатов и чтение таблицы product_matches:
+для каждого товара Пятёрочки и Магнита хранятся top-N аналогов из
+другого магазина. Таблицу пересчитывает bulk_matching.py после каждого
+скрапинга, а страница товара и /api/compare читают её одним запросом
+по индексу.
+"""
+
+import os
+import sqlite3
+import threading
+import weakref
+from typing import Dict, List, Optional, Set
+
+from product_attributes import (
+    ProductAttributes, STOP_WORDS, parse_product_attributes, stem_russian,
+    pop_attributes, ATTRIBUTE_COLUMNS_SQL, ATTRIBUTES_JOIN_SQL
+)
+from batch_scoring import CatalogArrays, numpy_available
+from blocking import BlockingIndex
+from lsh import MinHashLSH
+from store_db import STORE_DATABASES, ensure_store_schema, db_file_signature
+from text_utils import normalize_text, tokenize_query, extract_words, split_tokens
+
+# Сколько аналогов хранить для каждого товара
+MATCHES_TOP_N = 6
+
+# Минимальный порог релевантности
+MIN_SIMILARITY_SCORE = 20
+
+# Высокий скор = точный аналог
+EXACT_MATCH_SCORE = 70
+
+
+def other_store(store_id: str) -> str:
+    """Магазин для сравнения цен"""
+    return 'magnit' if store_id == '5ka' else '5ka'
+
+
+# ============================================================================
+# СКОРИНГ ПОХОЖЕСТИ
+# ============================================================================
+
+def calculate_similarity_score(attrs1: ProductAttributes, attrs2: ProductAttributes,
+                                name1: str, name2: str,
+                                name1_normalized: str = None, name2_normalized: str = None,
+                                words1: List[str] = None, words2: List[str] = None) -> int:
+    """
+    Вычисляет оценку похожести товаров от 0 до 100.
+    Чем выше - тем более похожие товары.
+    
+    Нормализованные названия и слова можно передать готовыми
+    (колонки products.name_normalized и products.tokens).
+    """
+    score = 0
+    
+    # Нормализуем названия
+    name1_norm = name1_normalized if name1_normalized is not None else normalize_text(name1)
+    name2_norm = name2_normalized if name2_normalized is not None else normalize_text(name2)
+    
+    # Извлекаем слова (минимум 3 буквы)
+    words1 = set(words1 if words1 is not None else extract_words(name1_norm))
+    words2 = set(words2 if words2 is not None else extract_words(name2_norm))
+    words1 -= STOP_WORDS
+    words2 -= STOP_WORDS
+    
+    # Получаем первое значимое слово (обычно это тип продукта)
+    first_word1 = name1_norm.split()[0] if name1_norm else ""
+    first_word2 = name2_norm.split()[0] if name2_norm else ""
+    
+    # 1. Первое слово (тип продукта) - самый важный критерий
+    first_word_match = False
+    if first_word1 and first_word2:
+        if first_word1 == first_word2:
+            score += 35
+            first_word_match = True
+        elif stem_russian(first_word1) == stem_russian(first_word2):
+            score += 30
+            first_word_match = True
+        elif first_word1 in first_word2 or first_word2 in first_word1:
+            score += 25  # Одно слово содержит другое
+            first_word_match = True
+    
+    # Если первые слова совсем не совпадают, проверяем product_type
+    if not first_word_match and attrs1.product_type and attrs2.product_type:
+        if attrs1.product_type == attrs2.product_type:
+            score += 30
+            first_word_match = True
+        elif stem_russian(attrs1.product_type) == stem_russian(attrs2.product_type):
+            score += 25
+            first_word_match = True
+    
+    # Если нет совпадения по типу/первому слову - товары не похожи
+    if not first_word_match:
+        # Но даём шанс если много общих слов
+        common_words = words1 & words2
+        if len(common_words) >= 2:
+            score += 20  # Бонус за общие слова
+        else:
+            return 0
+    
+    # 2. Бренд (очень важно для сравнения цен!)
+    if attrs1.brand and attrs2.brand:
+        if attrs1.brand.lower() == attrs2.brand.lower():
+            score += 35  # Тот же бренд - большой бонус
+        else:
+            score += 5   # Разные бренды - минимальный бонус
+    elif attrs1.brand or attrs2.brand:
+        score += 3  # У одного есть бренд, у другого нет
+    else:
+        score += 10  # Оба без бренда - возможно базовые продукты
+    
+    # 3. Объём/вес (важно для корректного сравнения)
+    if attrs1.volume_ml and attrs2.volume_ml:
+        ratio = min(attrs1.volume_ml, attrs2.volume_ml) / max(attrs1.volume_ml, attrs2.volume_ml)
+        if ratio > 0.95:
+            score += 12
+        elif ratio > 0.8:
+            score += 8
+        elif ratio > 0.5:
+            score += 4
+    elif attrs1.weight_g and attrs2.weight_g:
+        ratio = min(attrs1.weight_g, attrs2.weight_g) / max(attrs1.weight_g, attrs2.weight_g)
+        if ratio > 0.95:
+            score += 12
+        elif ratio > 0.8:
+            score += 8
+        elif ratio > 0.5:
+            score += 4
+    
+    # 4. Жирность (для молочки)
+    if attrs1.fat_percent and attrs2.fat_percent:
+        if abs(attrs1.fat_percent - attrs2.fat_percent) < 0.5:
+            score += 8
+        elif abs(attrs1.fat_percent - attrs2.fat_percent) < 1.5:
+            score += 4
+    
+    # 5. Пересечение слов в названии (fuzzy matching)
+    if words1 and words2:
+        intersection = len(words1 & words2)
+        union = len(words1 | words2)
+        if union > 0:
+            jaccard = intersection / union
+            score += int(jaccard * 15)  # До 15 баллов за совпадение слов
+    
+    return min(score, 100)
+
+
+# ============================================================================
+# КАТАЛОГ И ПОИСК ПОХОЖИХ
+# ============================================================================
+
+class CatalogItem:
+    """
+    Товар каталога для сравнения.
+    Строка products разбирается (атрибуты, слова) только при первом
+    обращении - в кандидаты попадает малая часть каталога.
+    """
+    __slots__ = ('row', 'product_id', 'name_normalized', '_parsed')
+    
+    def __init__(self, row):
+        self.row = row
+        self.product_id = row['product_id']
+        self.name_normalized = row['name_normalized'] or normalize_text(row['name'])
+        self._parsed = None
+    
+    def _parse(self):
+        product = dict(self.row)
+        attrs, price_per_unit = pop_attributes(product)
+        product['name_normalized'] = self.name_normalized
+        tokens = product.get('tokens')
+        words = split_tokens(tokens) if tokens is not None else None
+        self._parsed = (product, words, attrs, price_per_unit)
+        return self._parsed
+    
+    @property
+    def product(self) -> Dict:
+        return (self._parsed or self._parse())[0]
+    
+    @property
+    def words(self) -> Optional[List[str]]:
+        return (self._parsed or self._parse())[1]
+    
+    @property
+    def attrs(self) -> ProductAttributes:
+        return (self._parsed or self._parse())[2]
+    
+    @property
+    def price_per_unit(self) -> Optional[Dict]:
+        return (self._parsed or self._parse())[3]
+
+
+def load_catalog(conn) -> List[CatalogItem]:
+    """Все товары магазина с атрибутами из product_attributes"""
+    rows = conn.execute(
+        f"SELECT p.*, {ATTRIBUTE_COLUMNS_SQL} FROM products p {ATTRIBUTES_JOIN_SQL}"
+    ).fetchall()
+    return [CatalogItem(row) for row in rows]
+
+
+def build_search_terms(product_name: str, source_attrs: ProductAttributes,
+                       source_name_normalized: str) -> Set[str]:
+    """Поисковые термы для отбора кандидатов"""
+    source_words = set(tokenize_query(product_name))
+    search_terms = set()
+    
+    # 1. Все слова из названия (минимум 3 буквы)
+    for word in source_words:
+        if len(word) >= 3:
+            search_terms.add(word)
+            # Добавляем стемм
+            stemmed = stem_russian(word)
+            if len(stemmed) >= 3:
+                search_terms.add(stemmed)
+    
+    # 2. Тип продукта
+    if source_attrs.product_type:
+        search_terms.add(source_attrs.product_type.lower())
+        stemmed = stem_russian(source_attrs.product_type.lower())
+        if len(stemmed) >= 3:
+            search_terms.add(stemmed)
+    
+    # 3. Бренд
+    if source_attrs.brand:
+        search_terms.add(source_attrs.brand.lower())
+    
+    # Если нет терминов для поиска - берём первое слово названия
+    if not search_terms:
+        first_word = source_name_normalized.split()[0] if source_name_normalized else ""
+        if len(first_word) >= 3:
+            search_terms.add(first_word)
+    
+    return search_terms
+
+
+def score_candidates(candidates: List[CatalogItem], product_name: str,
+                     source_attrs: ProductAttributes, source_name_normalized: str,
+                     current_price: float, limit: int, scores: List[int] = None) -> List[Dict]:
+    """
+    Скоринг кандидатов. Возвращает товары с дополнительными полями:
+    similarity_score, price_diff, is_cheaper, is_exact_match, price_per_unit
+    
+    scores - готовые оценки кандидатов (векторный скоринг batch_scoring.py)
+    """
+    scored_candidates = []
+    for i, item in enumerate(candidates):
+        if scores is not None:
+            score = scores[i]
+        else:
+            score = calculate_similarity_score(
+                source_attrs, item.attrs, product_name, item.product['name'],
+                name1_normalized=source_name_normalized,
+                name2_normalized=item.name_normalized,
+                words2=item.words
+            )
+        
+        if score > MIN_SIMILARITY_SCORE:
+            scored_candidates.append((score, item))
+    
+    # Сортируем: сначала по скору, потом по цене
+    scored_candidates.sort(key=lambda x: (-x[0], x[1].row['current_price'] or 0))
+    
+    # Полные словари - только для попавших в выдачу
+    results = []
+    for score, item in scored_candidates[:limit]:
+        cand_price = item.product.get('current_price', 0) or 0
+        price_diff = cand_price - current_price if current_price else 0
+        
+        results.append({
+            **item.product,
+            'similarity_score': score,
+            'price_diff': price_diff,
+            'is_cheaper': price_diff < -0.01,
+            'is_exact_match': score >= EXACT_MATCH_SCORE,
+            # Нормализованная цена за единицу
+            'price_per_unit': item.price_per_unit,
+        })
+    
+    return results
+
+
+def find_similar_products(catalog: List[CatalogItem], product_name: str, product_id: str,
+                          current_price: float, source_attrs: ProductAttributes = None,
+                          limit: int = 6) -> List[Dict]:
+    """Поиск похожих товаров в каталоге: отбор по поисковым термам и скоринг"""
+    if source_attrs is None:
+        source_attrs = parse_product_attributes(product_name)
+    
+    source_name_normalized = normalize_text(product_name)
+    search_terms = build_search_terms(product_name, source_attrs, source_name_normalized)
+    
+    candidates = []
+    seen_ids = {product_id}  # Исключаем текущий товар
+    
+    for item in catalog:
+        if item.product_id in seen_ids:
+            continue
+        
+        # Проверяем совпадение с любым поисковым термом
+        if any(term in item.name_normalized for term in search_terms):
+            seen_ids.add(item.product_id)
+            candidates.append(item)
+    
+    return score_candidates(candidates, product_name, source_attrs, source_name_normalized,
+                            current_price, limit)
+
+
+# Генераторы кандидатов: блоки (полнота как у перебора) и MinHash/LSH
+# (почти одинаковые названия, меньше кандидатов)
+CANDIDATE_INDEXES = {
+    'blocking': BlockingIndex,
+    'lsh': MinHashLSH,
+}
+
+
+# Массивы для векторного скоринга по индексам каталогов
+_catalog_arrays = weakref.WeakKeyDictionary()
+_catalog_arrays_lock = threading.Lock()
+
+
+def get_catalog_arrays(index) -> Optional[CatalogArrays]:
+    """Массивы признаков каталога индекса или None без NumPy"""
+    if not numpy_available():
+        return None
+    with _catalog_arrays_lock:
+        arrays = _catalog_arrays.get(index)
+        if arrays is None:
+            arrays = CatalogArrays(index.catalog)
+            _catalog_arrays[index] = arrays
+        return arrays
+
+
+def find_similar_in_index(index, product_name: str, product_id: str,
+                          current_price: float, source_attrs: ProductAttributes = None,
+                          limit: int = 6) -> List[Dict]:
+    """
+    Поиск похожих товаров только среди кандидатов индекса (CANDIDATE_INDEXES).
+    С NumPy кандидаты скорятся векторно, результат тот же.
+    """
+    if source_attrs is None:
+        source_attrs = parse_product_attributes(product_name)
+    
+    source_name_normalized = normalize_text(product_name)
+    positions = index.positions(source_name_normalized, source_attrs)
+    
+    arrays = get_catalog_arrays(index)
+    if arrays is None:
+        candidates = [index.catalog[position] for position in positions]
+        return find_similar_products(candidates, product_name, product_id, current_price,
+                                     source_attrs=source_attrs, limit=limit)
+    
+    # Тот же отбор по поисковым термам, что и в find_similar_products
+    search_terms = build_search_terms(product_name, source_attrs, source_name_normalized)
+    catalog = index.catalog
+    positions = [
+        position for position in positions
+        if catalog[position].product_id != product_id
+        and any(term in catalog[position].name_normalized for term in search_terms)
+    ]
+    
+    scores = arrays.scores(positions, source_attrs, source_name_normalized).tolist()
+    return score_candidates([catalog[position] for position in positions], product_name,
+                            source_attrs, source_name_normalized, current_price, limit,
+                            scores=scores)
+
+
+# Индексы каталогов: (путь к базе, тип) -> (сигнатура файла, индекс)
+_catalog_indexes: Dict[tuple, tuple] = {}
+_catalog_indexes_lock = threading.Lock()
+
+
+def get_catalog_index(db_path: str, kind: str = 'blocking'):
+    """
+    Индекс кандидатов (CANDIDATE_INDEXES) для каталога магазина.
+    Перестраивается, когда меняется файл базы.
+    """
+    signature = db_file_signature(db_path)
+    if signature is None:
+        return None
+    
+    with _catalog_indexes_lock:
+        cached = _catalog_indexes.get((db_path, kind))
+        if cached and cached[0] == signature:
+            return cached[1]
+        
+        conn = sqlite3.connect(f'file:{db_path}?mode=ro', uri=True)
+        conn.row_factory = sqlite3.Row
+        try:
+            index = CANDIDATE_INDEXES[kind](load_catalog(conn))
+        finally:
+            conn.close()
+        _catalog_indexes[(db_path, kind)] = (signature, index)
+        return index
+
+
+# ============================================================================
+# ТАБЛИЦА PRODUCT_MATCHES
+# ============================================================================
+
+def connect_store(store_id: str):
+    """Соединение с базой магазина или None, если базы нет"""
+    db_file = STORE_DATABASES[store_id]
+    if not os.path.exists(db_file):
+        return None
+    conn = sqlite3.connect(db_file)
+    conn.row_factory = sqlite3.Row
+    ensure_store_schema(conn)
+    return conn
+
+
+def get_cross_store_matches(source_conn, target_conn, product_id: str, target_store: str,
+                            current_price: float, limit: int = MATCHES_TOP_N) -> Optional[List[Dict]]:
+    """
+    Готовые аналоги товара из product_matches
+
+    Цены и price_diff берутся актуальные из базы другого магазина.
+
+    Returns:
+        список в формате get_similar_products_v2 или None,
+        если для товара сопоставления ещё не считались
+    """
+    try:
+        rows = source_conn.execute('''
+            SELECT c.match_count, m.target_product_id, m.score, m.is_exact_match
+            FROM product_matches_computed c
+            LEFT JOIN product_matches m
+                ON m.product_id = c.product_id AND m.target_store = c.target_store
+            WHERE c.product_id = ? AND c.target_store = ?
+            ORDER BY m.rank
+            LIMIT ?
+        ''', (product_id, target_store, limit)).fetchall()
+    except sqlite3.OperationalError:
+        return None
+    
+    if not rows:
+        return None
+    
+    matches = [row for row in rows if row['target_product_id'] is not None]
+    if not matches:
+        return []
+    
+    placeholders = ','.join('?' * len(matches))
+    products = target_conn.execute(
+        f"SELECT p.*, {ATTRIBUTE_COLUMNS_SQL} FROM products p {ATTRIBUTES_JOIN_SQL} "
+        f"WHERE p.product_id IN ({placeholders})",
+        [row['target_product_id'] for row in matches]
+    ).fetchall()
+    items = {row['product_id']: CatalogItem(row) for row in products}
+    
+    results = []
+    for row in matches:
+        item = items.get(row['target_product_id'])
+        if not item:
+            continue
+        cand_price = item.product.get('current_price', 0) or 0
+        price_diff = cand_price - current_price if current_price else 0
+        results.append({
+            **item.product,
+            'similarity_score': row['score'],
+            'price_diff': price_diff,
+            'is_cheaper': price_diff < -0.01,
+            'is_exact_match': bool(row['is_exact_match']),
+            'price_per_unit': item.price_per_unit,
+        })
+    return results
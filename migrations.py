@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+"""
+Версионные миграции схемы SQLite
+
+Миграция - номер версии, описание и список SQL-выражений.
+Применённые версии записываются в таблицу schema_migrations
+той же базы. run_migrations применяет недостающие миграции
+в одной транзакции (BEGIN IMMEDIATE - параллельно запущенные
+приложение и скрапер не применят миграцию дважды) и печатает
+отчёт: применённые версии и изменившиеся планы горячих запросов
+(EXPLAIN QUERY PLAN до и после).
+
+Миграции баз магазинов - store_db.STORE_MIGRATIONS,
+базы пользователей - auth.USERS_MIGRATIONS.
+"""
+
+import os
+import sqlite3
+from datetime import datetime
+from typing import Dict, List, NamedTuple, Sequence, Tuple
+
+MIGRATIONS_SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS schema_migrations (
+        version INTEGER PRIMARY KEY,
+        description TEXT,
+        applied_at TIMESTAMP
+    )
+'''
+
+
+class Migration(NamedTuple):
+    """Миграция схемы"""
+    version: int
+    description: str
+    statements: Tuple[str, ...]
+
+
+# Горячие запросы для отчёта: {название: (SQL, параметры)}
+PlanQueries = Dict[str, Tuple[str, tuple]]
+
+
+def schema_version(conn) -> int:
+    """Текущая версия схемы (0 - миграции не применялись)"""
+    try:
+        row = conn.execute('SELECT MAX(version) FROM schema_migrations').fetchone()
+    except sqlite3.OperationalError:
+        return 0
+    return row[0] or 0
+
+
+def query_plans(conn, queries: PlanQueries) -> Dict[str, List[str]]:
+    """Планы запросов (строки detail из EXPLAIN QUERY PLAN)"""
+    plans = {}
+    for name, (sql, params) in queries.items():
+        try:
+            rows = conn.execute(f'EXPLAIN QUERY PLAN {sql}', params).fetchall()
+        except sqlite3.OperationalError as e:
+            plans[name] = [f'ошибка: {e}']
+            continue
+        plans[name] = [row[3] for row in rows]
+    return plans
+
+
+def _database_name(conn) -> str:
+    for row in conn.execute('PRAGMA database_list').fetchall():
+        if row[1] == 'main':
+            return os.path.basename(row[2]) or ':memory:'
+    return '?'
+
+
+def print_migration_report(database: str, old_version: int, applied: Sequence[Migration],
+                           plans_before: Dict[str, List[str]],
+                           plans_after: Dict[str, List[str]]):
+    """Отчёт о миграции: версии и изменившиеся планы запросов"""
+    print(f"[*] Миграции {database}: версия {old_version} -> {applied[-1].version}")
+    for migration in applied:
+        print(f"    {migration.version}. {migration.description}")
+
+    changed = [name for name in plans_after if plans_before.get(name) != plans_after[name]]
+    if not changed:
+        print("    Планы запросов не изменились")
+        return
+
+    print("    Изменившиеся планы запросов:")
+    for name in changed:
+        print(f"    - {name}")
+        print(f"        было:  {'; '.join(plans_before.get(name, []))}")
+        print(f"        стало: {'; '.join(plans_after[name])}")
+
+
+def run_migrations(conn, migrations: Sequence[Migration],
+                   plan_queries: PlanQueries = None) -> List[Migration]:
+    """
+    Применяет миграции с версией больше текущей
+
+    Returns:
+        список применённых миграций
+    """
+    latest = migrations[-1].version if migrations else 0
+    if schema_version(conn) >= latest:
+        return []
+
+    if conn.in_transaction:
+        conn.commit()
+    conn.execute(MIGRATIONS_SCHEMA)
+    conn.commit()
+
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        # Версию перечитываем под блокировкой записи
+        old_version = schema_version(conn)
+        pending = [m for m in migrations if m.version > old_version]
+        if not pending:
+            conn.rollback()
+            return []
+
+        plans_before = query_plans(conn, plan_queries) if plan_queries else {}
+        for migration in pending:
+            for statement in migration.statements:
+                conn.execute(statement)
+            conn.execute(
+                'INSERT INTO schema_migrations (version, description, applied_at) VALUES (?, ?, ?)',
+                (migration.version, migration.description, datetime.now())
+            )
+        plans_after = query_plans(conn, plan_queries) if plan_queries else {}
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+    print_migration_report(_database_name(conn), old_version, pending, plans_before, plans_after)
+    return pending
@@ -0,0 +1,258 @@
+# -*- coding: utf-8 -*-
+"""
+Очередь уведомлений (outbox) в базе пользователей
+
+Проверка цен не отправляет сообщения сама: уведомление вместе с
+обновлением подписки (last_price, last_notified_at) записывается в
+notification_outbox одной транзакцией. Отправляет очередь отдельный
+обработчик (notification_service.drain_outbox), поэтому медленный
+Telegram не задерживает проверку подписок.
+
+Состояния записи:
+    pending - ждёт отправки (не раньше next_attempt_at);
+    sending - взята обработчиком (claimed_by, claimed_at);
+    sent    - отправлена (отмечается один раз, сразу после ответа Telegram);
+    failed  - не отправлена за OUTBOX_MAX_ATTEMPTS попыток.
+
+Ошибка отправки - повтор с экспоненциальной задержкой. Пока обработчик
+работает, он продлевает claimed_at взятых записей (renew_claims раз в
+OUTBOX_RENEW_INTERVAL), как бы долго ни шла отправка пачки. Запись,
+оставшаяся в sending после падения обработчика, через
+OUTBOX_CLAIM_TIMEOUT снова становится pending. dedup_key уникален:
+одно и то же уведомление не попадает в очередь дважды.
+
+notification_daily_counts - сообщений в очереди на чат по дню
+отправки (для MAX_DAILY_NOTIFICATIONS). Сообщение сверх лимита дня
+ставится в очередь на следующий день: next_attempt_at - начало дня.
+"""
+
+import hashlib
+import uuid
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, NamedTuple, Optional
+
+try:
+    from config import OUTBOX_MAX_ATTEMPTS, OUTBOX_RETRY_BASE, OUTBOX_RETRY_MAX
+except ImportError:
+    OUTBOX_MAX_ATTEMPTS = 8
+    OUTBOX_RETRY_BASE = 30     # секунд до первого повтора
+    OUTBOX_RETRY_MAX = 3600    # не реже раза в час
+
+# Через сколько секунд запись в sending считается брошенной
+OUTBOX_CLAIM_TIMEOUT = 600
+
+# Как часто работающий обработчик продлевает взятые записи (секунды)
+OUTBOX_RENEW_INTERVAL = OUTBOX_CLAIM_TIMEOUT / 4
+
+# Записей, которые обработчик берёт за раз
+OUTBOX_BATCH = 500
+
+STATE_PENDING = 'pending'
+STATE_SENDING = 'sending'
+STATE_SENT = 'sent'
+STATE_FAILED = 'failed'
+
+OUTBOX_SCHEMA = [
+    '''
+    CREATE TABLE IF NOT EXISTS notification_outbox (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        alert_id INTEGER,
+        chat_id TEXT NOT NULL,
+        payload TEXT NOT NULL,
+        dedup_key TEXT UNIQUE NOT NULL,
+        state TEXT NOT NULL DEFAULT 'pending',
+        attempts INTEGER NOT NULL DEFAULT 0,
+        next_attempt_at TIMESTAMP NOT NULL,
+        claimed_by TEXT,
+        claimed_at TIMESTAMP,
+        last_error TEXT,
+        created_at TIMESTAMP,
+        sent_at TIMESTAMP
+    )
+    ''',
+    'CREATE INDEX IF NOT EXISTS idx_outbox_due ON notification_outbox(state, next_attempt_at)',
+    '''
+    CREATE TABLE IF NOT EXISTS notification_daily_counts (
+        chat_id TEXT NOT NULL,
+        day TEXT NOT NULL,
+        count INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (chat_id, day)
+    )
+    ''',
+]
+
+
+class OutboxEntry(NamedTuple):
+    """Уведомление для постановки в очередь"""
+    alert_id: int
+    chat_id: str
+    payload: str      # текст сообщения (HTML)
+    dedup_key: str
+    not_before: Optional[datetime] = None   # не отправлять раньше (None - сразу)
+
+
+def ensure_outbox_schema(conn):
+    """Создаёт таблицу очереди, если её ещё нет"""
+    for statement in OUTBOX_SCHEMA:
+        conn.execute(statement)
+    conn.commit()
+
+
+def dedup_key(alert_id: int, old_price: float, new_price: float, day: str) -> str:
+    """Ключ уведомления: подписка, изменение цены и день"""
+    return f"{alert_id}:{old_price:.2f}:{new_price:.2f}:{day}"
+
+
+def group_dedup_key(keys: List[str]) -> str:
+    """Ключ сообщения из нескольких уведомлений (страница сводки)"""
+    if len(keys) == 1:
+        return keys[0]
+    return 'digest:' + hashlib.sha1('|'.join(sorted(keys)).encode()).hexdigest()
+
+
+def retry_delay(attempts: int) -> float:
+    """Задержка перед следующей попыткой (секунды) после attempts неудачных"""
+    return min(OUTBOX_RETRY_MAX, OUTBOX_RETRY_BASE * 2 ** max(0, attempts - 1))
+
+
+def enqueue(conn, entries: Iterable[OutboxEntry]) -> int:
+    """
+    Поставить уведомления в очередь без commit (вызывающий коммитит
+    вместе с обновлением подписок). Повторы по dedup_key пропускаются.
+
+    Returns:
+        количество добавленных записей
+    """
+    now = datetime.now()
+    before = conn.total_changes
+    conn.executemany(
+        'INSERT OR IGNORE INTO notification_outbox '
+        '(alert_id, chat_id, payload, dedup_key, state, next_attempt_at, created_at) '
+        'VALUES (?, ?, ?, ?, ?, ?, ?)',
+        [(entry.alert_id, entry.chat_id, entry.payload, entry.dedup_key, STATE_PENDING,
+          entry.not_before or now, now)
+         for entry in entries]
+    )
+    return conn.total_changes - before
+
+
+def daily_counts(conn, chat_ids: Iterable[str], day: str) -> Dict[str, int]:
+    """Сообщений, уже поставленных в очередь на день: chat_id -> количество"""
+    chat_ids = list(chat_ids)
+    counts = {}
+    for start in range(0, len(chat_ids), 500):
+        chunk = chat_ids[start:start + 500]
+        counts.update(conn.execute(
+            f"SELECT chat_id, count FROM notification_daily_counts "
+            f"WHERE day = ? AND chat_id IN ({','.join('?' * len(chunk))})",
+            [day, *chunk]
+        ).fetchall())
+    return counts
+
+
+def add_daily_counts(conn, counts: Dict[str, int], day: str):
+    """Увеличить дневные счётчики сообщений без commit (вместе с enqueue)"""
+    conn.executemany(
+        'INSERT INTO notification_daily_counts (chat_id, day, count) VALUES (?, ?, ?) '
+        'ON CONFLICT(chat_id, day) DO UPDATE SET count = count + excluded.count',
+        [(chat_id, day, count) for chat_id, count in counts.items() if count]
+    )
+
+
+def new_claim() -> str:
+    """Метка обработчика для claimed_by"""
+    return uuid.uuid4().hex
+
+
+def claim_due(conn, limit: int = OUTBOX_BATCH, claim: Optional[str] = None) -> List[Dict]:
+    """
+    Взять записи, которым пора отправляться (pending -> sending).
+    Брошенные записи (sending дольше OUTBOX_CLAIM_TIMEOUT без
+    продления) сначала возвращаются в очередь. Каждый UPDATE атомарен,
+    поэтому два обработчика не возьмут одну запись.
+    
+    Args:
+        claim: метка обработчика (new_claim) - для renew_claims
+    """
+    now = datetime.now()
+    claim = claim or new_claim()
+    conn.execute(
+        'UPDATE notification_outbox SET state = ?, claimed_by = NULL '
+        'WHERE state = ? AND claimed_at < ?',
+        (STATE_PENDING, STATE_SENDING, now - timedelta(seconds=OUTBOX_CLAIM_TIMEOUT))
+    )
+    conn.execute(
+        'UPDATE notification_outbox SET state = ?, claimed_by = ?, claimed_at = ?, attempts = attempts + 1 '
+        'WHERE id IN (SELECT id FROM notification_outbox WHERE state = ? AND next_attempt_at <= ? '
+        'ORDER BY next_attempt_at, id LIMIT ?)',
+        (STATE_SENDING, claim, now, STATE_PENDING, now, limit)
+    )
+    rows = conn.execute(
+        'SELECT id, alert_id, chat_id, payload, attempts FROM notification_outbox '
+        'WHERE state = ? AND claimed_by = ? AND claimed_at = ? ORDER BY id',
+        (STATE_SENDING, claim, now)
+    ).fetchall()
+    conn.commit()
+    return [dict(row) for row in rows]
+
+
+def renew_claims(conn, claim: str) -> int:
+    """Продлить записи, взятые обработчиком и ещё не отправленные"""
+    renewed = conn.execute(
+        'UPDATE notification_outbox SET claimed_at = ? WHERE state = ? AND claimed_by = ?',
+        (datetime.now(), STATE_SENDING, claim)
+    ).rowcount
+    conn.commit()
+    return renewed
+
+
+def mark_sent(conn, entry_id: int) -> bool:
+    """Отметить отправку (только взятую запись - отметка одна)"""
+    updated = conn.execute(
+        'UPDATE notification_outbox SET state = ?, sent_at = ?, last_error = NULL '
+        'WHERE id = ? AND state = ?',
+        (STATE_SENT, datetime.now(), entry_id, STATE_SENDING)
+    ).rowcount
+    conn.commit()
+    return bool(updated)
+
+
+def mark_failed(conn, entry_id: int, attempts: int, error: str) -> str:
+    """
+    Неудачная попытка: повтор через retry_delay или failed,
+    если попытки кончились.
+
+    Returns:
+        новое состояние записи
+    """
+    if attempts >= OUTBOX_MAX_ATTEMPTS:
+        state, next_attempt_at = STATE_FAILED, datetime.now()
+    else:
+        state, next_attempt_at = STATE_PENDING, datetime.now() + timedelta(seconds=retry_delay(attempts))
+    conn.execute(
+        'UPDATE notification_outbox SET state = ?, next_attempt_at = ?, last_error = ?, claimed_by = NULL '
+        'WHERE id = ? AND state = ?',
+        (state, next_attempt_at, error[:500], entry_id, STATE_SENDING)
+    )
+    conn.commit()
+    return state
+
+
+def release(conn, entry_ids: Iterable[int]):
+    """
+    Вернуть в очередь взятые, но не обработанные записи (прерванная
+    отправка); попытка не засчитывается
+    """
+    conn.executemany(
+        'UPDATE notification_outbox SET state = ?, claimed_by = NULL, attempts = attempts - 1 '
+        'WHERE id = ? AND state = ?',
+        [(STATE_PENDING, entry_id, STATE_SENDING) for entry_id in entry_ids]
+    )
+    conn.commit()
+
+
+def outbox_counts(conn) -> Dict[str, int]:
+    """Записей очереди по состояниям"""
+    return dict(conn.execute(
+        'SELECT state, COUNT(*) FROM notification_outbox GROUP BY state'
+    ).fetchall())
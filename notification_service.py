@@ -5,17 +5,38 @@
 Проверяет изменения цен в базах данных и отправляет
 уведомления пользователям через Telegram.
 
+Уведомления не отправляются при проверке, а ставятся в очередь
+(notification_outbox.py) вместе с обновлением подписки; очередь
+отправляет drain_outbox с повторами после ошибок. Несколько снижений
+цен для одного чата за проверку собираются в сводку (NOTIFICATION_DIGEST),
+сообщений в чат за день - не больше MAX_DAILY_NOTIFICATIONS.
+
+Полная проверка проходит все активные подписки. Режим демона
+проверяет только подписки на товары, цена которых изменилась:
+скраперы записывают изменения в price_events базы магазина,
+сервис читает новые события раз в PRICE_EVENTS_POLL_INTERVAL
+и помнит последнее прочитанное (price_event_cursors в базе
+пользователей). Нет событий - нет работы. Раз в PRICE_CHECK_INTERVAL
+демон делает и полную проверку: снижения, отложенные при проверке по
+событиям (уведомление в этот чат было меньше часа назад), не теряются.
+
 Запуск:
-    python notification_service.py          # Одноразовая проверка
-    python notification_service.py --daemon # Постоянная работа (каждый час)
+    python notification_service.py          # Одноразовая полная проверка
+    python notification_service.py --events # Одноразово: только новые события цен
+    python notification_service.py --outbox # Одноразово: отправить очередь уведомлений
+    python notification_service.py --daemon # Постоянная работа по событиям цен + полная проверка
 """
 
 import sqlite3
 import asyncio
 import argparse
+import threading
 import time
 from datetime import datetime, timedelta
-from typing import List, Dict, Optional
+from collections import defaultdict
+from functools import partial
+from html import escape
+from typing import List, Dict, Iterable, Optional, Tuple
 
 try:
     from telegram import Bot
@@ -29,70 +50,203 @@ from config import (
     DATABASES, 
     APP_URL,
     PRICE_CHECK_INTERVAL,
-    MIN_PRICE_DIFFERENCE
+    PRICE_EVENTS_POLL_INTERVAL,
+    OUTBOX_POLL_INTERVAL,
+    MIN_PRICE_DIFFERENCE,
+    MAX_DAILY_NOTIFICATIONS,
+    NOTIFICATION_DIGEST,
+    DIGEST_MIN_ITEMS
 )
+from store_db import STORE_DATABASES
+from telegram_delivery import DeliveryEngine, DeliveryResult, Message, make_bot
+from notification_outbox import (OutboxEntry, add_daily_counts, claim_due, daily_counts, dedup_key,
+                                 enqueue, ensure_outbox_schema, group_dedup_key, mark_failed,
+                                 mark_sent, new_claim, outbox_counts, release, renew_claims,
+                                 OUTBOX_RENEW_INTERVAL, STATE_FAILED, STATE_PENDING)
+import db_pool
 
 # База пользователей
 USERS_DB = 'users.db'
 
+# Товаров в одном запросе цен (ограничение SQLite на число параметров)
+PRODUCT_LOOKUP_CHUNK = 500
+
+# Событий цен за один проход
+PRICE_EVENTS_BATCH = 5000
+
+# Максимальная длина сообщения Telegram (символов)
+TELEGRAM_MESSAGE_LIMIT = 4096
+
+# Проверки подписок в потоках демона (полная и по событиям) идут по одной:
+# одно снижение не ставится в очередь дважды, дневные счётчики не двоятся
+_check_lock = threading.Lock()
+
+# Последнее обработанное событие price_events каждого магазина
+PRICE_EVENT_CURSORS_SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS price_event_cursors (
+        store_id TEXT PRIMARY KEY,
+        last_event_id INTEGER NOT NULL,
+        updated_at TIMESTAMP
+    )
+'''
+
+# Активные подписки пользователей с привязанным Telegram
+ACTIVE_ALERTS_QUERY = '''
+    SELECT 
+        pa.id as alert_id,
+        pa.user_id,
+        pa.store_id,
+        pa.product_id,
+        pa.target_price,
+        pa.notify_any_decrease,
+        pa.last_price,
+        pa.last_notified_at,
+        u.username,
+        u.telegram_chat_id
+    FROM price_alerts pa
+    JOIN users u ON pa.user_id = u.id
+    WHERE pa.is_active = 1 
+      AND u.telegram_chat_id IS NOT NULL
+      AND u.telegram_chat_id != ''
+'''
+
 
 def get_users_db():
-    """Подключение к базе пользователей"""
-    conn = sqlite3.connect(USERS_DB)
-    conn.row_factory = sqlite3.Row
-    return conn
+    """Подключение к базе пользователей (из пула db_pool)"""
+    return db_pool.connect(USERS_DB, must_exist=False)
 
 
 def get_store_db(store_id: str):
-    """Подключение к базе магазина"""
-    # Проверяем оба возможных ключа для совместимости
-    db_info = DATABASES.get(store_id, {})
-    db_path = db_info.get('path') or db_info.get('file')
+    """Подключение к базе магазина только для чтения (из пула db_pool)"""
+    db_path = STORE_DATABASES.get(store_id)
     if not db_path:
         return None
-    conn = sqlite3.connect(db_path)
-    conn.row_factory = sqlite3.Row
-    return conn
+    return db_pool.connect(db_path, readonly=True)
 
 
 def get_active_alerts() -> List[Dict]:
     """Получить все активные подписки с telegram_chat_id"""
     conn = get_users_db()
-    alerts = conn.execute('''
-        SELECT 
-            pa.id as alert_id,
-            pa.user_id,
-            pa.store_id,
-            pa.product_id,
-            pa.target_price,
-            pa.notify_any_decrease,
-            pa.last_price,
-            pa.last_notified_at,
-            u.username,
-            u.telegram_chat_id
-        FROM price_alerts pa
-        JOIN users u ON pa.user_id = u.id
-        WHERE pa.is_active = 1 
-          AND u.telegram_chat_id IS NOT NULL
-          AND u.telegram_chat_id != ''
-    ''').fetchall()
+    alerts = conn.execute(ACTIVE_ALERTS_QUERY).fetchall()
     conn.close()
     return [dict(a) for a in alerts]
 
 
-def get_product_info(store_id: str, product_id: str) -> Optional[Dict]:
-    """Получить информацию о товаре"""
+def get_alerts_for_products(store_id: str, product_ids: Iterable[str]) -> List[Dict]:
+    """Активные подписки на товары магазина (индекс price_alerts(store_id, product_id))"""
+    product_ids = list(product_ids)
+    conn = get_users_db()
+    alerts = []
+    try:
+        for start in range(0, len(product_ids), PRODUCT_LOOKUP_CHUNK):
+            chunk = product_ids[start:start + PRODUCT_LOOKUP_CHUNK]
+            alerts.extend(conn.execute(
+                f"{ACTIVE_ALERTS_QUERY} AND pa.store_id = ? "
+                f"AND pa.product_id IN ({','.join('?' * len(chunk))})",
+                [store_id, *chunk]
+            ).fetchall())
+    finally:
+        conn.close()
+    return [dict(a) for a in alerts]
+
+
+def get_event_cursor(store_id: str) -> Optional[int]:
+    """Последнее обработанное событие цен магазина (None - ещё не читали)"""
+    conn = get_users_db()
+    try:
+        conn.execute(PRICE_EVENT_CURSORS_SCHEMA)
+        row = conn.execute(
+            'SELECT last_event_id FROM price_event_cursors WHERE store_id = ?', (store_id,)
+        ).fetchone()
+    finally:
+        conn.close()
+    return row[0] if row else None
+
+
+def save_event_cursor(store_id: str, last_event_id: int):
+    """Запомнить последнее обработанное событие цен магазина"""
+    conn = get_users_db()
+    try:
+        conn.execute(PRICE_EVENT_CURSORS_SCHEMA)
+        conn.execute(
+            'INSERT OR REPLACE INTO price_event_cursors (store_id, last_event_id, updated_at) '
+            'VALUES (?, ?, ?)', (store_id, last_event_id, datetime.now())
+        )
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def get_price_events(store_id: str, after_id: int, limit: int = PRICE_EVENTS_BATCH) -> List[Dict]:
+    """События изменения цены магазина после after_id (по порядку)"""
     conn = get_store_db(store_id)
     if not conn:
-        return None
+        return []
+    try:
+        events = conn.execute(
+            'SELECT id, product_id, old_price, new_price, recorded_at FROM price_events '
+            'WHERE id > ? ORDER BY id LIMIT ?', (after_id, limit)
+        ).fetchall()
+    except sqlite3.OperationalError:
+        # База ещё не обновлялась скрапером с price_events
+        return []
+    finally:
+        conn.close()
+    return [dict(e) for e in events]
+
+
+def last_price_event_id(store_id: str) -> int:
+    """id последнего события цен магазина (0 - событий нет)"""
+    conn = get_store_db(store_id)
+    if not conn:
+        return 0
+    try:
+        row = conn.execute('SELECT MAX(id) FROM price_events').fetchone()
+    except sqlite3.OperationalError:
+        return 0
+    finally:
+        conn.close()
+    return row[0] or 0
+
+
+def alerts_for_events(store_id: str, events: List[Dict]) -> List[Dict]:
+    """
+    Подписки на товары из событий цен. У подписки без last_price
+    (ещё не проверялась) точкой отсчёта становится цена до изменения,
+    иначе первое же снижение после подписки ушло бы в first_check.
+    """
+    first_events = {}
+    for event in events:
+        first_events.setdefault(event['product_id'], event)
+    alerts = get_alerts_for_products(store_id, first_events)
+    for alert in alerts:
+        if alert['last_price'] is None:
+            alert['last_price'] = first_events[alert['product_id']]['old_price']
+    return alerts
+
+
+def get_products_info(store_id: str, product_ids: Iterable[str]) -> Dict[str, Dict]:
+    """Название и текущая цена товаров магазина: product_id -> {name, price}"""
+    conn = get_store_db(store_id)
+    if not conn:
+        return {}
     
-    product = conn.execute(
-        'SELECT name, current_price as price FROM products WHERE product_id = ?',
-        (product_id,)
-    ).fetchone()
-    conn.close()
+    product_ids = list(product_ids)
+    products = {}
+    try:
+        for start in range(0, len(product_ids), PRODUCT_LOOKUP_CHUNK):
+            chunk = product_ids[start:start + PRODUCT_LOOKUP_CHUNK]
+            rows = conn.execute(
+                f"SELECT product_id, name, current_price as price FROM products "
+                f"WHERE product_id IN ({','.join('?' * len(chunk))})",
+                chunk
+            ).fetchall()
+            for row in rows:
+                products[row['product_id']] = {'name': row['name'], 'price': row['price']}
+    finally:
+        conn.close()
     
-    return dict(product) if product else None
+    return products
 
 
 def get_price_history(store_id: str, product_id: str, limit: int = 2) -> List[Dict]:
@@ -113,16 +267,28 @@ def get_price_history(store_id: str, product_id: str, limit: int = 2) -> List[Di
     return [dict(h) for h in history]
 
 
-def update_alert_after_notification(alert_id: int, new_price: float):
-    """Обновить подписку после отправки уведомления"""
+ALERT_UPDATE_SQL = '''
+    UPDATE price_alerts 
+    SET last_notified_at = ?, last_price = ?
+    WHERE id = ?
+'''
+
+
+def save_alert_updates(updates: List[tuple]):
+    """
+    Записать обновления подписок одной транзакцией
+    
+    Args:
+        updates: [(last_notified_at, last_price, alert_id), ...]
+    """
+    if not updates:
+        return
     conn = get_users_db()
-    conn.execute('''
-        UPDATE price_alerts 
-        SET last_notified_at = ?, last_price = ?
-        WHERE id = ?
-    ''', (datetime.now(), new_price, alert_id))
-    conn.commit()
-    conn.close()
+    try:
+        conn.executemany(ALERT_UPDATE_SQL, updates)
+        conn.commit()
+    finally:
+        conn.close()
 
 
 def should_notify(alert: Dict, current_price: float) -> tuple:
@@ -170,16 +336,66 @@ def should_notify(alert: Dict, current_price: float) -> tuple:
     return (False, 'target_not_reached', last_price)
 
 
-async def send_notification(bot: Bot, chat_id: str, product_name: str, 
-                           store_name: str, store_id: str, product_id: str,
-                           old_price: float, new_price: float) -> bool:
-    """Отправить уведомление в Telegram"""
+def evaluate_alerts(alerts: List[Dict]) -> Tuple[List[Dict], List[tuple]]:
+    """
+    Проверка всех подписок пачкой: товары читаются по магазинам
+    несколькими IN-запросами, should_notify считается в памяти.
+    
+    Returns:
+        (уведомления к отправке: подписка + product_name, store_name,
+         old_price, new_price, reason;
+         обновления подписок после первой проверки для save_alert_updates)
+    """
+    product_ids = defaultdict(set)
+    for alert in alerts:
+        product_ids[alert['store_id']].add(alert['product_id'])
+    products = {store_id: get_products_info(store_id, ids) for store_id, ids in product_ids.items()}
+    
+    notifications = []
+    updates = []
+    for alert in alerts:
+        store_id = alert['store_id']
+        product_id = alert['product_id']
+        
+        product = products[store_id].get(product_id)
+        if not product:
+            print(f"  [SKIP] Товар не найден: {store_id}/{product_id}")
+            continue
+        
+        current_price = product['price']
+        product_name = product['name']
+        
+        # Проверяем, нужно ли уведомлять
+        should, reason, old_price = should_notify(alert, current_price)
+        
+        if reason == 'first_check':
+            # Первая проверка - сохраняем цену
+            updates.append((datetime.now(), current_price, alert['alert_id']))
+            print(f"  [INIT] {product_name[:40]}... - {current_price} rub")
+            continue
+        
+        if should:
+            notifications.append(dict(
+                alert,
+                product_name=product_name,
+                store_name=DATABASES.get(store_id, {}).get('name', store_id),
+                old_price=old_price,
+                new_price=current_price,
+                reason=reason,
+            ))
+    
+    return notifications, updates
+
+
+def format_notification(product_name: str, store_name: str, store_id: str, product_id: str,
+                        old_price: float, new_price: float) -> str:
+    """Текст уведомления о снижении цены (HTML)"""
     
     savings = old_price - new_price
     percent = (savings / old_price) * 100
     product_url = f"{APP_URL}/store/{store_id}/product/{product_id}"
     
-    text = (
+    return (
         f"🔔 <b>Цена снизилась!</b>\n\n"
         f"📦 {product_name}\n"
         f"🏪 {store_name}\n\n"
@@ -188,19 +404,80 @@ async def send_notification(bot: Bot, chat_id: str, product_name: str,
         f"📉 Экономия: {savings:.2f}₽ ({percent:.1f}%)\n\n"
         f"🔗 <a href='{product_url}'>Открыть товар</a>"
     )
+
+
+def format_digest_item(item: Dict) -> str:
+    """Строка товара в сводке (HTML)"""
+    percent = (item['old_price'] - item['new_price']) / item['old_price'] * 100
+    product_url = f"{APP_URL}/store/{item['store_id']}/product/{item['product_id']}"
+    return (
+        f"📦 <a href='{product_url}'>{escape(item['product_name'])}</a>\n"
+        f"🏪 {item['store_name']}: <s>{item['old_price']:.2f}₽</s> → "
+        f"<b>{item['new_price']:.2f}₽</b> (-{percent:.0f}%)"
+    )
+
+
+def format_digest(items: List[Dict]) -> List[Tuple[str, List[Dict]]]:
+    """
+    Сводка снижений цен для одного чата: сначала самые большие скидки,
+    страницы не длиннее TELEGRAM_MESSAGE_LIMIT
     
-    try:
-        await bot.send_message(
-            chat_id=int(chat_id),
-            text=text,
-            parse_mode='HTML',
-            disable_web_page_preview=True
-        )
-        print(f"  [OK] Уведомление отправлено: {chat_id}")
-        return True
-    except Exception as e:
-        print(f"  [ERR] Ошибка отправки {chat_id}: {e}")
+    Returns:
+        [(текст страницы, товары страницы), ...]
+    """
+    items = sorted(items, key=lambda item: item['new_price'] / item['old_price'])
+    # Запас на заголовок страницы
+    limit = TELEGRAM_MESSAGE_LIMIT - 100
+    
+    pages = [[]]
+    length = 0
+    for item in items:
+        line = format_digest_item(item)
+        if pages[-1] and length + len(line) + 2 > limit:
+            pages.append([])
+            length = 0
+        pages[-1].append((line, item))
+        length += len(line) + 2
+    
+    result = []
+    for number, page in enumerate(pages, 1):
+        header = f"🔔 <b>Снизились цены на товары: {len(items)}</b>"
+        if len(pages) > 1:
+            header += f" (стр. {number}/{len(pages)})"
+        text = header + "\n\n" + "\n\n".join(line for line, _ in page)
+        result.append((text, [item for _, item in page]))
+    return result
+
+
+def notification_messages(items: List[Dict]) -> List[Tuple[str, List[Dict]]]:
+    """Сообщения для одного чата: сводка или по сообщению на товар"""
+    if NOTIFICATION_DIGEST and len(items) >= DIGEST_MIN_ITEMS:
+        return format_digest(items)
+    return [(format_notification(item['product_name'], item['store_name'], item['store_id'],
+                                 item['product_id'], item['old_price'], item['new_price']), [item])
+            for item in items]
+
+
+async def send_message(bot: 'Bot', chat_id: str, text: str):
+    """Отправить сообщение в Telegram (ошибки, в том числе RetryAfter, - исключением)"""
+    await bot.send_message(
+        chat_id=int(chat_id),
+        text=text,
+        parse_mode='HTML',
+        disable_web_page_preview=True
+    )
+
+
+def telegram_ready() -> bool:
+    """Можно ли отправлять уведомления"""
+    if not TELEGRAM_AVAILABLE:
+        print("[ERR] Telegram не доступен")
         return False
+    
+    if TELEGRAM_BOT_TOKEN == 'YOUR_BOT_TOKEN_HERE':
+        print("[ERR] Токен бота не настроен")
+        return False
+    return True
 
 
 async def check_and_notify():
@@ -210,101 +487,292 @@ async def check_and_notify():
     print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] Проверка цен...")
     print('='*60)
     
-    if not TELEGRAM_AVAILABLE:
-        print("[ERR] Telegram не доступен")
+    if not telegram_ready():
         return
     
-    if TELEGRAM_BOT_TOKEN == 'YOUR_BOT_TOKEN_HERE':
-        print("[ERR] Токен бота не настроен")
-        return
+    check_alerts()
+    await drain_outbox()
+
+
+def check_alerts() -> int:
+    """
+    Полная проверка: все активные подписки, уведомления - в очередь.
     
-    bot = Bot(token=TELEGRAM_BOT_TOKEN)
+    Демон делает её раз в PRICE_CHECK_INTERVAL: снижение, которое при
+    проверке по событиям оказалось too_soon, не меняет last_price
+    подписки и находится здесь, хотя позиция в price_events уже сдвинута.
     
-    # Получаем все активные подписки
-    alerts = get_active_alerts()
-    print(f"[*] Активных подписок: {len(alerts)}")
+    Returns:
+        количество новых записей в очереди
+    """
+    with _check_lock:
+        # Получаем все активные подписки
+        alerts = get_active_alerts()
+        print(f"[*] Активных подписок: {len(alerts)}")
+        
+        if not alerts:
+            print("[*] Нет подписок для проверки")
+            return 0
+        
+        return enqueue_notifications(alerts)
+
+
+def process_price_events() -> int:
+    """
+    Проверить подписки на товары из новых событий цен всех магазинов
+    и поставить уведомления в очередь
     
-    if not alerts:
-        print("[*] Нет подписок для проверки")
-        return
+    Позиция в price_events сохраняется после каждой пачки событий, когда
+    подписки уже обновлены: при сбое пачка обработается ещё раз, а
+    уведомления не повторятся (last_price уже новая, dedup_key в очереди).
     
-    notifications_sent = 0
-    errors = 0
+    Returns:
+        количество обработанных событий
+    """
+    if not telegram_ready():
+        return 0
     
-    for alert in alerts:
-        store_id = alert['store_id']
-        product_id = alert['product_id']
-        store_name = DATABASES.get(store_id, {}).get('name', store_id)
+    with _check_lock:
+        processed = 0
+        for store_id in STORE_DATABASES:
+            cursor = get_event_cursor(store_id)
+            if cursor is None:
+                # Первый запуск: прежние изменения уже учтены полной проверкой
+                cursor = last_price_event_id(store_id)
+                save_event_cursor(store_id, cursor)
+                print(f"[*] {store_id}: события цен читаются начиная с #{cursor + 1}")
+                continue
         
-        # Получаем текущую цену товара
-        product = get_product_info(store_id, product_id)
-        if not product:
-            print(f"  [SKIP] Товар не найден: {store_id}/{product_id}")
-            continue
+            while True:
+                events = get_price_events(store_id, cursor)
+                if not events:
+                    break
+                alerts = alerts_for_events(store_id, events)
+                print(f"\n[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] {store_id}: "
+                      f"событий цен {len(events)}, подписок на эти товары {len(alerts)}")
+                if alerts:
+                    enqueue_notifications(alerts)
+                cursor = events[-1]['id']
+                save_event_cursor(store_id, cursor)
+                processed += len(events)
         
-        current_price = product['price']
-        product_name = product['name']
+        return processed
+
+
+def enqueue_notifications(alerts: List[Dict]) -> int:
+    """
+    Проверить подписки и поставить уведомления в очередь. Очередь,
+    дневные счётчики и обновления подписок пишутся одной транзакцией:
+    уведомление не теряется и не ставится повторно.
+    
+    Снижения цен для одного чата собираются в сводку. Сообщения сверх
+    MAX_DAILY_NOTIFICATIONS в день в чат ставятся в очередь на следующий
+    день (или первый день, где лимит не исчерпан) - снижение не теряется,
+    хотя позиция в price_events уже сдвинута.
+    
+    Returns:
+        количество новых записей в очереди
+    """
+    notifications, updates = evaluate_alerts(alerts)
+    
+    now = datetime.now()
+    day = now.date().isoformat()
+    by_chat = defaultdict(list)
+    for item in notifications:
+        print(f"\n  [NOTIFY] {item['product_name'][:40]}...")
+        print(f"           {item['old_price']} rub -> {item['new_price']} rub ({item['reason']})")
+        by_chat[item['telegram_chat_id']].append(item)
+    
+    conn = get_users_db()
+    try:
+        ensure_outbox_schema(conn)
+        # Сообщений в чат по дням отправки: день -> chat_id -> количество
+        scheduled = {day: daily_counts(conn, by_chat, day)}
+        new_counts = defaultdict(lambda: defaultdict(int))
         
-        # Проверяем, нужно ли уведомлять
-        should, reason, old_price = should_notify(alert, current_price)
+        entries = []
+        deferred = 0
+        for chat_id, items in by_chat.items():
+            send_date = now.date()
+            for text, page_items in notification_messages(items):
+                # Лимит дня исчерпан - сообщение ждёт следующего дня
+                while True:
+                    send_day = send_date.isoformat()
+                    if send_day not in scheduled:
+                        scheduled[send_day] = daily_counts(conn, by_chat, send_day)
+                    if scheduled[send_day].get(chat_id, 0) < max(1, MAX_DAILY_NOTIFICATIONS):
+                        break
+                    send_date += timedelta(days=1)
+                scheduled[send_day][chat_id] = scheduled[send_day].get(chat_id, 0) + 1
+                new_counts[send_day][chat_id] += 1
+                
+                not_before = None
+                if send_day != day:
+                    not_before = datetime.combine(send_date, datetime.min.time())
+                    deferred += len(page_items)
+                keys = [dedup_key(item['alert_id'], item['old_price'], item['new_price'], day)
+                        for item in page_items]
+                alert_id = page_items[0]['alert_id'] if len(page_items) == 1 else None
+                entries.append(OutboxEntry(alert_id, chat_id, text, group_dedup_key(keys), not_before))
+                updates.extend((now, item['new_price'], item['alert_id']) for item in page_items)
         
-        if reason == 'first_check':
-            # Первая проверка - сохраняем цену
-            update_alert_after_notification(alert['alert_id'], current_price)
-            print(f"  [INIT] {product_name[:40]}... - {current_price} rub")
-            continue
+        added = enqueue(conn, entries)
+        for send_day, counts in new_counts.items():
+            add_daily_counts(conn, counts, send_day)
+        conn.executemany(ALERT_UPDATE_SQL, updates)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+    
+    if entries:
+        print(f"[*] В очередь уведомлений: {added} сообщений ({len(notifications)} товаров)")
+    if deferred:
+        print(f"[*] Из-за лимита {MAX_DAILY_NOTIFICATIONS} сообщений в день "
+              f"на следующие дни отложено товаров: {deferred}")
+    return added
+
+
+async def drain_outbox() -> int:
+    """
+    Отправить уведомления из очереди, которым пора (параллельно, в
+    пределах лимитов Telegram). Каждый результат отмечается в очереди
+    сразу после ответа Telegram; пока идёт отправка, взятые записи
+    продлеваются (renew_claims), чтобы другой обработчик не счёл их
+    брошенными. При прерывании неотправленные записи возвращаются в очередь.
+    
+    Returns:
+        количество обработанных записей очереди
+    """
+    if not telegram_ready():
+        return 0
+    
+    conn = get_users_db()
+    try:
+        ensure_outbox_schema(conn)
+        claim = new_claim()
+        entries = claim_due(conn, claim=claim)
+        if not entries:
+            return 0
         
-        if not should:
-            continue
+        # Взятые записи, ещё не получившие результат: id -> номер попытки
+        attempts = {entry['id']: entry['attempts'] for entry in entries}
         
-        print(f"\n  [NOTIFY] {product_name[:40]}...")
-        print(f"           {old_price} rub -> {current_price} rub ({reason})")
+        def on_result(result: DeliveryResult):
+            entry_id = result.message.key
+            if result.ok:
+                mark_sent(conn, entry_id)
+                print(f"  [OK] Уведомление отправлено: {result.message.chat_id}")
+            else:
+                state = mark_failed(conn, entry_id, attempts[entry_id], result.error)
+                retry = 'попытки исчерпаны' if state == STATE_FAILED else 'будет повтор'
+                print(f"  [ERR] Ошибка отправки {result.message.chat_id}: {result.error} ({retry})")
+            del attempts[entry_id]
         
-        # Отправляем уведомление
-        success = await send_notification(
-            bot=bot,
-            chat_id=alert['telegram_chat_id'],
-            product_name=product_name,
-            store_name=store_name,
-            store_id=store_id,
-            product_id=product_id,
-            old_price=old_price,
-            new_price=current_price
-        )
+        async def renew():
+            while True:
+                await asyncio.sleep(OUTBOX_RENEW_INTERVAL)
+                try:
+                    renew_claims(conn, claim)
+                except sqlite3.Error as e:
+                    print(f"[ERR] Не удалось продлить записи очереди: {e}")
         
-        if success:
-            notifications_sent += 1
-            update_alert_after_notification(alert['alert_id'], current_price)
-        else:
-            errors += 1
-    
-    print(f"\n[*] Итого: отправлено {notifications_sent}, ошибок {errors}")
+        processed = 0
+        renewing = asyncio.create_task(renew())
+        try:
+            # Параллельная отправка в пределах лимитов Telegram
+            bot = make_bot(TELEGRAM_BOT_TOKEN)
+            async with bot:
+                engine = DeliveryEngine(partial(send_message, bot))
+                stats = engine.stats
+                while entries:
+                    await engine.deliver([Message(entry['chat_id'], entry['payload'], entry['id'])
+                                          for entry in entries], on_result)
+                    processed += len(entries)
+                    entries = claim_due(conn, claim=claim)
+                    attempts.update((entry['id'], entry['attempts']) for entry in entries)
+        finally:
+            renewing.cancel()
+            # Взятые, но не отправленные (прерывание) - обратно в очередь
+            release(conn, list(attempts))
+        
+        if stats['retry_after']:
+            print(f"[*] Ответов RetryAfter от Telegram: {stats['retry_after']}")
+        print(f"\n[*] Итого: отправлено {stats['sent']}, ошибок {stats['failed']}")
+        counts = outbox_counts(conn)
+        if counts.get(STATE_PENDING) or counts.get(STATE_FAILED):
+            print(f"[*] В очереди: ожидают {counts.get(STATE_PENDING, 0)}, "
+                  f"не отправлено {counts.get(STATE_FAILED, 0)}")
+        return processed
+    finally:
+        conn.close()
 
 
-async def daemon_mode():
-    """Режим демона - постоянная проверка"""
-    print(f"[*] Запуск в режиме демона")
-    print(f"[*] Интервал проверки: {PRICE_CHECK_INTERVAL} сек ({PRICE_CHECK_INTERVAL//60} мин)")
-    
+async def _events_loop():
+    """Проверка подписок по событиям цен (в отдельном потоке - не мешает отправке)"""
+    while True:
+        try:
+            await asyncio.to_thread(process_price_events)
+        except Exception as e:
+            print(f"[ERR] Ошибка проверки: {e}")
+        
+        await asyncio.sleep(PRICE_EVENTS_POLL_INTERVAL)
+
+
+async def _full_check_loop():
+    """Полная проверка подписок - страховка для проверки по событиям"""
     while True:
+        print(f"\n[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] Полная проверка подписок...")
         try:
-            await check_and_notify()
+            await asyncio.to_thread(check_alerts)
         except Exception as e:
-            print(f"[ERR] Ошибка: {e}")
+            print(f"[ERR] Ошибка полной проверки: {e}")
         
-        print(f"\n[*] Следующая проверка через {PRICE_CHECK_INTERVAL//60} мин...")
         await asyncio.sleep(PRICE_CHECK_INTERVAL)
 
 
+async def _outbox_loop():
+    """Отправка очереди уведомлений"""
+    while True:
+        try:
+            await drain_outbox()
+        except Exception as e:
+            print(f"[ERR] Ошибка отправки очереди: {e}")
+        
+        await asyncio.sleep(OUTBOX_POLL_INTERVAL)
+
+
+async def daemon_mode():
+    """Режим демона - проверка подписок по событиям цен, полная проверка и отправка очереди"""
+    print(f"[*] Запуск в режиме демона")
+    print(f"[*] Чтение событий цен каждые {PRICE_EVENTS_POLL_INTERVAL} сек, "
+          f"полная проверка - каждые {PRICE_CHECK_INTERVAL} сек, "
+          f"очереди уведомлений - каждые {OUTBOX_POLL_INTERVAL} сек")
+    
+    await asyncio.gather(_events_loop(), _full_check_loop(), _outbox_loop())
+
+
 def main():
     """Точка входа"""
     parser = argparse.ArgumentParser(description='Сервис уведомлений о ценах')
     parser.add_argument('--daemon', '-d', action='store_true',
-                       help='Запуск в режиме демона (постоянная работа)')
+                       help='Запуск в режиме демона (постоянная работа по событиям цен)')
+    parser.add_argument('--events', action='store_true',
+                       help='Одноразово обработать новые события цен')
+    parser.add_argument('--outbox', action='store_true',
+                       help='Одноразово отправить очередь уведомлений')
     args = parser.parse_args()
     
     if args.daemon:
         asyncio.run(daemon_mode())
+    elif args.events:
+        processed = process_price_events()
+        print(f"[*] Обработано событий цен: {processed}")
+        asyncio.run(drain_outbox())
+    elif args.outbox:
+        asyncio.run(drain_outbox())
     else:
         asyncio.run(check_and_notify())
 
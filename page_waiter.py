@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+"""
+Адаптивное ожидание догрузки товаров на странице (Selenium)
+
+Вместо фиксированных time.sleep после прокрутки или клика
+в страницу через execute_async_script ставится MutationObserver,
+который возвращает управление:
+    - как только карточек товаров стало больше, чем было;
+    - или когда страница "затихла": quiet секунд нет изменений DOM
+      и незавершённых fetch/XHR-запросов;
+    - или по таймауту.
+
+Счётчик незавершённых запросов ставится в страницу один раз
+после загрузки (install_network_tracker) - обёртки над fetch и
+XMLHttpRequest.
+"""
+
+import time
+
+# Обёртки fetch/XHR: window.__pricioPending - число незавершённых запросов
+_NETWORK_TRACKER_JS = '''
+if (!window.__pricioTracker) {
+    window.__pricioTracker = true;
+    window.__pricioPending = 0;
+    var done = function() { window.__pricioPending = Math.max(0, window.__pricioPending - 1); };
+    if (window.fetch) {
+        var originalFetch = window.fetch;
+        window.fetch = function() {
+            window.__pricioPending++;
+            return originalFetch.apply(this, arguments).then(
+                function(response) { done(); return response; },
+                function(error) { done(); throw error; }
+            );
+        };
+    }
+    var originalSend = XMLHttpRequest.prototype.send;
+    XMLHttpRequest.prototype.send = function() {
+        window.__pricioPending++;
+        this.addEventListener('loadend', done);
+        return originalSend.apply(this, arguments);
+    };
+}
+'''
+
+# arguments: селектор карточек, прежнее количество, тишина (мс), таймаут (мс), callback
+_WAIT_FOR_ITEMS_JS = '''
+var selector = arguments[0], previous = arguments[1];
+var quietMs = arguments[2], timeoutMs = arguments[3];
+var callback = arguments[arguments.length - 1];
+var count = function() { return document.querySelectorAll(selector).length; };
+var finished = false, quietTimer = null, timeoutTimer = null, observer = null;
+
+var finish = function(reason) {
+    if (finished) return;
+    finished = true;
+    if (observer) observer.disconnect();
+    clearTimeout(quietTimer);
+    clearTimeout(timeoutTimer);
+    callback([count(), reason]);
+};
+var checkQuiet = function() {
+    if ((window.__pricioPending || 0) > 0) {
+        quietTimer = setTimeout(checkQuiet, quietMs);
+    } else {
+        finish('quiet');
+    }
+};
+var restartQuiet = function() {
+    clearTimeout(quietTimer);
+    quietTimer = setTimeout(checkQuiet, quietMs);
+};
+
+if (previous >= 0 && count() > previous) {
+    finish('items');
+} else {
+    observer = new MutationObserver(function() {
+        if (previous >= 0 && count() > previous) {
+            finish('items');
+        } else {
+            restartQuiet();
+        }
+    });
+    observer.observe(document.body, {childList: true, subtree: true});
+    restartQuiet();
+    timeoutTimer = setTimeout(function() { finish('timeout'); }, timeoutMs);
+}
+'''
+
+# Тишина на странице по умолчанию (секунды)
+QUIET_PERIOD = 0.4
+
+# Максимальное ожидание одного события (секунды)
+WAIT_TIMEOUT = 8.0
+
+
+def install_network_tracker(driver):
+    """Поставить счётчик незавершённых запросов (после каждого driver.get)"""
+    try:
+        driver.execute_script(_NETWORK_TRACKER_JS)
+    except Exception:
+        pass
+
+
+def wait_for_items(driver, selector: str, previous_count: int,
+                   quiet: float = QUIET_PERIOD, timeout: float = WAIT_TIMEOUT):
+    """
+    Ждёт, пока карточек по selector станет больше previous_count,
+    или пока страница не затихнет.
+
+    Returns:
+        (текущее количество карточек, причина: 'items' / 'quiet' / 'timeout')
+    """
+    driver.set_script_timeout(timeout + 5)
+    try:
+        count, reason = driver.execute_async_script(
+            _WAIT_FOR_ITEMS_JS, selector, previous_count, int(quiet * 1000), int(timeout * 1000)
+        )
+        return count, reason
+    except Exception:
+        # Страница перезагрузилась или скрипт не выполнился - как раньше, пауза
+        time.sleep(quiet)
+        count = driver.execute_script(
+            'return document.querySelectorAll(arguments[0]).length;', selector
+        )
+        return count, 'fallback'
+
+
+def wait_for_quiet(driver, quiet: float = QUIET_PERIOD, timeout: float = WAIT_TIMEOUT):
+    """Ждёт, пока на странице не будет изменений DOM и запросов quiet секунд"""
+    return wait_for_items(driver, 'body', -1, quiet, timeout)[1]
@@ -0,0 +1,366 @@
+# -*- coding: utf-8 -*-
+"""
+Атрибуты товаров: тип, бренд, объём, вес, жирность, количество
+
+Разбор названия дорогой (регулярные выражения и проход по словарям),
+поэтому результаты хранятся в таблице product_attributes базы магазина.
+Таблица заполняется пачкой после каждого скрапинга, а веб-приложение
+читает готовые значения через LEFT JOIN.
+
+Пересчёт вручную: python store_db.py attributes
+"""
+
+import re
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Dict, Optional, Tuple
+
+from aho_corasick import AhoCorasick
+
+
+# ============================================================================
+# ПАРСИНГ АТРИБУТОВ ТОВАРА
+# ============================================================================
+
+@dataclass
+class ProductAttributes:
+    """Структурированные атрибуты товара"""
+    product_type: Optional[str] = None   # молоко, сыр, колбаса
+    brand: Optional[str] = None          # Простоквашино, Mucho Mas
+    volume_ml: Optional[float] = None    # объём в мл
+    weight_g: Optional[float] = None     # вес в граммах
+    fat_percent: Optional[float] = None  # жирность
+    quantity: Optional[int] = None       # количество в упаковке
+
+
+# Словарь типов продуктов для нормализации
+PRODUCT_TYPES = {
+    'молоко': ['молоко', 'молочко'],
+    'кефир': ['кефир'],
+    'йогурт': ['йогурт', 'йогу|рт'],
+    'творог': ['творог', 'творожок', 'творожный', 'творожная', 'творожное'],
+    'сметана': ['сметана'],
+    'сливки': ['сливки'],
+    'сыр': ['сыр', 'сырок', 'сырный', 'сырная'],
+    'масло': ['масло'],
+    'колбаса': ['колбаса', 'колбасный', 'колбасная', 'колбаски'],
+    'сосиски': ['сосиски', 'сосиска', 'сардельки', 'сарделька'],
+    'ветчина': ['ветчина'],
+    'бекон': ['бекон'],
+    'курица': ['курица', 'куриный', 'куриная', 'куриное', 'цыплёнок', 'цыпленок'],
+    'индейка': ['индейка', 'индюшиный', 'индюшиная'],
+    'свинина': ['свинина', 'свиной', 'свиная', 'свиное'],
+    'говядина': ['говядина', 'говяжий', 'говяжья', 'говяжье'],
+    'фарш': ['фарш'],
+    'рыба': ['рыба', 'рыбный', 'рыбная', 'рыбное'],
+    'лосось': ['лосось', 'сёмга', 'семга', 'форель'],
+    'креветки': ['креветки', 'креветка'],
+    'хлеб': ['хлеб', 'хлебец', 'хлебцы'],
+    'батон': ['батон', 'багет'],
+    'булка': ['булка', 'булочка', 'булочки'],
+    'вино': ['вино'],
+    'пиво': ['пиво'],
+    'водка': ['водка'],
+    'виски': ['виски'],
+    'коньяк': ['коньяк'],
+    'сок': ['сок', 'нектар'],
+    'вода': ['вода', 'минералка', 'минеральная'],
+    'лимонад': ['лимонад', 'газировка'],
+    'чай': ['чай'],
+    'кофе': ['кофе'],
+    'шоколад': ['шоколад', 'шоколадка', 'шоколадный', 'шоколадная'],
+    'конфеты': ['конфеты', 'конфета'],
+    'печенье': ['печенье'],
+    'торт': ['торт'],
+    'мороженое': ['мороженое', 'пломбир', 'эскимо'],
+    'чипсы': ['чипсы'],
+    'орехи': ['орехи', 'орех', 'арахис', 'миндаль', 'фундук', 'кешью', 'фисташки'],
+    'яйца': ['яйца', 'яйцо'],
+    'макароны': ['макароны', 'паста', 'спагетти', 'лапша'],
+    'рис': ['рис'],
+    'гречка': ['гречка', 'гречневая'],
+    'овсянка': ['овсянка', 'овсяная', 'овсяные'],
+    'мука': ['мука'],
+    'сахар': ['сахар'],
+    'соль': ['соль'],
+    'бананы': ['бананы', 'банан'],
+    'яблоки': ['яблоки', 'яблоко'],
+    'апельсины': ['апельсины', 'апельсин'],
+    'мандарины': ['мандарины', 'мандарин'],
+    'лимоны': ['лимоны', 'лимон'],
+    'виноград': ['виноград'],
+    'помидоры': ['помидоры', 'помидор', 'томаты', 'томат'],
+    'огурцы': ['огурцы', 'огурец'],
+    'картофель': ['картофель', 'картошка'],
+    'морковь': ['морковь', 'морковка'],
+    'лук': ['лук'],
+    'капуста': ['капуста'],
+}
+
+# Известные бренды (русские)
+RUSSIAN_BRANDS = {
+    'простоквашино', 'домик в деревне', 'вкуснотеево', 'савушкин', 'брест-литовск',
+    'черкизово', 'мираторг', 'останкино', 'велком', 'папа может',
+    'добрый', 'любимый', 'фруктовый сад', 'моя семья', 'j7', 'rich',
+    'макфа', 'барилла', 'щебекинские',
+    'lay\'s', 'lays', 'pringles', 'cheetos',
+    'аленка', 'бабаевский', 'красный октябрь', 'коркунов', 'merci',
+    'bonduelle', 'heinz', 'calve',
+}
+
+# Стоп-слова (не определяют тип продукта)
+STOP_WORDS = {
+    'магнит', 'пятёрочка', 'пятерочка', 'для', 'без', 'или', 'the', 'штук', 'шт',
+    'упаковка', 'пакет', 'бзмж', 'premium', 'extra', 'new', 'global', 'village',
+    'напиток', 'продукт', 'изделие', 'товар', 'набор', 'ассорти', 'микс',
+    'добавлением', 'натуральный', 'свежий', 'вкусный', 'домашний', 'классический',
+    'молочный', 'молочная', 'молочное', 'детский', 'детская', 'взрослый',
+    'гавайский', 'тропический', 'летняя', 'летний', 'садовая', 'садовый',
+    'лесная', 'лесной', 'красное', 'красный', 'белое', 'белый', 'зеленый', 'зелёный',
+    'фасованное', 'фасованный', 'отборные', 'отборный', 'сокосодержащий',
+    'восстановленный', 'протеиновый', 'протеиновое', 'высокобелковый',
+    'энергетический', 'газированный', 'негазированный', 'безалкогольный',
+    'с', 'и', 'в', 'на', 'из', 'по', 'со'
+}
+
+
+# Автомат по брендам и ключевым словам типов. Приоритет - порядок обхода
+# словарей (для брендов - порядок итерации множества), как в прежних циклах
+# "for keyword in ...: if keyword in name_lower"
+KEYWORD_AUTOMATON = AhoCorasick({
+    'brand': [(brand, brand) for brand in RUSSIAN_BRANDS],
+    'type': [(keyword, product_type)
+             for product_type, keywords in PRODUCT_TYPES.items()
+             for keyword in keywords],
+})
+
+
+def parse_product_attributes(name: str) -> ProductAttributes:
+    """Извлечение структурированных атрибутов из названия товара"""
+    name_lower = name.lower()
+    attrs = ProductAttributes()
+    
+    # Извлекаем объём: 750мл, 1л, 1.5л, 0.5 л
+    volume_match = re.search(r'(\d+(?:[.,]\d+)?)\s*(?:мл|ml)\b', name_lower)
+    if volume_match:
+        attrs.volume_ml = float(volume_match.group(1).replace(',', '.'))
+    else:
+        volume_match = re.search(r'(\d+(?:[.,]\d+)?)\s*л(?:итр|\b)', name_lower)
+        if volume_match:
+            attrs.volume_ml = float(volume_match.group(1).replace(',', '.')) * 1000
+    
+    # Извлекаем вес: 500г, 1кг, 1.2кг
+    weight_match = re.search(r'(\d+(?:[.,]\d+)?)\s*(?:г|гр|грамм)(?!\w)', name_lower)
+    if weight_match:
+        attrs.weight_g = float(weight_match.group(1).replace(',', '.'))
+    else:
+        weight_match = re.search(r'(\d+(?:[.,]\d+)?)\s*кг\b', name_lower)
+        if weight_match:
+            attrs.weight_g = float(weight_match.group(1).replace(',', '.')) * 1000
+    
+    # Извлекаем жирность: 3.2%, 2,5%
+    fat_match = re.search(r'(\d+(?:[.,]\d+)?)\s*%', name_lower)
+    if fat_match:
+        attrs.fat_percent = float(fat_match.group(1).replace(',', '.'))
+    
+    # Извлекаем количество: 6шт, x12
+    qty_match = re.search(r'(\d+)\s*(?:шт|штук)|x(\d+)', name_lower)
+    if qty_match:
+        attrs.quantity = int(qty_match.group(1) or qty_match.group(2))
+    
+    # Извлекаем бренд (латиница - приоритет)
+    latin_brands = re.findall(r'\b([A-Z][a-zA-Z\']+(?:\s+[A-Z][a-zA-Z\']+)?)\b', name)
+    if latin_brands:
+        # Берём самый длинный бренд из латиницы
+        attrs.brand = max(latin_brands, key=len)
+    
+    # Известные русские бренды и тип продукта - один проход автомата
+    keywords = KEYWORD_AUTOMATON.first_matches(name_lower)
+    
+    if not attrs.brand and 'brand' in keywords:
+        attrs.brand = keywords['brand'].title()
+    
+    # Определяем тип продукта
+    attrs.product_type = keywords.get('type')
+    
+    # Если тип не найден - берём первое русское слово
+    if not attrs.product_type:
+        words = re.findall(r'[а-яёА-ЯЁ]{4,}', name_lower)
+        words = [w for w in words if w not in STOP_WORDS]
+        if words:
+            attrs.product_type = words[0]
+    
+    return attrs
+
+
+def stem_russian(word: str) -> str:
+    """Простой стемминг для русских слов - убираем окончания"""
+    if len(word) < 4:
+        return word
+    endings = ['ами', 'ями', 'ах', 'ях', 'ов', 'ев', 'ей', 'ий', 'ый', 'ая', 'яя', 'ое', 'ее',
+               'ы', 'и', 'а', 'я', 'у', 'ю', 'е', 'о']
+    for ending in endings:
+        if word.endswith(ending) and len(word) - len(ending) >= 3:
+            return word[:-len(ending)]
+    return word
+
+
+def calculate_price_per_unit(product: Dict, attrs: ProductAttributes = None) -> Optional[Dict]:
+    """Вычисляет цену за единицу (литр или кг)"""
+    if attrs is None:
+        attrs = parse_product_attributes(product.get('name', ''))
+    price = product.get('current_price', 0) or 0
+    
+    if not price:
+        return None
+    
+    if attrs.volume_ml and attrs.volume_ml > 0:
+        price_per_liter = price / attrs.volume_ml * 1000
+        return {'value': price_per_liter, 'unit': 'л', 'display': f"{price_per_liter:.2f} ₽/л"}
+    
+    if attrs.weight_g and attrs.weight_g > 0:
+        price_per_kg = price / attrs.weight_g * 1000
+        return {'value': price_per_kg, 'unit': 'кг', 'display': f"{price_per_kg:.2f} ₽/кг"}
+    
+    return None
+
+
+# ============================================================================
+# ТАБЛИЦА PRODUCT_ATTRIBUTES
+# ============================================================================
+
+PRODUCT_ATTRIBUTES_SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS product_attributes (
+        product_id TEXT PRIMARY KEY,
+        source_name TEXT,
+        product_type TEXT,
+        brand TEXT,
+        volume_ml REAL,
+        weight_g REAL,
+        fat_percent REAL,
+        quantity INTEGER,
+        price_per_unit REAL,
+        unit TEXT,
+        updated_at TIMESTAMP
+    )
+'''
+
+PRODUCT_ATTRIBUTES_INDEXES = [
+    'CREATE INDEX IF NOT EXISTS idx_product_attributes_type_brand '
+    'ON product_attributes(product_type, brand)',
+]
+
+# Колонки для JOIN с products (префикс attr_, чтобы не смешивать с товаром)
+ATTRIBUTE_COLUMNS_SQL = '''
+    a.product_id AS attr_product_id, a.product_type AS attr_product_type,
+    a.brand AS attr_brand, a.volume_ml AS attr_volume_ml, a.weight_g AS attr_weight_g,
+    a.fat_percent AS attr_fat_percent, a.quantity AS attr_quantity,
+    a.price_per_unit AS attr_price_per_unit, a.unit AS attr_unit
+'''
+
+ATTRIBUTES_JOIN_SQL = 'LEFT JOIN product_attributes a ON a.product_id = p.product_id'
+
+
+def ensure_attributes_schema(conn):
+    """Создаёт таблицу product_attributes и индексы"""
+    conn.execute(PRODUCT_ATTRIBUTES_SCHEMA)
+    for statement in PRODUCT_ATTRIBUTES_INDEXES:
+        conn.execute(statement)
+
+
+def pop_attributes(product: Dict) -> Tuple[ProductAttributes, Optional[Dict]]:
+    """
+    Достаёт атрибуты из строки с колонками attr_* и убирает их из словаря.
+    Если атрибуты ещё не посчитаны - разбирает название.
+
+    Returns:
+        (атрибуты, цена за единицу)
+    """
+    fields = {key: product.pop(key) for key in list(product) if key.startswith('attr_')}
+
+    if fields.get('attr_product_id') is None:
+        attrs = parse_product_attributes(product.get('name', ''))
+        return attrs, calculate_price_per_unit(product, attrs)
+
+    attrs = ProductAttributes(
+        product_type=fields['attr_product_type'],
+        brand=fields['attr_brand'],
+        volume_ml=fields['attr_volume_ml'],
+        weight_g=fields['attr_weight_g'],
+        fat_percent=fields['attr_fat_percent'],
+        quantity=fields['attr_quantity'],
+    )
+
+    price_per_unit = None
+    value = fields['attr_price_per_unit']
+    if value is not None:
+        unit = fields['attr_unit']
+        price_per_unit = {'value': value, 'unit': unit, 'display': f"{value:.2f} ₽/{unit}"}
+
+    return attrs, price_per_unit
+
+
+def refresh_product_attributes(conn, recompute_all: bool = False) -> int:
+    """
+    Обновляет product_attributes после скрапинга.
+
+    Названия разбираются только у новых товаров и товаров с изменившимся
+    названием, цена за единицу пересчитывается в SQL для всех.
+
+    Returns:
+        количество заново разобранных названий
+    """
+    ensure_attributes_schema(conn)
+
+    query = '''
+        SELECT p.product_id, p.name
+        FROM products p
+        LEFT JOIN product_attributes a ON a.product_id = p.product_id
+    '''
+    if not recompute_all:
+        query += ' WHERE a.product_id IS NULL OR a.source_name IS NOT p.name'
+
+    updated_at = datetime.now().isoformat()
+    rows = []
+    for product_id, name in conn.execute(query).fetchall():
+        attrs = parse_product_attributes(name or '')
+        rows.append((
+            product_id, name, attrs.product_type, attrs.brand, attrs.volume_ml,
+            attrs.weight_g, attrs.fat_percent, attrs.quantity, updated_at
+        ))
+
+    conn.executemany('''
+        INSERT OR REPLACE INTO product_attributes
+        (product_id, source_name, product_type, brand, volume_ml, weight_g,
+         fat_percent, quantity, updated_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', rows)
+
+    # Цена за единицу - как в calculate_price_per_unit
+    conn.execute('''
+        UPDATE product_attributes
+        SET (price_per_unit, unit) = (
+            SELECT
+                CASE
+                    WHEN coalesce(p.current_price, 0) = 0 THEN NULL
+                    WHEN product_attributes.volume_ml > 0
+                        THEN p.current_price / product_attributes.volume_ml * 1000
+                    WHEN product_attributes.weight_g > 0
+                        THEN p.current_price / product_attributes.weight_g * 1000
+                END,
+                CASE
+                    WHEN coalesce(p.current_price, 0) = 0 THEN NULL
+                    WHEN product_attributes.volume_ml > 0 THEN 'л'
+                    WHEN product_attributes.weight_g > 0 THEN 'кг'
+                END
+            FROM products p
+            WHERE p.product_id = product_attributes.product_id
+        )
+    ''')
+
+    conn.execute(
+        'DELETE FROM product_attributes WHERE product_id NOT IN (SELECT product_id FROM products)'
+    )
+    conn.commit()
+    return len(rows)
+
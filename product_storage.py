@@ -0,0 +1,320 @@
+# -*- coding: utf-8 -*-
+"""
+Сохранение результатов скрапинга в базу магазина
+
+Общее для scraper_v2.py и scraper_magnit.py. Вместо SELECT и
+UPDATE/INSERT на каждый товар:
+    - текущие цены уже известных товаров читаются пачками;
+    - новые товары пишутся executemany INSERT ... ON CONFLICT(product_id)
+      DO UPDATE, известные - executemany UPDATE; min/max цены
+      считаются в SQL;
+    - в историю цен пишутся только новые товары и изменившиеся цены,
+      изменения цен известных товаров - ещё и в price_events для
+      сервиса уведомлений;
+    - всё в одной транзакции, база в режиме WAL.
+
+Счётчики (новые / обновлённые / цена изменилась) и строки истории -
+те же, что при прежней обработке по одному товару, в том числе
+для товаров, встретившихся в прогоне несколько раз.
+
+CategoryPipeline сохраняет прогон по категориям по мере обхода
+(NDJSON + база), с продолжением прерванного прогона.
+
+Замер на 50 тыс. товаров: python -m benchmarks.product_storage
+"""
+
+import json
+import os
+import sqlite3
+from datetime import datetime
+from typing import Dict, Iterable, List, NamedTuple, Sequence
+
+from store_db import ensure_store_schema
+from text_utils import normalize_product_name
+
+# Дополнительные колонки товара: значение по умолчанию, если скрапер его не нашёл
+EXTRA_COLUMN_DEFAULTS = {
+    'rating': 0,
+    'reviews': 0,
+    'image_url': '',
+}
+
+# Параметров в одном запросе цен (ограничение SQLite)
+PRICE_LOOKUP_CHUNK = 500
+
+# Кэш страниц соединения записи (КБ): индексы products обновляются на каждый товар
+WRITE_CACHE_SIZE_KB = 64 * 1024
+
+# Разница цен, начиная с которой цена считается изменившейся
+PRICE_EPSILON = 0.01
+
+
+class SaveCounts(NamedTuple):
+    """Итоги сохранения"""
+    new: int
+    updated: int
+    price_changed: int
+
+
+def open_store_db(db_path: str):
+    """Соединение для записи: WAL и схема магазина"""
+    conn = sqlite3.connect(db_path)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    conn.execute(f'PRAGMA cache_size = -{WRITE_CACHE_SIZE_KB}')
+    ensure_store_schema(conn)
+    return conn
+
+
+def _current_prices(conn, product_ids: List[str]) -> Dict[str, float]:
+    """Текущие цены товаров, уже записанных в базу"""
+    prices = {}
+    for start in range(0, len(product_ids), PRICE_LOOKUP_CHUNK):
+        chunk = product_ids[start:start + PRICE_LOOKUP_CHUNK]
+        prices.update(conn.execute(
+            f"SELECT product_id, current_price FROM products "
+            f"WHERE product_id IN ({','.join('?' * len(chunk))})",
+            chunk
+        ).fetchall())
+    return prices
+
+
+def _insert_sql(extra_columns: Sequence[str]) -> str:
+    columns = ['product_id', 'name', 'name_normalized', 'tokens', 'category',
+               'current_price', 'min_price', 'max_price', *extra_columns,
+               'first_seen', 'last_updated']
+    return (
+        f"INSERT INTO products ({', '.join(columns)}) "
+        f"VALUES ({', '.join('?' * len(columns))}) "
+        f"ON CONFLICT(product_id) DO UPDATE SET {_price_updates()}, "
+        + ', '.join(f'{column} = excluded.{column}' for column in
+                    ('name', 'name_normalized', 'tokens', 'category', *extra_columns, 'last_updated'))
+    )
+
+
+def _price_updates(new_price: str = 'excluded.current_price') -> str:
+    """Новые current/min/max цены в SQL (min учитывает только цены > 0, как раньше)"""
+    return (
+        f'current_price = {new_price}, '
+        f'min_price = CASE WHEN products.min_price > 0 '
+        f'THEN MIN(products.min_price, {new_price}) ELSE {new_price} END, '
+        f'max_price = MAX(products.max_price, {new_price})'
+    )
+
+
+def _update_sql(extra_columns: Sequence[str]) -> str:
+    columns = ['name', 'name_normalized', 'tokens', 'category', *extra_columns, 'last_updated']
+    return (
+        f"UPDATE products SET {', '.join(f'{column} = ?' for column in columns)}, "
+        f"{_price_updates('?')} WHERE product_id = ?"
+    )
+
+
+def write_products(conn, products: Iterable[Dict], scraped_at: str,
+                   extra_columns: Sequence[str] = ()) -> SaveCounts:
+    """
+    Записывает товары скрапера (словари с id, name, price, old_price,
+    category и extra_columns) и историю цен без commit.
+    """
+    products = [product for product in products if product.get('id', '')]
+    known_prices = _current_prices(conn, list({product['id'] for product in products}))
+
+    inserts = []
+    updates = []
+    history = []
+    events = []
+    updated_count = 0
+    price_changed_count = 0
+
+    for product in products:
+        product_id = product['id']
+        name = product.get('name', '')
+        price = product.get('price', 0)
+        old_price = product.get('old_price', 0)
+        category = product.get('category', '')
+        name_normalized, tokens = normalize_product_name(name)
+        extra = [product.get(column, EXTRA_COLUMN_DEFAULTS.get(column)) for column in extra_columns]
+
+        # Цена в базе на момент этого товара (с учётом повторов в прогоне)
+        if product_id in known_prices:
+            updates.append((name, name_normalized, tokens, category, *extra, scraped_at,
+                            price, price, price, price, product_id))
+            updated_count += 1
+            if abs((known_prices[product_id] or 0) - price) > PRICE_EPSILON:
+                history.append((product_id, price, old_price, scraped_at))
+                events.append((product_id, known_prices[product_id], price, scraped_at))
+                price_changed_count += 1
+        else:
+            inserts.append((product_id, name, name_normalized, tokens, category,
+                            price, price, price, *extra, scraped_at, scraped_at))
+            # Первая запись в историю цен
+            history.append((product_id, price, old_price, scraped_at))
+        known_prices[product_id] = price
+
+    # Новые товары вставляются в порядке прогона (id как раньше), обновления
+    # идут после них по product_id - для каждого товара порядок сохраняется.
+    # UPSERT для уже существующих строк расходовал бы значения AUTOINCREMENT.
+    updates.sort(key=lambda row: row[-1])
+
+    conn.executemany(_insert_sql(extra_columns), inserts)
+    conn.executemany(_update_sql(extra_columns), updates)
+    conn.executemany(
+        'INSERT INTO price_history (product_id, price, old_price, recorded_at) VALUES (?, ?, ?, ?)',
+        history
+    )
+    conn.executemany(
+        'INSERT INTO price_events (product_id, old_price, new_price, recorded_at) VALUES (?, ?, ?, ?)',
+        events
+    )
+    return SaveCounts(len(inserts), updated_count, price_changed_count)
+
+
+def upsert_products(conn, products: Iterable[Dict], scraped_at: str,
+                    extra_columns: Sequence[str] = ()) -> SaveCounts:
+    """Сохраняет товары скрапера и историю цен в одной транзакции"""
+    try:
+        counts = write_products(conn, products, scraped_at, extra_columns)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return counts
+
+
+# ============================================================================
+# ПОТОКОВОЕ СОХРАНЕНИЕ ПО КАТЕГОРИЯМ
+# ============================================================================
+
+class CategoryPipeline:
+    """
+    Сохранение прогона скрапера по мере обхода категорий
+
+    Товары каждой категории сразу пишутся в NDJSON-файл (одна строка -
+    один товар) и в базу, в одной транзакции с отметкой о категории
+    в scrape_run_categories. В памяти держится только текущая категория:
+    повторы из уже сохранённых категорий отсекаются по last_updated
+    (= scraped_at прогона) в базе.
+
+    Прогон, прерванный на середине, продолжается с resume=True:
+    сохранённые категории пропускаются, NDJSON обрезается до размера
+    после последней сохранённой категории. Если файла нет или он
+    короче этого размера, начинается новый прогон.
+    """
+
+    def __init__(self, db_path: str, ndjson_prefix: str,
+                 extra_columns: Sequence[str] = (), resume: bool = False):
+        self.extra_columns = tuple(extra_columns)
+        self.conn = open_store_db(db_path)
+
+        run = None
+        if resume:
+            run = self.conn.execute(
+                'SELECT id, scraped_at, ndjson_path, new_count, updated_count, price_changed_count '
+                'FROM scrape_runs WHERE finished_at IS NULL ORDER BY id DESC LIMIT 1'
+            ).fetchone()
+
+        committed = []
+        if run:
+            committed = self.conn.execute(
+                'SELECT category, ndjson_offset FROM scrape_run_categories '
+                'WHERE run_id = ? ORDER BY committed_at', (run[0],)
+            ).fetchall()
+            offset = max((offset for _, offset in committed), default=0)
+            size = os.path.getsize(run[2]) if os.path.exists(run[2]) else -1
+            if size < offset:
+                # truncate дополнил бы файл нулями - сохранённые строки потеряны
+                state = 'не найден' if size < 0 else f'короче сохранённого ({size} < {offset} байт)'
+                print(f"[!] NDJSON прогона #{run[0]} {run[2]} {state} - начинаем новый прогон")
+                run = None
+
+        if run:
+            self.run_id, self.scraped_at, self.ndjson_path = run[0], run[1], run[2]
+            self.counts = SaveCounts(*run[3:])
+            self.done = {category for category, _ in committed}
+            # Строки категорий, не попавших в базу, отбрасываем
+            with open(self.ndjson_path, 'a', encoding='utf-8') as f:
+                f.truncate(offset)
+            print(f"[*] Продолжение прогона #{self.run_id} от {self.scraped_at}: "
+                  f"сохранено категорий {len(self.done)}")
+        else:
+            self.scraped_at = datetime.now().isoformat()
+            self.ndjson_path = f"{ndjson_prefix}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.ndjson"
+            self.run_id = self.conn.execute(
+                'INSERT INTO scrape_runs (scraped_at, ndjson_path) VALUES (?, ?)',
+                (self.scraped_at, self.ndjson_path)
+            ).lastrowid
+            self.conn.commit()
+            self.counts = SaveCounts(0, 0, 0)
+            self.done = set()
+
+        self._ndjson = open(self.ndjson_path, 'a', encoding='utf-8')
+
+    def is_done(self, category: str) -> bool:
+        """Категория уже сохранена в этом прогоне"""
+        return category in self.done
+
+    def _saved_in_run(self, product_ids: List[str]) -> set:
+        """Товары, уже сохранённые в этом прогоне из других категорий"""
+        saved = set()
+        for start in range(0, len(product_ids), PRICE_LOOKUP_CHUNK):
+            chunk = product_ids[start:start + PRICE_LOOKUP_CHUNK]
+            saved.update(row[0] for row in self.conn.execute(
+                f"SELECT product_id FROM products "
+                f"WHERE product_id IN ({','.join('?' * len(chunk))}) AND last_updated = ?",
+                chunk + [self.scraped_at]
+            ).fetchall())
+        return saved
+
+    def flush(self, category: str, products: List[Dict]) -> List[Dict]:
+        """
+        Сохраняет товары категории (NDJSON, затем база)
+
+        Returns:
+            новые для прогона товары категории
+        """
+        unique = {}
+        for product in products:
+            product_id = product.get('id', '')
+            if product_id and product_id not in unique:
+                unique[product_id] = product
+        saved = self._saved_in_run(list(unique))
+        fresh = [product for product_id, product in unique.items() if product_id not in saved]
+
+        # NDJSON на диске раньше commit: при сбое между ними
+        # следующий запуск обрежет лишние строки по ndjson_offset
+        for product in fresh:
+            self._ndjson.write(json.dumps(product, ensure_ascii=False) + '\n')
+        self._ndjson.flush()
+        os.fsync(self._ndjson.fileno())
+        offset = self._ndjson.tell()
+
+        try:
+            counts = write_products(self.conn, fresh, self.scraped_at, self.extra_columns)
+            self.counts = SaveCounts(*(total + added for total, added in zip(self.counts, counts)))
+            self.conn.execute(
+                'INSERT OR REPLACE INTO scrape_run_categories '
+                '(run_id, category, product_count, ndjson_offset, committed_at) VALUES (?, ?, ?, ?, ?)',
+                (self.run_id, category, len(fresh), offset, datetime.now())
+            )
+            self.conn.execute(
+                'UPDATE scrape_runs SET new_count = ?, updated_count = ?, price_changed_count = ? '
+                'WHERE id = ?', (*self.counts, self.run_id)
+            )
+            self.conn.commit()
+        except Exception:
+            self.conn.rollback()
+            raise
+
+        self.done.add(category)
+        return fresh
+
+    def finish(self) -> SaveCounts:
+        """Завершение прогона: итоги сохранены, прогон закрыт"""
+        self.conn.execute('UPDATE scrape_runs SET finished_at = ? WHERE id = ?',
+                          (datetime.now(), self.run_id))
+        self.conn.commit()
+        return self.counts
+
+    def close(self):
+        self._ndjson.close()
+        self.conn.close()
@@ -4,10 +4,9 @@
 Проходит по всем категориям и загружает ВСЕ товары
 """
 
+import argparse
 import json
 import time
-import re
-import sqlite3
 from datetime import datetime
 from typing import List, Dict
 
@@ -19,16 +18,97 @@ from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 
+from store_db import refresh_store_summary
+from product_storage import CategoryPipeline, open_store_db, upsert_products
+from product_attributes import refresh_product_attributes
+from bulk_matching import update_all_matches
+from page_waiter import install_network_tracker, wait_for_items, wait_for_quiet
+from scraper_pool import SCRAPER_WORKERS, CategoryWorkerPool, RateLimiter
+from scraper_snapshots import KIND_CATALOG, KIND_CATEGORY, SNAPSHOT_DIR, record_snapshot
+
+# Колонки товара сверх общих (есть только у Магнита)
+EXTRA_COLUMNS = ('rating', 'reviews', 'image_url')
+
+# Карточки товаров в каталоге
+PRODUCT_CARD_SELECTOR = 'article[data-test-id="v-product-preview"]'
+
+# Поля всех карточек за один вызов. Цены и рейтинг разбираются как
+# прежним скриптом scrape_category (textContent, parseFloat(...) || 0,
+# старая цена по умолчанию равна цене); добавлены скидка и отзывы.
+# arguments[0] - селектор карточек
+EXTRACT_PRODUCTS_JS = '''
+    var text = function(root, selector) {
+        var el = root.querySelector(selector);
+        return el ? el.textContent.trim() : null;
+    };
+    // Пробелы любого вида (в т.ч. узкий неразрывный) убираются,
+    // parseFloat отбрасывает хвост вроде "/кг"; не число - 0
+    var price = function(value) {
+        return parseFloat(value.replace('₽', '').replace(/\\s/g, '').replace(',', '.')) || 0;
+    };
+    var products = [];
+    document.querySelectorAll(arguments[0]).forEach(function(article) {
+        var product = {
+            id: '', name: '', price: 0, old_price: 0, discount: '',
+            rating: 0, reviews: 0, url: '', image_url: ''
+        };
+        
+        // Ссылка и название
+        var link = article.querySelector('a[href*="/product/"]');
+        if (link) {
+            product.url = link.href || '';
+            product.name = link.title || '';
+            var match = product.url.match(/\\/product\\/(\\d+)/);
+            if (match) product.id = match[1];
+        }
+        if (!product.name) {
+            product.name = text(article, '.unit-catalog-product-preview-title') || '';
+        }
+        
+        // Цены
+        var regular = text(article, '.unit-catalog-product-preview-prices__regular');
+        if (regular !== null) product.price = price(regular);
+        var sale = text(article, '.unit-catalog-product-preview-prices__sale');
+        product.old_price = (sale !== null && price(sale)) || product.price;
+        
+        // Скидка, рейтинг, отзывы
+        product.discount = text(article, '[data-test-id="v-catalog-badge"]') || '';
+        var rating = text(article, '.unit-catalog-product-preview-rating-score');
+        if (rating !== null) product.rating = parseFloat(rating) || 0;
+        var reviews = (text(article, '.unit-catalog-product-preview-rating-comments') || '').match(/\\d+/);
+        if (reviews) product.reviews = parseInt(reviews[0], 10);
+        
+        // Изображение
+        var img = article.querySelector('img');
+        if (img) product.image_url = img.src || '';
+        
+        if (product.id && product.name) products.push(product);
+    });
+    return products;
+'''
+
 
 class MagnitScraper:
     """Скрапер для сайта Магнит"""
     
-    def __init__(self, headless: bool = True):
+    def __init__(self, headless: bool = True, adaptive_wait: bool = True):
         self.headless = headless
         self.driver = None
         self.base_url = "https://magnit.ru"
         self.all_products = []
         self.seen_product_ids = set()
+        # True - ожидание догрузки по событиям страницы, False - прежние паузы
+        self.adaptive_wait = adaptive_wait
+        # Время обхода категорий (секунды): название -> время
+        self.category_times = {}
+        # Пересчитать сопоставления с другим магазином после сохранения (--matches)
+        self.update_matches = False
+        # Задаются пулом браузеров (scraper_pool.py)
+        self.rate_limiter = None
+        self.console_lock = None
+        self.worker_name = ''
+        # Каталог для снимков страниц (scraper_snapshots.py), None - не записывать
+        self.snapshot_dir = None
     
     def start(self):
         """Запуск браузера"""
@@ -55,8 +135,14 @@ class MagnitScraper:
         """Остановка браузера"""
         if self.driver:
             self.driver.quit()
+            self.driver = None
             print("[OK] Браузер закрыт")
     
+    def _throttle(self):
+        """Общий лимит запросов пула браузеров (без пула - без ограничения)"""
+        if self.rate_limiter:
+            self.rate_limiter.wait()
+    
     def close_popups(self):
         """Закрытие всплывающих окон"""
         try:
@@ -84,40 +170,48 @@ class MagnitScraper:
         categories = []
         
         try:
-            links = self.driver.find_elements(By.CSS_SELECTOR, 'a[href*="/catalog/"]')
-            
-            seen_urls = set()
-            for link in links:
-                try:
-                    href = link.get_attribute("href") or ""
-                    text = link.text.strip()
-                    
-                    if not href or href.endswith('/catalog/') or href.endswith('/catalog') or not text:
-                        continue
-                    
-                    if href.startswith(self.base_url):
-                        href = href[len(self.base_url):]
-                    
-                    # Пропускаем промо-категории
-                    if 'promokod' in href.lower():
-                        continue
-                    
-                    if href not in seen_urls and len(text) > 2:
-                        seen_urls.add(href)
-                        categories.append({
-                            "name": text[:50],
-                            "url": href
-                        })
-                except:
-                    continue
-            
+            categories = self.parse_categories()
             print(f"[OK] Найдено {len(categories)} категорий")
+            if self.snapshot_dir:
+                record_snapshot(self.driver, self.snapshot_dir, 'magnit', KIND_CATALOG, 'catalog', categories)
             
         except Exception as e:
             print(f"[!] Ошибка получения категорий: {e}")
         
         return categories
     
+    def parse_categories(self) -> List[Dict]:
+        """Категории по ссылкам открытой страницы каталога"""
+        categories = []
+        links = self.driver.find_elements(By.CSS_SELECTOR, 'a[href*="/catalog/"]')
+        
+        seen_urls = set()
+        for link in links:
+            try:
+                href = link.get_attribute("href") or ""
+                text = link.text.strip()
+                
+                if not href or href.endswith('/catalog/') or href.endswith('/catalog') or not text:
+                    continue
+                
+                if href.startswith(self.base_url):
+                    href = href[len(self.base_url):]
+                
+                # Пропускаем промо-категории
+                if 'promokod' in href.lower():
+                    continue
+                
+                if href not in seen_urls and len(text) > 2:
+                    seen_urls.add(href)
+                    categories.append({
+                        "name": text[:50],
+                        "url": href
+                    })
+            except:
+                continue
+        
+        return categories
+    
     def load_all_products_in_category(self, max_clicks: int = 100):
         """Загрузка всех товаров в категории кликая 'Показать ещё'"""
         
@@ -131,14 +225,23 @@ class MagnitScraper:
         
         clicks = 0
         fails = 0
+        product_count = self.driver.execute_script(
+            'return document.querySelectorAll(arguments[0]).length;', PRODUCT_CARD_SELECTOR
+        )
         
         while clicks < max_clicks and fails < 3:
             try:
                 # Прокручиваем вниз
+                self._throttle()
                 self.driver.execute_script("window.scrollTo(0, document.body.scrollHeight);")
-                time.sleep(0.8)
+                if self.adaptive_wait:
+                    # Кнопка появляется, когда страница затихла после прокрутки
+                    wait_for_quiet(self.driver, quiet=0.25)
+                else:
+                    time.sleep(0.8)
                 
                 # Ищем и кликаем кнопку через JavaScript
+                self._throttle()
                 clicked = self.driver.execute_script('''
                     var btn = document.querySelector('button[data-test-id="v-pagination-show-more-button"]');
                     if (btn && btn.offsetParent !== null) {
@@ -152,10 +255,15 @@ class MagnitScraper:
                 if clicked:
                     clicks += 1
                     fails = 0
-                    time.sleep(1.2)
+                    if self.adaptive_wait:
+                        # Следующая порция карточек или тишина на странице
+                        product_count, _ = wait_for_items(self.driver, PRODUCT_CARD_SELECTOR, product_count)
+                    else:
+                        time.sleep(1.2)
                 else:
                     fails += 1
-                    time.sleep(0.5)
+                    if not self.adaptive_wait:
+                        time.sleep(0.5)
                     
             except:
                 fails += 1
@@ -165,12 +273,36 @@ class MagnitScraper:
     
     def scrape_category(self, category: Dict) -> List[Dict]:
         """Скрапинг всех товаров из категории"""
-        products = []
+        started = time.perf_counter()
+        try:
+            return self._scrape_category(category)
+        finally:
+            self.category_times[category['name']] = time.perf_counter() - started
+            print(f"    Время: {self.category_times[category['name']]:.1f} с")
+    
+    def report_category_times(self):
+        """Время обхода категорий: для сравнения режимов ожидания"""
+        if not self.category_times:
+            return
+        times = self.category_times
+        mode = 'по событиям страницы' if self.adaptive_wait else 'фиксированные паузы'
+        print(f"\n[*] Время обхода категорий ({mode}):")
+        for name, seconds in sorted(times.items(), key=lambda item: -item[1])[:10]:
+            print(f"     {seconds:6.1f} с  {name}")
+        print(f"     Всего: {sum(times.values()):.1f} с | "
+              f"в среднем: {sum(times.values()) / len(times):.1f} с на категорию")
+    
+    def _scrape_category(self, category: Dict) -> List[Dict]:
         url = f"{self.base_url}{category['url']}"
         category_name = category['name']
         
+        self._throttle()
         self.driver.get(url)
-        time.sleep(2)
+        if self.adaptive_wait:
+            install_network_tracker(self.driver)
+            wait_for_quiet(self.driver)
+        else:
+            time.sleep(2)
         self.close_popups()
         
         # Загружаем все товары
@@ -182,159 +314,28 @@ class MagnitScraper:
         # Извлекаем товары через JavaScript (быстрее)
         print(f"    [*] Извлекаю товары...")
         
-        try:
-            products_data = self.driver.execute_script('''
-                var products = [];
-                var articles = document.querySelectorAll('article[data-test-id="v-product-preview"]');
-                
-                articles.forEach(function(article) {
-                    try {
-                        var product = {};
-                        
-                        // Ссылка и ID
-                        var link = article.querySelector('a[href*="/product/"]');
-                        if (link) {
-                            product.url = link.href || '';
-                            product.name = link.title || '';
-                            var match = product.url.match(/\\/product\\/(\\d+)/);
-                            if (match) product.id = match[1];
-                        }
-                        
-                        // Название (альт)
-                        if (!product.name) {
-                            var titleEl = article.querySelector('.unit-catalog-product-preview-title');
-                            if (titleEl) product.name = titleEl.textContent.trim();
-                        }
-                        
-                        // Цена
-                        var priceEl = article.querySelector('.unit-catalog-product-preview-prices__regular');
-                        if (priceEl) {
-                            var priceText = priceEl.textContent.replace('₽', '').replace(/\\s/g, '').replace(',', '.');
-                            product.price = parseFloat(priceText) || 0;
-                        }
-                        
-                        // Старая цена
-                        var oldPriceEl = article.querySelector('.unit-catalog-product-preview-prices__sale');
-                        if (oldPriceEl) {
-                            var oldPriceText = oldPriceEl.textContent.replace('₽', '').replace(/\\s/g, '').replace(',', '.');
-                            product.old_price = parseFloat(oldPriceText) || product.price || 0;
-                        } else {
-                            product.old_price = product.price || 0;
-                        }
-                        
-                        // Рейтинг
-                        var ratingEl = article.querySelector('.unit-catalog-product-preview-rating-score');
-                        if (ratingEl) product.rating = parseFloat(ratingEl.textContent) || 0;
-                        
-                        // Изображение
-                        var img = article.querySelector('img');
-                        if (img) product.image_url = img.src || '';
-                        
-                        if (product.id && product.name) {
-                            products.push(product);
-                        }
-                    } catch(e) {}
-                });
-                
-                return products;
-            ''')
-            
-            # Добавляем категорию к каждому товару
-            for p in products_data:
-                p['category'] = category_name
-                products.append(p)
-                    
-        except Exception as e:
-            print(f"    [!] Ошибка: {e}")
+        products = self.extract_products(category_name)
+        
+        if self.snapshot_dir:
+            record_snapshot(self.driver, self.snapshot_dir, 'magnit', KIND_CATEGORY, category_name, products)
         
         return products
     
-    def _parse_product(self, article, category_name: str) -> Dict:
-        """Парсинг данных товара"""
-        product = {
-            "id": "",
-            "name": "",
-            "price": 0,
-            "old_price": 0,
-            "discount": "",
-            "rating": 0,
-            "reviews": 0,
-            "category": category_name,
-            "url": "",
-            "image_url": ""
-        }
-        
+    def extract_products(self, category_name: str) -> List[Dict]:
+        """
+        Все карточки товаров страницы одним execute_script
+        (вместо find_element на каждое поле каждой карточки)
+        """
         try:
-            # Ссылка и название
-            try:
-                link = article.find_element(By.CSS_SELECTOR, 'a[href*="/product/"]')
-                href = link.get_attribute("href") or ""
-                product["url"] = href
-                product["name"] = link.get_attribute("title") or ""
-                
-                match = re.search(r'/product/(\d+)', href)
-                if match:
-                    product["id"] = match.group(1)
-            except:
-                pass
-            
-            if not product["name"]:
-                try:
-                    title_el = article.find_element(By.CSS_SELECTOR, '.unit-catalog-product-preview-title')
-                    product["name"] = title_el.text.strip()
-                except:
-                    pass
-            
-            # Цена
-            try:
-                price_el = article.find_element(By.CSS_SELECTOR, '.unit-catalog-product-preview-prices__regular')
-                price_text = price_el.text.replace('₽', '').replace(' ', '').replace(',', '.').strip()
-                product["price"] = float(price_text)
-            except:
-                pass
-            
-            # Старая цена
-            try:
-                old_price_el = article.find_element(By.CSS_SELECTOR, '.unit-catalog-product-preview-prices__sale')
-                old_price_text = old_price_el.text.replace('₽', '').replace(' ', '').replace(',', '.').strip()
-                product["old_price"] = float(old_price_text)
-            except:
-                product["old_price"] = product["price"]
-            
-            # Скидка
-            try:
-                discount_el = article.find_element(By.CSS_SELECTOR, '[data-test-id="v-catalog-badge"]')
-                product["discount"] = discount_el.text.strip()
-            except:
-                pass
-            
-            # Рейтинг
-            try:
-                rating_el = article.find_element(By.CSS_SELECTOR, '.unit-catalog-product-preview-rating-score')
-                product["rating"] = float(rating_el.text.strip())
-            except:
-                pass
-            
-            # Отзывы
-            try:
-                reviews_el = article.find_element(By.CSS_SELECTOR, '.unit-catalog-product-preview-rating-comments')
-                match = re.search(r'(\d+)', reviews_el.text)
-                if match:
-                    product["reviews"] = int(match.group(1))
-            except:
-                pass
-            
-            # Изображение
-            try:
-                img = article.find_element(By.CSS_SELECTOR, 'img')
-                product["image_url"] = img.get_attribute("src") or ""
-            except:
-                pass
-                
-        except:
-            pass
+            products = self.driver.execute_script(EXTRACT_PRODUCTS_JS, PRODUCT_CARD_SELECTOR)
+        except Exception as e:
+            print(f"    [!] Ошибка: {e}")
+            return []
         
-        return product
+        # Добавляем категорию к каждому товару
+        for product in products:
+            product["category"] = category_name
+        return products
     
     def save_to_database(self):
         """Сохранение в базу данных"""
@@ -344,99 +345,33 @@ class MagnitScraper:
         
         scraped_at = datetime.now().isoformat()
         
-        conn = sqlite3.connect('products_magnit.db')
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS products (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                product_id TEXT UNIQUE NOT NULL,
-                name TEXT NOT NULL,
-                category TEXT,
-                current_price REAL DEFAULT 0,
-                min_price REAL DEFAULT 0,
-                max_price REAL DEFAULT 0,
-                rating REAL DEFAULT 0,
-                reviews INTEGER DEFAULT 0,
-                image_url TEXT,
-                first_seen TIMESTAMP,
-                last_updated TIMESTAMP
-            )
-        ''')
-        
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS price_history (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                product_id TEXT NOT NULL,
-                price REAL NOT NULL,
-                old_price REAL,
-                recorded_at TIMESTAMP
-            )
-        ''')
-        
-        new_count = 0
-        updated_count = 0
-        price_changed_count = 0
-        
-        for product in self.all_products:
-            product_id = product.get('id', '')
-            if not product_id:
-                continue
-            
-            name = product.get('name', '')
-            price = product.get('price', 0)
-            old_price = product.get('old_price', 0)
-            category = product.get('category', '')
-            rating = product.get('rating', 0)
-            reviews = product.get('reviews', 0)
-            image_url = product.get('image_url', '')
-            
-            cursor.execute('SELECT current_price, min_price, max_price FROM products WHERE product_id = ?', (product_id,))
-            existing = cursor.fetchone()
-            
-            if existing:
-                old_db_price, min_price, max_price = existing
-                
-                new_min = min(min_price, price) if min_price > 0 else price
-                new_max = max(max_price, price)
-                
-                cursor.execute('''
-                    UPDATE products 
-                    SET name = ?, category = ?, current_price = ?, 
-                        min_price = ?, max_price = ?, rating = ?, reviews = ?,
-                        image_url = ?, last_updated = ?
-                    WHERE product_id = ?
-                ''', (name, category, price, new_min, new_max, rating, reviews, image_url, scraped_at, product_id))
-                
-                updated_count += 1
-                
-                if abs(old_db_price - price) > 0.01:
-                    cursor.execute('''
-                        INSERT INTO price_history (product_id, price, old_price, recorded_at)
-                        VALUES (?, ?, ?, ?)
-                    ''', (product_id, price, old_price, scraped_at))
-                    price_changed_count += 1
-            else:
-                cursor.execute('''
-                    INSERT INTO products (product_id, name, category, current_price, min_price, max_price, 
-                                         rating, reviews, image_url, first_seen, last_updated)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                ''', (product_id, name, category, price, price, price, rating, reviews, image_url, scraped_at, scraped_at))
-                
-                cursor.execute('''
-                    INSERT INTO price_history (product_id, price, old_price, recorded_at)
-                    VALUES (?, ?, ?, ?)
-                ''', (product_id, price, old_price, scraped_at))
-                
-                new_count += 1
+        conn = open_store_db('products_magnit.db')
+        counts = upsert_products(conn, self.all_products, scraped_at, extra_columns=EXTRA_COLUMNS)
+        self._finish_database(conn, counts)
+    
+    def _finish_database(self, conn, counts):
+        """Обработка базы после сохранения товаров прогона"""
+        # Атрибуты товаров для сравнения цен (пачкой после скрапинга)
+        parsed = refresh_product_attributes(conn)
         
-        conn.commit()
+        # Категории и статистика магазина для веб-приложения
+        refresh_store_summary(conn)
         conn.close()
         
         print(f"[OK] Сохранено в products_magnit.db:")
-        print(f"     Новых товаров: {new_count}")
-        print(f"     Обновлено: {updated_count}")
-        print(f"     Цена изменилась: {price_changed_count}")
+        print(f"     Новых товаров: {counts.new}")
+        print(f"     Обновлено: {counts.updated}")
+        print(f"     Цена изменилась: {counts.price_changed}")
+        print(f"     Разобрано атрибутов: {parsed}")
+        
+        # Аналоги в другом магазине для страницы товара и /api/compare.
+        # Полный пересчёт на всех ядрах - только по запросу (--matches),
+        # иначе отдельно: python bulk_matching.py
+        if self.update_matches:
+            print("[*] Пересчёт сопоставлений между магазинами...")
+            update_all_matches()
+        else:
+            print("[*] Сопоставления не пересчитаны: python bulk_matching.py или --matches")
     
     def save_to_json(self):
         """Сохранение в JSON"""
@@ -459,12 +394,71 @@ class MagnitScraper:
         print(f"[OK] Сохранено: {filename}")
 
 
-def main():
+def _scrape_sequential(scraper, categories, storage):
+    """Категории по очереди в одном браузере: (категория, товары)"""
+    total = len(categories)
+    for i, category in enumerate(categories, 1):
+        print(f"\n[{i}/{total}] {category['name']}...")
+        
+        if storage and storage.is_done(category['name']):
+            print("    Уже сохранена в этом прогоне - пропуск")
+            continue
+        
+        yield category, scraper.scrape_category(category)
+        time.sleep(1)
+
+
+def _scrape_parallel(scraper, categories, storage, workers):
+    """Категории в пуле браузеров (по мере готовности): (категория, товары)"""
+    pending = [category for category in categories
+               if not (storage and storage.is_done(category['name']))]
+    if len(pending) < len(categories):
+        print(f"[*] Уже сохранено в этом прогоне: {len(categories) - len(pending)} категорий - пропуск")
+    
+    def make_scraper():
+        # Настройки и общее время категорий - от основного скрапера
+        worker = MagnitScraper(headless=False, adaptive_wait=scraper.adaptive_wait)
+        worker.category_times = scraper.category_times
+        worker.snapshot_dir = scraper.snapshot_dir
+        return worker
+    
+    pool = CategoryWorkerPool(make_scraper, workers=workers, rate_limiter=RateLimiter())
+    print(f"[*] Браузеров: {pool.workers}, запросов в секунду не больше {pool.rate_limiter.rate:g}")
+    
+    for i, (category, products) in enumerate(pool.run(pending), 1):
+        print(f"\n[{i}/{len(pending)}] {category['name']}")
+        if products is None:
+            print("    [!] Категория не обработана")
+            continue
+        yield category, products
+
+
+def main(pipeline: bool = False, resume: bool = False, adaptive_wait: bool = True,
+         workers: int = 1, record: str = None,
+         update_matches: bool = False):
+    """
+    Основная функция скрапера.
+    
+    Args:
+        pipeline: сохранять каждую категорию сразу (база + NDJSON)
+        resume: продолжить прерванный потоковый прогон
+        adaptive_wait: ждать догрузки по событиям страницы (False - прежние паузы)
+        workers: браузеров для параллельного обхода категорий (1 - по очереди)
+        record: каталог для снимков страниц (scraper_snapshots.py)
+        update_matches: пересчитать сопоставления между магазинами после сохранения
+    """
     print("="*60)
     print("  СКРАПЕР МАГНИТ - ВСЕ КАТЕГОРИИ + ВСЕ ТОВАРЫ")
     print("="*60)
     
-    scraper = MagnitScraper(headless=False)  # Видимый режим
+    scraper = MagnitScraper(headless=False, adaptive_wait=adaptive_wait)  # Видимый режим
+    scraper.snapshot_dir = record
+    scraper.update_matches = update_matches
+    storage = None
+    if pipeline or resume:
+        storage = CategoryPipeline('products_magnit.db', 'products_magnit',
+                                   extra_columns=EXTRA_COLUMNS, resume=resume)
+    saved_total = 0
     
     try:
         scraper.start()
@@ -479,10 +473,22 @@ def main():
         print(f"\n[*] Скрапинг {total} категорий (все товары в каждой)...")
         print("-"*60)
         
-        for i, category in enumerate(categories, 1):
-            print(f"\n[{i}/{total}] {category['name']}...")
-            
-            products = scraper.scrape_category(category)
+        started = time.perf_counter()
+        if workers > 1:
+            # Категории получены - дальше работают браузеры пула
+            scraper.stop()
+            results = _scrape_parallel(scraper, categories, storage, workers)
+        else:
+            results = _scrape_sequential(scraper, categories, storage)
+        
+        # Результаты собираются здесь: повторы товаров и запись в базу - в одном потоке
+        for category, products in results:
+            if storage:
+                # Потоковый режим: категория сразу в базу и NDJSON
+                fresh = storage.flush(category['name'], products)
+                saved_total += len(fresh)
+                print(f"    Найдено: {len(products)} | Новых: {len(fresh)} | Сохранено: {saved_total}")
+                continue
             
             # Фильтруем дубликаты
             new_products = 0
@@ -494,26 +500,55 @@ def main():
                     new_products += 1
             
             print(f"    Найдено: {len(products)} | Новых: {new_products} | Всего: {len(scraper.all_products)}")
-            time.sleep(1)
-        
-        print("\n" + "="*60)
-        print(f"[OK] Всего уникальных товаров: {len(scraper.all_products)}")
-        print("="*60)
         
-        if scraper.all_products:
-            print("\nПримеры:")
-            for p in scraper.all_products[:5]:
-                print(f"  - {p['name'][:40]}... | {p['category'][:15]} | {p['price']} руб.")
+        scraper.report_category_times()
+        print(f"     Обход категорий: {time.perf_counter() - started:.1f} с "
+              f"(браузеров: {max(1, workers)})")
+        
+        if storage:
+            counts = storage.finish()
+            print("\n" + "="*60)
+            print(f"[OK] Сохранено товаров: {saved_total} -> {storage.ndjson_path}")
+            print("="*60)
+            scraper._finish_database(storage.conn, counts)
+        else:
+            print("\n" + "="*60)
+            print(f"[OK] Всего уникальных товаров: {len(scraper.all_products)}")
+            print("="*60)
+        
+            if scraper.all_products:
+                print("\nПримеры:")
+                for p in scraper.all_products[:5]:
+                    print(f"  - {p['name'][:40]}... | {p['category'][:15]} | {p['price']} руб.")
             
-            print("\n[*] Сохранение...")
-            scraper.save_to_database()
-            scraper.save_to_json()
+                print("\n[*] Сохранение...")
+                scraper.save_to_database()
+                scraper.save_to_json()
         
     finally:
         scraper.stop()
+        if storage:
+            storage.close()
     
     print("\n[OK] Готово!")
 
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description='Скрапер Магнита')
+    parser.add_argument('--pipeline', action='store_true',
+                        help='Сохранять каждую категорию сразу (база + NDJSON)')
+    parser.add_argument('--resume', action='store_true',
+                        help='Продолжить прерванный потоковый прогон')
+    parser.add_argument('--fixed-waits', action='store_true',
+                        help='Прежние фиксированные паузы вместо ожидания по событиям (для сравнения времени)')
+    parser.add_argument('--workers', type=int, nargs='?', const=SCRAPER_WORKERS, default=1,
+                        help=f'Параллельный обход категорий: браузеров (без числа - {SCRAPER_WORKERS})')
+    parser.add_argument('--record', nargs='?', const=SNAPSHOT_DIR, default=None, metavar='DIR',
+                        help=f'Сохранять снимки страниц для офлайн-проверки (по умолчанию {SNAPSHOT_DIR})')
+    parser.add_argument('--matches', action='store_true',
+                        help='Пересчитать сопоставления между магазинами после сохранения (bulk_matching.py)')
+    args = parser.parse_args()
+    
+    main(pipeline=args.pipeline, resume=args.resume, adaptive_wait=not args.fixed_waits,
+         workers=args.workers, record=args.record,
+         update_matches=args.matches)
@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+"""
+Параллельный обход категорий несколькими браузерами
+
+Каждый воркер - отдельный поток со своим скрапером (и своим Chrome),
+берёт категории из общей очереди. Результаты собираются в основном
+потоке в порядке готовности: там же фильтруются повторы товаров
+и идёт запись в базу, поэтому скраперам и CategoryPipeline не нужна
+синхронизация.
+
+Общий RateLimiter ограничивает частоту запросов к сайту всех браузеров
+вместе (SCRAPER_MAX_REQUESTS_PER_SECOND): больше воркеров - меньше
+простоя на ожидание отрисовки, но не больше запросов.
+
+Капча: каждый воркер проверяет её в своём браузере, а запрос ENTER
+в консоли выдаётся по одному (console_lock) - остальные воркеры
+в это время продолжают работу.
+"""
+
+import queue
+import threading
+import time
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+try:
+    from config import SCRAPER_WORKERS, SCRAPER_MAX_REQUESTS_PER_SECOND
+except ImportError:
+    SCRAPER_WORKERS = 3
+    SCRAPER_MAX_REQUESTS_PER_SECOND = 2.0
+
+
+class RateLimiter:
+    """Не больше rate действий в секунду на все потоки"""
+
+    def __init__(self, rate: float = SCRAPER_MAX_REQUESTS_PER_SECOND):
+        self.rate = rate
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self._lock = threading.Lock()
+        self._next_slot = 0.0
+
+    def wait(self):
+        """Дождаться своей очереди на запрос"""
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot)
+            self._next_slot = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+# Воркер закончил работу (в очереди результатов)
+_WORKER_DONE = object()
+
+
+class CategoryWorkerPool:
+    """
+    Пул браузеров для обхода категорий
+
+    make_scraper() создаёт скрапер с методами start(), stop() и
+    scrape_category(category) и атрибутами rate_limiter, console_lock,
+    worker_name. prepare(scraper) вызывается после start() - например,
+    открыть каталог и пройти капчу.
+    """
+
+    def __init__(self, make_scraper: Callable, workers: int = SCRAPER_WORKERS,
+                 rate_limiter: Optional[RateLimiter] = None,
+                 prepare: Optional[Callable] = None):
+        self.make_scraper = make_scraper
+        self.workers = max(1, workers)
+        self.rate_limiter = rate_limiter or RateLimiter()
+        self.prepare = prepare
+        self.console_lock = threading.Lock()
+        self._stop = threading.Event()
+
+    def _worker(self, number: int, tasks: queue.Queue, results: queue.Queue):
+        scraper = self.make_scraper()
+        scraper.rate_limiter = self.rate_limiter
+        scraper.console_lock = self.console_lock
+        scraper.worker_name = f"воркер {number}"
+        try:
+            scraper.start()
+            if self.prepare:
+                self.prepare(scraper)
+
+            while not self._stop.is_set():
+                try:
+                    category = tasks.get_nowait()
+                except queue.Empty:
+                    break
+                try:
+                    products = scraper.scrape_category(category)
+                except Exception as e:
+                    print(f"    [!] {scraper.worker_name}: ошибка в категории {category['name']}: {e}")
+                    products = None
+                results.put((category, products))
+        except Exception as e:
+            print(f"[!] {scraper.worker_name}: браузер остановлен: {e}")
+        finally:
+            try:
+                scraper.stop()
+            finally:
+                results.put(_WORKER_DONE)
+
+    def run(self, categories: Iterable[Dict]) -> Iterator[Tuple[Dict, Optional[List[Dict]]]]:
+        """
+        Обходит категории и выдаёт (категория, товары) по мере готовности.
+        Товары None - категория не обработана из-за ошибки.
+        """
+        tasks = queue.Queue()
+        for category in categories:
+            tasks.put(category)
+        results = queue.Queue()
+
+        self._stop.clear()
+        threads = [
+            threading.Thread(target=self._worker, args=(number, tasks, results),
+                             name=f'scraper-worker-{number}', daemon=True)
+            for number in range(1, min(self.workers, tasks.qsize()) + 1)
+        ]
+        for thread in threads:
+            thread.start()
+
+        try:
+            running = len(threads)
+            while running:
+                item = results.get()
+                if item is _WORKER_DONE:
+                    running -= 1
+                else:
+                    yield item
+        finally:
+            # Прерывание: воркеры доделывают текущую категорию и закрывают браузеры
+            self._stop.set()
+            for thread in threads:
+                thread.join()
+
+        if not tasks.empty():
+            print(f"[!] Не обработано категорий: {tasks.qsize()} (все браузеры остановились)")
@@ -0,0 +1,197 @@
+# -*- coding: utf-8 -*-
+"""
+Снимки страниц скраперов для офлайн-проверки извлечения товаров
+
+Запись (скраперы с --record DIR): после загрузки категории HTML
+страницы сохраняется в DIR/<магазин>/, рядом - товары, которые
+извлёк скрапер при записи (ожидаемый результат), для каталога
+Пятёрочки ещё и JSON из __NEXT_DATA__. Список снимков - index.json.
+
+В сохранённую страницу добавляются <base href="адрес страницы">
+(ссылки и картинки разрешаются как на сайте) и Content-Security-Policy,
+запрещающая любые загрузки; скрипты сайта вырезаются (кроме JSON).
+Поэтому воспроизведение полностью офлайн и даёт те же url товаров.
+
+Воспроизведение: replay() открывает снимки через file:// или локальный
+HTTP-сервер (SnapshotServer) и выдаёт страницы по одной - на них
+запускается то же извлечение, что в скраперах.
+Замер и сверка с записанными результатами: python -m benchmarks.scraper_replay
+"""
+
+import http.server
+import json
+import os
+import re
+import threading
+from datetime import datetime
+from functools import partial
+from html import escape
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional
+from urllib.parse import quote
+
+# Каталог снимков по умолчанию
+SNAPSHOT_DIR = os.path.join('fixtures', 'scraper')
+
+# Виды снимков
+KIND_CATALOG = 'catalog'    # страница со списком категорий
+KIND_CATEGORY = 'category'  # страница категории со всеми товарами
+
+# Исполняемые скрипты страницы (JSON-данные вроде __NEXT_DATA__ остаются)
+_SCRIPT_RE = re.compile(
+    r'<script\b(?![^>]*\btype=["\']application/(?:ld\+)?json["\'])[^>]*>.*?</script>',
+    re.IGNORECASE | re.DOTALL
+)
+_HEAD_RE = re.compile(r'<head\b[^>]*>', re.IGNORECASE)
+
+# Никаких загрузок при воспроизведении: ни скриптов, ни картинок, ни запросов
+_OFFLINE_CSP = "default-src 'none'; style-src 'unsafe-inline'"
+
+_index_lock = threading.Lock()
+
+
+def _store_dir(snapshot_dir: str, store: str) -> str:
+    return os.path.join(snapshot_dir, store)
+
+
+def _slug(text: str) -> str:
+    return re.sub(r'\W+', '_', text).strip('_')[:60] or 'page'
+
+
+def load_index(snapshot_dir: str, store: str) -> List[Dict]:
+    """Снимки магазина в порядке записи"""
+    path = os.path.join(_store_dir(snapshot_dir, store), 'index.json')
+    if not os.path.exists(path):
+        return []
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _save_json(path: str, data):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=1)
+    os.replace(tmp_path, path)
+
+
+def offline_html(html: str, url: str) -> str:
+    """HTML страницы для офлайн-воспроизведения: без скриптов, с base и CSP"""
+    html = _SCRIPT_RE.sub('', html)
+    head = (f'<base href="{escape(url)}">'
+            f'<meta http-equiv="Content-Security-Policy" content="{_OFFLINE_CSP}">')
+    match = _HEAD_RE.search(html)
+    if match:
+        return html[:match.end()] + head + html[match.end():]
+    return f'<head>{head}</head>' + html
+
+
+def record_snapshot(driver, snapshot_dir: str, store: str, kind: str, name: str,
+                    expected: List[Dict], next_data: Optional[Dict] = None) -> Dict:
+    """
+    Сохранить текущую страницу браузера и результат извлечения
+
+    Повторная запись той же страницы (kind, name) заменяет снимок.
+    Безопасно из нескольких потоков (пул браузеров).
+    """
+    store_dir = _store_dir(snapshot_dir, store)
+    os.makedirs(store_dir, exist_ok=True)
+    base = f"{kind}_{_slug(name)}"
+    url = driver.current_url
+
+    with open(os.path.join(store_dir, base + '.html'), 'w', encoding='utf-8') as f:
+        f.write(offline_html(driver.page_source, url))
+    _save_json(os.path.join(store_dir, base + '.expected.json'), expected)
+    if next_data is not None:
+        _save_json(os.path.join(store_dir, base + '.next_data.json'), next_data)
+
+    snapshot = {
+        'kind': kind,
+        'name': name,
+        'url': url,
+        'html': base + '.html',
+        'expected': base + '.expected.json',
+        'next_data': base + '.next_data.json' if next_data is not None else None,
+        'count': len(expected),
+        'recorded_at': datetime.now().isoformat(timespec='seconds'),
+    }
+    with _index_lock:
+        index = [item for item in load_index(snapshot_dir, store)
+                 if (item['kind'], item['name']) != (kind, name)]
+        index.append(snapshot)
+        _save_json(os.path.join(store_dir, 'index.json'), index)
+    return snapshot
+
+
+def load_expected(snapshot_dir: str, store: str, snapshot: Dict) -> List[Dict]:
+    """Результат извлечения, записанный вместе со снимком"""
+    with open(os.path.join(_store_dir(snapshot_dir, store), snapshot['expected']), encoding='utf-8') as f:
+        return json.load(f)
+
+
+def load_next_data(snapshot_dir: str, store: str, snapshot: Dict) -> Optional[Dict]:
+    """JSON __NEXT_DATA__ снимка (если сохранялся)"""
+    if not snapshot.get('next_data'):
+        return None
+    with open(os.path.join(_store_dir(snapshot_dir, store), snapshot['next_data']), encoding='utf-8') as f:
+        return json.load(f)
+
+
+def save_expected(snapshot_dir: str, store: str, snapshot: Dict, expected: List[Dict]):
+    """Заменить ожидаемый результат (после намеренного изменения извлечения)"""
+    _save_json(os.path.join(_store_dir(snapshot_dir, store), snapshot['expected']), expected)
+
+
+def start_headless_driver():
+    """Headless Chrome для воспроизведения снимков"""
+    from selenium import webdriver
+    from selenium.webdriver.chrome.options import Options
+    from selenium.webdriver.chrome.service import Service
+    from webdriver_manager.chrome import ChromeDriverManager
+
+    options = Options()
+    options.add_argument('--headless=new')
+    options.add_argument('--no-sandbox')
+    options.add_argument('--disable-dev-shm-usage')
+    return webdriver.Chrome(service=Service(ChromeDriverManager().install()), options=options)
+
+
+class SnapshotServer:
+    """Локальный HTTP-сервер каталога снимков (вместо file://)"""
+
+    def __init__(self, snapshot_dir: str):
+        handler = partial(_QuietHandler, directory=os.path.abspath(snapshot_dir))
+        self._server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), handler)
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        return f'http://127.0.0.1:{self._server.server_address[1]}'
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+class _QuietHandler(http.server.SimpleHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+def replay(driver, snapshot_dir: str, store: str, server: Optional[SnapshotServer] = None,
+           kind: Optional[str] = None) -> Iterator[Dict]:
+    """
+    Открывает снимки магазина в браузере по одному и выдаёт описание
+    снимка, пока страница открыта (извлечение - на стороне вызывающего).
+    """
+    for snapshot in load_index(snapshot_dir, store):
+        if kind and snapshot['kind'] != kind:
+            continue
+        if server:
+            driver.get(f"{server.base_url}/{quote(store)}/{quote(snapshot['html'])}")
+        else:
+            driver.get(Path(_store_dir(snapshot_dir, store), snapshot['html']).resolve().as_uri())
+        yield snapshot
@@ -4,14 +4,15 @@
 """
 
 import sys
+import argparse
 if sys.platform == 'win32':
     sys.stdout.reconfigure(encoding='utf-8')
 
 import json
 import time
 import csv
+from contextlib import nullcontext
 import re
-import sqlite3
 from datetime import datetime
 
 from selenium import webdriver
@@ -22,13 +23,36 @@ from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 
+from store_db import refresh_store_summary
+from product_storage import CategoryPipeline, open_store_db, upsert_products
+from product_attributes import refresh_product_attributes
+from bulk_matching import update_all_matches
+from page_waiter import install_network_tracker, wait_for_items, wait_for_quiet
+from scraper_pool import SCRAPER_WORKERS, CategoryWorkerPool, RateLimiter
+from scraper_snapshots import KIND_CATALOG, KIND_CATEGORY, SNAPSHOT_DIR, record_snapshot
+
+# Карточки товаров в каталоге
+PRODUCT_CARD_SELECTOR = 'div[itemprop="itemListElement"], a[href*="/product/"]'
+
 
 class Scraper5ka:
-    def __init__(self):
+    def __init__(self, adaptive_wait: bool = True):
         self.driver = None
         self.all_products = []
         self.categories = []
         self.seen_product_ids = set()
+        # True - ожидание догрузки по событиям страницы, False - прежние паузы
+        self.adaptive_wait = adaptive_wait
+        # Время обхода категорий (секунды): название -> время
+        self.category_times = {}
+        # Пересчитать сопоставления с другим магазином после сохранения (--matches)
+        self.update_matches = False
+        # Задаются пулом браузеров (scraper_pool.py)
+        self.rate_limiter = None
+        self.console_lock = None
+        self.worker_name = ''
+        # Каталог для снимков страниц (scraper_snapshots.py), None - не записывать
+        self.snapshot_dir = None
     
     def start(self):
         """Запуск браузера"""
@@ -50,17 +74,33 @@ class Scraper5ka:
         """Остановка браузера"""
         if self.driver:
             self.driver.quit()
+            self.driver = None
             print("[OK] Браузер закрыт")
     
+    def _throttle(self):
+        """Общий лимит запросов пула браузеров (без пула - без ограничения)"""
+        if self.rate_limiter:
+            self.rate_limiter.wait()
+    
     def check_captcha(self):
         """Проверка и обработка капчи"""
         if "Разверните картинку" in self.driver.page_source or "captcha" in self.driver.page_source.lower():
-            print("\n    [!] Обнаружена капча! Пройдите её в браузере...")
-            input("    >>> Нажмите ENTER после прохождения... ")
+            # В пуле браузеров ENTER ждём по одному воркеру за раз
+            with self.console_lock or nullcontext():
+                where = f" ({self.worker_name})" if self.worker_name else ""
+                print(f"\n    [!] Обнаружена капча{where}! Пройдите её в браузере...")
+                input("    >>> Нажмите ENTER после прохождения... ")
             time.sleep(2)
             return True
         return False
     
+    def open_catalog(self):
+        """Каталог в браузере воркера пула: капча до обхода категорий"""
+        self._throttle()
+        self.driver.get("https://5ka.ru/catalog/")
+        time.sleep(3)
+        self.check_captcha()
+    
     def wait_for_catalog(self):
         """Ожидание загрузки каталога"""
         print("\n[*] Загрузка каталога...")
@@ -76,52 +116,75 @@ class Scraper5ka:
         print("\n[*] Получение категорий...")
         
         try:
-            script = self.driver.find_element(By.ID, "__NEXT_DATA__")
-            data = json.loads(script.get_attribute("innerHTML"))
-            
-            props = data.get("props", {}).get("pageProps", {}).get("props", {})
-            catalog_store = props.get("catalogStore", "{}")
-            
-            if isinstance(catalog_store, str):
-                catalog_store = json.loads(catalog_store)
-            
-            sections = catalog_store.get("_sections", [])
-            
-            for section in sections:
-                cat_id = section.get("id", "")
-                cat_name = section.get("name", "")
-                if cat_id and cat_name:
-                    self.categories.append({
-                        "id": cat_id,
-                        "name": cat_name
-                    })
+            data = self._next_data()
+            self.categories.extend(self.categories_from_next_data(data))
             
             print(f"[OK] Найдено {len(self.categories)} категорий")
+            if self.snapshot_dir:
+                record_snapshot(self.driver, self.snapshot_dir, '5ka', KIND_CATALOG, 'catalog',
+                                self.categories, next_data=data)
             return self.categories
             
         except Exception as e:
             print(f"[!] Ошибка: {e}")
             return []
     
+    def _next_data(self):
+        """JSON из __NEXT_DATA__ открытой страницы"""
+        script = self.driver.find_element(By.ID, "__NEXT_DATA__")
+        return json.loads(script.get_attribute("innerHTML"))
+    
+    def parse_categories(self):
+        """Категории открытой страницы каталога (без изменения self.categories)"""
+        return self.categories_from_next_data(self._next_data())
+    
+    @staticmethod
+    def categories_from_next_data(data):
+        """Категории из JSON __NEXT_DATA__ каталога"""
+        props = data.get("props", {}).get("pageProps", {}).get("props", {})
+        catalog_store = props.get("catalogStore", "{}")
+        
+        if isinstance(catalog_store, str):
+            catalog_store = json.loads(catalog_store)
+        
+        sections = catalog_store.get("_sections", [])
+        
+        categories = []
+        for section in sections:
+            cat_id = section.get("id", "")
+            cat_name = section.get("name", "")
+            if cat_id and cat_name:
+                categories.append({
+                    "id": cat_id,
+                    "name": cat_name
+                })
+        return categories
+    
     def scroll_to_load_all(self, max_scrolls: int = 200, scroll_pause: float = 0.8):
         """
         Прокручиваем страницу вниз пока появляются новые товары.
         Возвращает количество прокруток.
+        
+        В режиме adaptive_wait после прокрутки ждём не scroll_pause,
+        а появления новых карточек или затихания страницы (page_waiter).
         """
+        if self.adaptive_wait:
+            return self._scroll_adaptive(max_scrolls)
+        
         scroll_count = 0
         no_change_count = 0
         last_product_count = 0
         
         while scroll_count < max_scrolls and no_change_count < 5:
             # Прокручиваем вниз
+            self._throttle()
             self.driver.execute_script("window.scrollTo(0, document.body.scrollHeight);")
             time.sleep(scroll_pause)
             
             # Считаем текущее количество товаров на странице
-            current_count = self.driver.execute_script('''
-                var items = document.querySelectorAll('div[itemprop="itemListElement"], a[href*="/product/"]');
-                return items.length;
-            ''')
+            current_count = self.driver.execute_script(
+                'return document.querySelectorAll(arguments[0]).length;', PRODUCT_CARD_SELECTOR
+            )
             
             if current_count == last_product_count:
                 no_change_count += 1
@@ -138,15 +201,59 @@ class Scraper5ka:
         
         return scroll_count
     
+    def _scroll_adaptive(self, max_scrolls: int):
+        """
+        Прокрутка с ожиданием по событиям: новые карточки - сразу следующая
+        прокрутка; страница затихла без новых карточек два раза подряд
+        (нет изменений DOM и запросов) - товары закончились.
+        """
+        scroll_count = 0
+        quiet_count = 0
+        last_product_count = self.driver.execute_script(
+            'return document.querySelectorAll(arguments[0]).length;', PRODUCT_CARD_SELECTOR
+        )
+        
+        while scroll_count < max_scrolls and quiet_count < 2:
+            self._throttle()
+            self.driver.execute_script("window.scrollTo(0, document.body.scrollHeight);")
+            current_count, _ = wait_for_items(self.driver, PRODUCT_CARD_SELECTOR, last_product_count)
+            
+            if current_count > last_product_count:
+                quiet_count = 0
+                last_product_count = current_count
+            else:
+                quiet_count += 1
+            
+            scroll_count += 1
+            
+            if scroll_count % 10 == 0:
+                if self.check_captcha():
+                    install_network_tracker(self.driver)
+                    quiet_count = 0
+        
+        return scroll_count
+    
     def scrape_category(self, category):
         """Скрапинг всех товаров из категории через прокрутку"""
         cat_id = category["id"]
         cat_name = category["name"]
-        
+        started = time.perf_counter()
+        try:
+            return self._scrape_category(cat_id, cat_name)
+        finally:
+            self.category_times[cat_name] = time.perf_counter() - started
+            print(f"    Время: {self.category_times[cat_name]:.1f} с")
+    
+    def _scrape_category(self, cat_id, cat_name):
         # Переходим на категорию
         url = f"https://5ka.ru/catalog/{cat_id}/"
+        self._throttle()
         self.driver.get(url)
-        time.sleep(3)
+        if self.adaptive_wait:
+            install_network_tracker(self.driver)
+            wait_for_quiet(self.driver)
+        else:
+            time.sleep(3)
         
         # Проверяем капчу
         self.check_captcha()
@@ -166,15 +273,33 @@ class Scraper5ka:
         print(f"({scrolls} раз)")
         
         # Небольшая пауза для догрузки
-        time.sleep(1)
+        if self.adaptive_wait:
+            wait_for_quiet(self.driver)
+        else:
+            time.sleep(1)
         
         # Извлекаем товары
         print("    Извлечение товаров...", end=" ", flush=True)
         products = self._extract_products_js(cat_name)
         print(f"найдено {len(products)}")
         
+        if self.snapshot_dir:
+            record_snapshot(self.driver, self.snapshot_dir, '5ka', KIND_CATEGORY, cat_name, products)
+        
         return products
     
+    def report_category_times(self):
+        """Время обхода категорий: для сравнения режимов ожидания"""
+        if not self.category_times:
+            return
+        times = self.category_times
+        mode = 'по событиям страницы' if self.adaptive_wait else 'фиксированные паузы'
+        print(f"\n[*] Время обхода категорий ({mode}):")
+        for name, seconds in sorted(times.items(), key=lambda item: -item[1])[:10]:
+            print(f"     {seconds:6.1f} с  {name}")
+        print(f"     Всего: {sum(times.values()):.1f} с | "
+              f"в среднем: {sum(times.values()) / len(times):.1f} с на категорию")
+    
     def _extract_products_js(self, category_name):
         """Извлечение товаров через JavaScript"""
         try:
@@ -380,106 +505,91 @@ class Scraper5ka:
     
     def _save_to_database(self, scraped_at):
         """Сохранение в SQLite с поддержкой истории цен"""
-        conn = sqlite3.connect('products.db')
-        cursor = conn.cursor()
-        
-        # Создаём таблицы если не существуют
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS products (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                product_id TEXT UNIQUE NOT NULL,
-                name TEXT NOT NULL,
-                category TEXT,
-                current_price REAL DEFAULT 0,
-                min_price REAL DEFAULT 0,
-                max_price REAL DEFAULT 0,
-                first_seen TIMESTAMP,
-                last_updated TIMESTAMP
-            )
-        ''')
-        
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS price_history (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                product_id TEXT NOT NULL,
-                price REAL NOT NULL,
-                old_price REAL,
-                recorded_at TIMESTAMP
-            )
-        ''')
-        
-        new_count = 0
-        updated_count = 0
-        price_changed_count = 0
-        
-        for product in self.all_products:
-            product_id = product.get('id', '')
-            if not product_id:
-                continue
-            
-            name = product.get('name', '')
-            price = product.get('price', 0)
-            old_price = product.get('old_price', 0)
-            category = product.get('category', '')
-            
-            # Проверяем существует ли товар
-            cursor.execute('SELECT current_price, min_price, max_price FROM products WHERE product_id = ?', (product_id,))
-            existing = cursor.fetchone()
-            
-            if existing:
-                # Товар существует - обновляем
-                old_db_price, min_price, max_price = existing
-                
-                # Обновляем min/max цены
-                new_min = min(min_price, price) if min_price > 0 else price
-                new_max = max(max_price, price)
-                
-                cursor.execute('''
-                    UPDATE products 
-                    SET name = ?, category = ?, current_price = ?, 
-                        min_price = ?, max_price = ?, last_updated = ?
-                    WHERE product_id = ?
-                ''', (name, category, price, new_min, new_max, scraped_at, product_id))
-                
-                updated_count += 1
-                
-                # Если цена изменилась - записываем в историю
-                if abs(old_db_price - price) > 0.01:
-                    cursor.execute('''
-                        INSERT INTO price_history (product_id, price, old_price, recorded_at)
-                        VALUES (?, ?, ?, ?)
-                    ''', (product_id, price, old_price, scraped_at))
-                    price_changed_count += 1
-            else:
-                # Новый товар
-                cursor.execute('''
-                    INSERT INTO products (product_id, name, category, current_price, min_price, max_price, first_seen, last_updated)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-                ''', (product_id, name, category, price, price, price, scraped_at, scraped_at))
-                
-                # Первая запись в историю цен
-                cursor.execute('''
-                    INSERT INTO price_history (product_id, price, old_price, recorded_at)
-                    VALUES (?, ?, ?, ?)
-                ''', (product_id, price, old_price, scraped_at))
-                
-                new_count += 1
+        conn = open_store_db('products.db')
+        counts = upsert_products(conn, self.all_products, scraped_at)
+        self._finish_database(conn, counts)
+    
+    def _finish_database(self, conn, counts):
+        """Обработка базы после сохранения товаров прогона"""
+        # Атрибуты товаров для сравнения цен (пачкой после скрапинга)
+        parsed = refresh_product_attributes(conn)
         
-        conn.commit()
+        # Категории и статистика магазина для веб-приложения
+        refresh_store_summary(conn)
         conn.close()
         
         print(f"[OK] Сохранено в products.db:")
-        print(f"     Новых товаров: {new_count}")
-        print(f"     Обновлено: {updated_count}")
-        print(f"     Цена изменилась: {price_changed_count}")
+        print(f"     Новых товаров: {counts.new}")
+        print(f"     Обновлено: {counts.updated}")
+        print(f"     Цена изменилась: {counts.price_changed}")
+        print(f"     Разобрано атрибутов: {parsed}")
+        
+        # Аналоги в другом магазине для страницы товара и /api/compare.
+        # Полный пересчёт на всех ядрах - только по запросу (--matches),
+        # иначе отдельно: python bulk_matching.py
+        if self.update_matches:
+            print("[*] Пересчёт сопоставлений между магазинами...")
+            update_all_matches()
+        else:
+            print("[*] Сопоставления не пересчитаны: python bulk_matching.py или --matches")
+
+
+def _scrape_sequential(scraper, categories, storage, demo_mode):
+    """Категории по очереди в одном браузере: (категория, товары)"""
+    total_categories = len(categories)
+    for i, category in enumerate(categories, 1):
+        print(f"\n[{i}/{total_categories}] {category['name']}...")
+        
+        if storage and storage.is_done(category['name']):
+            print("    Уже сохранена в этом прогоне - пропуск")
+            continue
+        
+        yield category, scraper.scrape_category(category)
+        
+        if not demo_mode:
+            time.sleep(1)
+
 
+def _scrape_parallel(scraper, categories, storage, workers):
+    """Категории в пуле браузеров (по мере готовности): (категория, товары)"""
+    pending = [category for category in categories
+               if not (storage and storage.is_done(category['name']))]
+    if len(pending) < len(categories):
+        print(f"[*] Уже сохранено в этом прогоне: {len(categories) - len(pending)} категорий - пропуск")
+    
+    def make_scraper():
+        # Настройки и общее время категорий - от основного скрапера
+        worker = Scraper5ka(adaptive_wait=scraper.adaptive_wait)
+        worker.category_times = scraper.category_times
+        worker.snapshot_dir = scraper.snapshot_dir
+        return worker
+    
+    pool = CategoryWorkerPool(make_scraper, workers=workers, rate_limiter=RateLimiter(),
+                              prepare=Scraper5ka.open_catalog)
+    print(f"[*] Браузеров: {pool.workers}, запросов в секунду не больше {pool.rate_limiter.rate:g}")
+    
+    for i, (category, products) in enumerate(pool.run(pending), 1):
+        print(f"\n[{i}/{len(pending)}] {category['name']}")
+        if products is None:
+            print("    [!] Категория не обработана")
+            continue
+        yield category, products
 
-def main(demo_mode: bool = False):
+
+def main(demo_mode: bool = False, pipeline: bool = False, resume: bool = False,
+         adaptive_wait: bool = True, workers: int = 1, record: str = None,
+         update_matches: bool = False):
     """
     Основная функция скрапера.
     
     Args:
         demo_mode: если True - обрабатывает только первую категорию
+        pipeline: сохранять каждую категорию сразу (база + NDJSON)
+        resume: продолжить прерванный потоковый прогон
+        adaptive_wait: ждать догрузки по событиям страницы (False - прежние паузы)
+        workers: браузеров для параллельного обхода категорий (1 - по очереди)
+        record: каталог для снимков страниц (scraper_snapshots.py)
+        update_matches: пересчитать сопоставления между магазинами после сохранения
     """
     print("="*60)
     if demo_mode:
@@ -488,7 +598,12 @@ def main(demo_mode: bool = False):
         print("  СКРАПЕР ПЯТЁРОЧКА v3 - ВСЕ КАТЕГОРИИ")
     print("="*60)
     
-    scraper = Scraper5ka()
+    scraper = Scraper5ka(adaptive_wait=adaptive_wait)
+    scraper.snapshot_dir = record
+    # Демо-прогон (одна категория) не повод пересчитывать весь каталог
+    scraper.update_matches = update_matches and not demo_mode
+    storage = CategoryPipeline('products.db', 'products_5ka', resume=resume) if pipeline or resume else None
+    saved_total = 0
     
     try:
         scraper.start()
@@ -508,10 +623,22 @@ def main(demo_mode: bool = False):
         print(f"\n[*] Категорий к обработке: {total_categories}")
         print("-"*60)
         
-        for i, category in enumerate(categories, 1):
-            print(f"\n[{i}/{total_categories}] {category['name']}...")
-            
-            products = scraper.scrape_category(category)
+        started = time.perf_counter()
+        if workers > 1:
+            # Категории получены - дальше работают браузеры пула
+            scraper.stop()
+            results = _scrape_parallel(scraper, categories, storage, workers)
+        else:
+            results = _scrape_sequential(scraper, categories, storage, demo_mode)
+        
+        # Результаты собираются здесь: повторы товаров и запись в базу - в одном потоке
+        for category, products in results:
+            if storage:
+                # Потоковый режим: категория сразу в базу и NDJSON
+                fresh = storage.flush(category['name'], products)
+                saved_total += len(fresh)
+                print(f"    Найдено: {len(products)} | Новых: {len(fresh)} | Сохранено: {saved_total}")
+                continue
             
             # Фильтруем дубликаты
             new_products = 0
@@ -523,32 +650,60 @@ def main(demo_mode: bool = False):
                     new_products += 1
             
             print(f"    Найдено: {len(products)} | Новых: {new_products} | Всего: {len(scraper.all_products)}")
-            
-            if not demo_mode:
-                time.sleep(1)
         
-        print("\n" + "="*60)
-        print(f"[OK] Всего уникальных товаров: {len(scraper.all_products)}")
-        print("="*60)
+        scraper.report_category_times()
+        print(f"     Обход категорий: {time.perf_counter() - started:.1f} с "
+              f"(браузеров: {max(1, workers)})")
         
-        # Показываем примеры
-        if scraper.all_products:
-            print("\nПримеры:")
-            for p in scraper.all_products[:5]:
-                name = p.get('name', '')[:50]
-                price = p.get('price', 0)
-                print(f"  - {name}... {price} руб.")
-        
-        # Сохраняем
-        print("\n[*] Сохранение в базу данных...")
-        scraper.save_results()
+        if storage:
+            counts = storage.finish()
+            print("\n" + "="*60)
+            print(f"[OK] Сохранено товаров: {saved_total} -> {storage.ndjson_path}")
+            print("="*60)
+            scraper._finish_database(storage.conn, counts)
+        else:
+            print("\n" + "="*60)
+            print(f"[OK] Всего уникальных товаров: {len(scraper.all_products)}")
+            print("="*60)
+            
+            # Показываем примеры
+            if scraper.all_products:
+                print("\nПримеры:")
+                for p in scraper.all_products[:5]:
+                    name = p.get('name', '')[:50]
+                    price = p.get('price', 0)
+                    print(f"  - {name}... {price} руб.")
+            
+            # Сохраняем
+            print("\n[*] Сохранение в базу данных...")
+            scraper.save_results()
         
     finally:
         scraper.stop()
+        if storage:
+            storage.close()
     
     print("\n[OK] Готово!")
 
 
 if __name__ == "__main__":
-    # Полный режим - все категории
-    main(demo_mode=False)
+    parser = argparse.ArgumentParser(description='Скрапер Пятёрочки')
+    parser.add_argument('--demo', action='store_true', help='Только первая категория')
+    parser.add_argument('--pipeline', action='store_true',
+                        help='Сохранять каждую категорию сразу (база + NDJSON)')
+    parser.add_argument('--resume', action='store_true',
+                        help='Продолжить прерванный потоковый прогон')
+    parser.add_argument('--fixed-waits', action='store_true',
+                        help='Прежние фиксированные паузы вместо ожидания по событиям (для сравнения времени)')
+    parser.add_argument('--workers', type=int, nargs='?', const=SCRAPER_WORKERS, default=1,
+                        help=f'Параллельный обход категорий: браузеров (без числа - {SCRAPER_WORKERS})')
+    parser.add_argument('--record', nargs='?', const=SNAPSHOT_DIR, default=None, metavar='DIR',
+                        help=f'Сохранять снимки страниц для офлайн-проверки (по умолчанию {SNAPSHOT_DIR})')
+    parser.add_argument('--matches', action='store_true',
+                        help='Пересчитать сопоставления между магазинами после сохранения (bulk_matching.py)')
+    args = parser.parse_args()
+    
+    # По умолчанию - полный режим, все категории
+    main(demo_mode=args.demo, pipeline=args.pipeline, resume=args.resume,
+         adaptive_wait=not args.fixed_waits, workers=args.workers, record=args.record,
+         update_matches=args.matches)
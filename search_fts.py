@@ -0,0 +1,242 @@
+# -*- coding: utf-8 -*-
+"""
+Поиск товаров через SQLite FTS5
+
+Виртуальная таблица products_fts индексирует нормализованную копию
+name/category (ё -> е, регистр сворачивает токенайзер unicode61)
+и поддерживается триггерами на products, поэтому скраперам
+ничего дополнительно делать не нужно.
+
+Кандидаты отбираются по префиксам токенов (MATCH), а релевантность,
+подсчёт и пагинация выполняются в SQL по тем же правилам,
+что и в search_index.relevance_score.
+"""
+
+import sqlite3
+import threading
+from typing import List, Tuple
+
+from store_db import ensure_store_schema
+from text_utils import normalize_text, tokenize_query
+
+# Базы, для которых FTS-индекс уже проверен в этом процессе
+_ready_databases = set()
+_ready_lock = threading.Lock()
+
+# Нормализация на стороне SQL: регистр сворачивает токенайзер
+_FTS_NAME = "replace(replace({0}.name, 'Ё', 'Е'), 'ё', 'е')"
+_FTS_CATEGORY = "replace(replace(coalesce({0}.category, ''), 'Ё', 'Е'), 'ё', 'е')"
+
+FTS_SCHEMA = [
+    '''
+    CREATE VIRTUAL TABLE IF NOT EXISTS products_fts USING fts5(
+        name, category,
+        content='products', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 0',
+        prefix='2 3 4'
+    )
+    ''',
+    f'''
+    CREATE TRIGGER IF NOT EXISTS products_fts_ai AFTER INSERT ON products BEGIN
+        INSERT INTO products_fts(rowid, name, category)
+        VALUES (new.id, {_FTS_NAME.format('new')}, {_FTS_CATEGORY.format('new')});
+    END
+    ''',
+    f'''
+    CREATE TRIGGER IF NOT EXISTS products_fts_ad AFTER DELETE ON products BEGIN
+        INSERT INTO products_fts(products_fts, rowid, name, category)
+        VALUES ('delete', old.id, {_FTS_NAME.format('old')}, {_FTS_CATEGORY.format('old')});
+    END
+    ''',
+    f'''
+    CREATE TRIGGER IF NOT EXISTS products_fts_au AFTER UPDATE OF name, category ON products
+    WHEN old.name IS NOT new.name OR old.category IS NOT new.category BEGIN
+        INSERT INTO products_fts(products_fts, rowid, name, category)
+        VALUES ('delete', old.id, {_FTS_NAME.format('old')}, {_FTS_CATEGORY.format('old')});
+        INSERT INTO products_fts(rowid, name, category)
+        VALUES (new.id, {_FTS_NAME.format('new')}, {_FTS_CATEGORY.format('new')});
+    END
+    ''',
+]
+
+
+def fts5_available() -> bool:
+    """Собран ли SQLite с поддержкой FTS5"""
+    conn = sqlite3.connect(':memory:')
+    try:
+        conn.execute('CREATE VIRTUAL TABLE t USING fts5(x)')
+        return True
+    except sqlite3.OperationalError:
+        return False
+    finally:
+        conn.close()
+
+
+def register_functions(conn):
+    """Регистрирует normalize_text как SQL-функцию соединения"""
+    conn.create_function('normalize_text', 1, normalize_text, deterministic=True)
+
+
+def ensure_fts_index(conn, db_path: str = None) -> bool:
+    """
+    Создаёт products_fts и триггеры, если их ещё нет,
+    и заполняет индекс существующими товарами. Регистрирует
+    normalize_text на соединении, поэтому вызывается для каждого
+    соединения перед поиском (индекс базы проверяется один раз за процесс).
+
+    Returns:
+        True если FTS-индекс готов к использованию
+    """
+    register_functions(conn)
+    if db_path and db_path in _ready_databases:
+        return True
+
+    try:
+        ensure_store_schema(conn)
+        exists = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'products_fts'"
+        ).fetchone()
+
+        for statement in FTS_SCHEMA:
+            conn.execute(statement)
+
+        if not exists:
+            # 'rebuild' взял бы ненормализованные значения из products
+            conn.execute(f'''
+                INSERT INTO products_fts(rowid, name, category)
+                SELECT id, {_FTS_NAME.format('products')}, {_FTS_CATEGORY.format('products')}
+                FROM products
+            ''')
+            print("[OK] FTS5-индекс товаров создан")
+        conn.commit()
+    except sqlite3.OperationalError as e:
+        print(f"[!] FTS5 недоступен: {e}")
+        return False
+
+    if db_path:
+        with _ready_lock:
+            _ready_databases.add(db_path)
+    return True
+
+
+def _fts_phrase(text: str) -> str:
+    """Экранирование строки как FTS5-фразы с префиксным поиском"""
+    return '"' + text.replace('"', '""') + '"*'
+
+
+def _build_query(search_query: str, category: str = None):
+    """
+    Собирает SQL с расчётом релевантности
+
+    Returns:
+        (sql, params) или None если запрос пустой
+    """
+    tokens = tokenize_query(search_query)
+    if not tokens:
+        return None
+
+    normalized_query = normalize_text(search_query)
+
+    # Фразы без букв и цифр FTS5 отбрасывает целиком
+    name_terms = [_fts_phrase(t) for t in tokens if any(ch.isalnum() for ch in t)]
+    match_parts = []
+    if name_terms:
+        match_parts.append(f"name : ({' OR '.join(name_terms)})")
+    if any(ch.isalnum() for ch in normalized_query):
+        match_parts.append(f"category : {_fts_phrase(normalized_query)}")
+    if not match_parts:
+        return None
+
+    matches_sql = ' + '.join('(instr(nn, ?) > 0)' for _ in tokens)
+
+    sql = f'''
+        WITH candidates AS (
+            SELECT p.*,
+                   coalesce(p.name_normalized, normalize_text(p.name)) AS nn,
+                   normalize_text(coalesce(p.category, '')) AS cn
+            FROM products_fts f
+            JOIN products p ON p.id = f.rowid
+            WHERE products_fts MATCH ?
+            {'AND p.category = ?' if category else ''}
+        ),
+        ranked AS (
+            SELECT candidates.*,
+                   CASE
+                       WHEN instr(nn, ?) > 0 THEN
+                           CASE
+                               WHEN nn = ? OR instr(' ' || nn || ' ', ' ' || ? || ' ') > 0 THEN 120
+                               WHEN substr(nn, 1, length(?)) = ? THEN 110
+                               ELSE 100
+                           END
+                       WHEN ({matches_sql}) = ? THEN 80
+                       WHEN ({matches_sql}) > 0 THEN 30 + 15 * ({matches_sql})
+                       WHEN instr(cn, ?) > 0 THEN 20
+                       ELSE 0
+                   END AS relevance
+            FROM candidates
+        )
+    '''
+
+    params = [' OR '.join(match_parts)]
+    if category:
+        params.append(category)
+    params += [normalized_query] * 5
+    params += tokens + [len(tokens)]
+    params += tokens * 2
+    params.append(normalized_query)
+    return sql, params
+
+
+def search_products_fts(conn, search_query: str, category: str = None,
+                        limit: int = 50, offset: int = 0) -> Tuple[List[dict], int]:
+    """
+    Поиск с ранжированием, подсчётом и пагинацией на стороне SQLite.
+    Общее количество считается тем же запросом (COUNT(*) OVER ()).
+    Соединение должно пройти ensure_fts_index.
+
+    Returns:
+        (товары текущей страницы, общее количество)
+    """
+    built = _build_query(search_query, category)
+    if not built:
+        return [], 0
+    sql, params = built
+
+    rows = conn.execute(
+        sql + '''
+        SELECT *, COUNT(*) OVER () AS total_count FROM ranked
+        WHERE relevance > 0
+        ORDER BY relevance DESC, length(name), id
+        LIMIT ? OFFSET ?
+        ''',
+        params + [limit, offset]
+    ).fetchall()
+
+    if not rows:
+        # Страница за концом выдачи - количество отдельным запросом
+        return [], count_products_fts(conn, search_query, category) if offset else 0
+
+    total = rows[0]['total_count']
+    products = []
+    for row in rows:
+        product = dict(row)
+        product.pop('nn', None)
+        product.pop('cn', None)
+        product.pop('total_count', None)
+        products.append(product)
+    return products, total
+
+
+def count_products_fts(conn, search_query: str, category: str = None) -> int:
+    """
+    Подсчёт результатов поиска одним SQL-запросом
+    (соединение должно пройти ensure_fts_index)
+    """
+    built = _build_query(search_query, category)
+    if not built:
+        return 0
+    sql, params = built
+
+    return conn.execute(
+        sql + 'SELECT COUNT(*) FROM ranked WHERE relevance > 0', params
+    ).fetchone()[0]
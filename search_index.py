@@ -0,0 +1,303 @@
+# -*- coding: utf-8 -*-
+"""
+In-memory инвертированный индекс для поиска товаров
+
+Для каждого магазина в процессе держится индекс:
+    фрагмент названия -> множество id товаров (posting list)
+    2/3-грамма -> множество фрагментов (для поиска подстрок)
+
+Релевантность считается только по кандидатам из posting lists,
+по тем же правилам, что и полный перебор в app.smart_search_products.
+
+Индекс обновляется инкрементально, когда меняется файл базы
+(mtime/размер) и PRAGMA data_version собственного соединения.
+"""
+
+import sqlite3
+import threading
+from collections import defaultdict
+from typing import Dict, List, Optional, Set, Tuple
+
+from store_db import db_file_signature
+from text_utils import TOKEN_SEPARATORS, normalize_text, tokenize_query
+
+# Максимальный размер кэша "токен -> id товаров"
+TOKEN_CACHE_SIZE = 2048
+
+
+def relevance_score(normalized_query: str, name_normalized: str, matches: int,
+                    token_count: int, category_normalized: str) -> int:
+    """
+    Релевантность товара запросу:
+    120 - точное совпадение названия или целого слова
+    110 - название начинается с запроса
+    100 - запрос входит в название
+    80  - найдены все токены
+    30 + 15 * n - найдены n токенов
+    20  - запрос входит в категорию
+    """
+    if normalized_query in name_normalized:
+        relevance = 100
+        # Бонус если название начинается с запроса
+        if name_normalized.startswith(normalized_query):
+            relevance = 110
+        # Бонус за точное совпадение слова
+        if normalized_query == name_normalized or f" {normalized_query} " in f" {name_normalized} ":
+            relevance = 120
+        return relevance
+
+    if matches == token_count:
+        # Все токены найдены
+        return 80
+    if matches > 0:
+        # Часть токенов найдена
+        return 30 + matches * 15
+    if normalized_query in category_normalized:
+        # Совпадение с категорией
+        return 20
+    return 0
+
+
+def _grams(piece: str) -> Set[str]:
+    """2- и 3-граммы фрагмента названия"""
+    grams = set()
+    for size in (2, 3):
+        for i in range(len(piece) - size + 1):
+            grams.add(piece[i:i + size])
+    return grams
+
+
+class SearchIndex:
+    """Инвертированный индекс товаров одного магазина"""
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._conn = None
+        self._inode = None
+        self._signature = None
+        self._data_version = None
+        self._reset()
+
+    def _reset(self):
+        """Очистка всех структур индекса"""
+        # id -> (name, name_normalized, category)
+        self._docs: Dict[int, Tuple[str, str, str]] = {}
+        self._postings: Dict[str, Set[int]] = defaultdict(set)
+        self._grams: Dict[str, Set[str]] = defaultdict(set)
+        self._by_category: Dict[str, Set[int]] = defaultdict(set)
+        self._category_normalized: Dict[str, str] = {}
+        self._token_cache: Dict[str, Set[int]] = {}
+        self._max_id = 0
+        self._max_updated = ''
+
+    # ------------------------------------------------------------------
+    # Отслеживание изменений базы
+    # ------------------------------------------------------------------
+
+    def _open(self):
+        """Открыть собственное read-only соединение индекса"""
+        if self._conn:
+            self._conn.close()
+        self._conn = sqlite3.connect(f'file:{self.db_path}?mode=ro', uri=True,
+                                     check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        columns = [row[1] for row in self._conn.execute('PRAGMA table_info(products)').fetchall()]
+        self._has_normalized = 'name_normalized' in columns
+
+    def _refresh_if_changed(self):
+        """Обновить индекс, если база изменилась с прошлой проверки"""
+        signature = db_file_signature(self.db_path)
+        if signature is None:
+            if self._conn:
+                self._conn.close()
+                self._conn = None
+            self._signature = None
+            self._reset()
+            return
+
+        if signature == self._signature:
+            return
+
+        if self._conn is None or signature[0] != self._inode:
+            # Новый файл базы - полная перестройка
+            self._open()
+            self._inode = signature[0]
+            self._data_version = None
+            self._reset()
+
+        data_version = self._conn.execute('PRAGMA data_version').fetchone()[0]
+        if data_version != self._data_version or not self._docs:
+            self._apply_changes()
+            self._data_version = data_version
+        self._signature = signature
+
+    def _apply_changes(self):
+        """Инкрементальное обновление: новые и изменённые товары"""
+        try:
+            normalized_column = 'name_normalized' if self._has_normalized else 'NULL'
+            rows = self._conn.execute(
+                f'SELECT id, name, {normalized_column} AS name_normalized, category, last_updated '
+                'FROM products WHERE id > ? OR last_updated >= ?',
+                (self._max_id, self._max_updated)
+            ).fetchall()
+        except sqlite3.OperationalError:
+            # Таблицы ещё нет
+            self._reset()
+            return
+
+        for row in rows:
+            self._index_row(row['id'], row['name'] or '', row['name_normalized'],
+                            row['category'] or '')
+            self._max_id = max(self._max_id, row['id'])
+            if row['last_updated'] and row['last_updated'] > self._max_updated:
+                self._max_updated = row['last_updated']
+
+        # Товары удалялись - инкрементально не обработать, перестраиваем
+        total = self._conn.execute('SELECT COUNT(*) FROM products').fetchone()[0]
+        if total != len(self._docs):
+            self._reset()
+            self._apply_changes()
+            return
+
+        if rows:
+            self._token_cache.clear()
+
+    def _index_row(self, doc_id: int, name: str, name_normalized: Optional[str], category: str):
+        """Добавить или переиндексировать товар"""
+        existing = self._docs.get(doc_id)
+        if existing:
+            if existing[0] == name and existing[2] == category:
+                return
+            self._unindex(doc_id)
+
+        if name_normalized is None:
+            name_normalized = normalize_text(name)
+        self._docs[doc_id] = (name, name_normalized, category)
+        self._by_category[category].add(doc_id)
+        if category not in self._category_normalized:
+            self._category_normalized[category] = normalize_text(category)
+
+        for piece in set(TOKEN_SEPARATORS.split(name_normalized)):
+            if not piece:
+                continue
+            if piece not in self._postings:
+                for gram in _grams(piece):
+                    self._grams[gram].add(piece)
+            self._postings[piece].add(doc_id)
+
+    def _unindex(self, doc_id: int):
+        """Убрать товар из всех posting lists"""
+        name, name_normalized, category = self._docs.pop(doc_id)
+        self._by_category[category].discard(doc_id)
+        if not self._by_category[category]:
+            del self._by_category[category]
+            del self._category_normalized[category]
+
+        for piece in set(TOKEN_SEPARATORS.split(name_normalized)):
+            postings = self._postings.get(piece)
+            if postings is None:
+                continue
+            postings.discard(doc_id)
+            if not postings:
+                del self._postings[piece]
+                for gram in _grams(piece):
+                    self._grams[gram].discard(piece)
+                    if not self._grams[gram]:
+                        del self._grams[gram]
+
+    # ------------------------------------------------------------------
+    # Поиск
+    # ------------------------------------------------------------------
+
+    def _docs_for_token(self, token: str) -> Set[int]:
+        """Все товары, в названии которых токен встречается как подстрока"""
+        cached = self._token_cache.get(token)
+        if cached is not None:
+            return cached
+
+        # Токен не содержит разделителей, поэтому входит в название
+        # только целиком внутри одного фрагмента
+        if len(token) == 2:
+            pieces = self._grams.get(token, set())
+        else:
+            gram_sets = [self._grams.get(token[i:i + 3]) for i in range(len(token) - 2)]
+            if any(s is None for s in gram_sets):
+                pieces = set()
+            else:
+                gram_sets.sort(key=len)
+                pieces = set(gram_sets[0]).intersection(*gram_sets[1:])
+                if len(token) > 3:
+                    pieces = {p for p in pieces if token in p}
+
+        docs = set()
+        for piece in pieces:
+            docs |= self._postings[piece]
+
+        if len(self._token_cache) >= TOKEN_CACHE_SIZE:
+            self._token_cache.clear()
+        self._token_cache[token] = docs
+        return docs
+
+    def search(self, search_query: str, category: str = None) -> List[Tuple[int, int]]:
+        """
+        Поиск товаров
+
+        Returns:
+            список (id товара, релевантность), отсортированный так же,
+            как в полном переборе: по релевантности, затем по длине названия
+        """
+        if not search_query or not search_query.strip():
+            return []
+
+        tokens = tokenize_query(search_query)
+        if not tokens:
+            return []
+
+        normalized_query = normalize_text(search_query)
+
+        with self._lock:
+            self._refresh_if_changed()
+
+            matches = defaultdict(int)
+            for token in tokens:
+                for doc_id in self._docs_for_token(token):
+                    matches[doc_id] += 1
+
+            results = []
+            for doc_id, count in matches.items():
+                name, name_normalized, doc_category = self._docs[doc_id]
+                if category and doc_category != category:
+                    continue
+                relevance = relevance_score(normalized_query, name_normalized, count,
+                                            len(tokens), self._category_normalized[doc_category])
+                results.append((-relevance, len(name), doc_id))
+
+            # Совпадение только по категории
+            for doc_category, category_normalized in self._category_normalized.items():
+                if category and doc_category != category:
+                    continue
+                if normalized_query not in category_normalized:
+                    continue
+                for doc_id in self._by_category[doc_category]:
+                    if doc_id not in matches:
+                        results.append((-20, len(self._docs[doc_id][0]), doc_id))
+
+        # id совпадает с порядком строк при полном проходе по таблице
+        results.sort()
+        return [(doc_id, -neg_relevance) for neg_relevance, _, doc_id in results]
+
+
+# Индексы по путям к базам
+_indexes: Dict[str, SearchIndex] = {}
+_indexes_lock = threading.Lock()
+
+
+def get_search_index(db_path: str) -> SearchIndex:
+    """Получить (или создать) индекс для базы магазина"""
+    with _indexes_lock:
+        index = _indexes.get(db_path)
+        if index is None:
+            index = SearchIndex(db_path)
+            _indexes[db_path] = index
+        return index
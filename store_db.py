@@ -0,0 +1,370 @@
+# -*- coding: utf-8 -*-
+"""
+Схема баз данных магазинов (products.db, products_magnit.db)
+
+Общая для веб-приложения и обоих скраперов.
+
+Запуск:
+    python store_db.py backfill              # Заполнить name_normalized/tokens
+    python store_db.py backfill --all        # Пересчитать для всех товаров
+    python store_db.py backfill --store 5ka  # Только одна база
+    python store_db.py attributes            # Обновить product_attributes
+    python store_db.py attributes --all      # Разобрать заново все названия
+    python store_db.py migrate               # Применить миграции схемы
+    python store_db.py migrate --plans       # + планы горячих запросов
+"""
+
+import argparse
+import os
+import sqlite3
+from typing import List, Optional
+
+from migrations import Migration, query_plans, run_migrations, schema_version
+from product_attributes import ensure_attributes_schema, refresh_product_attributes
+from text_utils import normalize_product_name
+
+# Файлы баз магазинов
+STORE_DATABASES = {
+    '5ka': 'products.db',
+    'magnit': 'products_magnit.db',
+}
+
+PRODUCTS_SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS products (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        product_id TEXT UNIQUE NOT NULL,
+        name TEXT NOT NULL,
+        name_normalized TEXT,
+        tokens TEXT,
+        category TEXT,
+        current_price REAL DEFAULT 0,
+        min_price REAL DEFAULT 0,
+        max_price REAL DEFAULT 0,
+        rating REAL DEFAULT 0,
+        reviews INTEGER DEFAULT 0,
+        image_url TEXT,
+        first_seen TIMESTAMP,
+        last_updated TIMESTAMP
+    )
+'''
+
+PRICE_HISTORY_SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS price_history (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        product_id TEXT NOT NULL,
+        price REAL NOT NULL,
+        old_price REAL,
+        recorded_at TIMESTAMP
+    )
+'''
+
+# Аналоги товаров из другого магазина (пересчитывает matching.py)
+PRODUCT_MATCHES_SCHEMA = [
+    '''
+    CREATE TABLE IF NOT EXISTS product_matches (
+        product_id TEXT NOT NULL,
+        target_store TEXT NOT NULL,
+        rank INTEGER NOT NULL,
+        target_product_id TEXT NOT NULL,
+        score INTEGER NOT NULL,
+        price_diff REAL,
+        is_exact_match INTEGER DEFAULT 0,
+        computed_at TIMESTAMP,
+        PRIMARY KEY (product_id, target_store, rank)
+    )
+    ''',
+    # Товары, для которых сопоставление посчитано (в т.ч. без аналогов)
+    '''
+    CREATE TABLE IF NOT EXISTS product_matches_computed (
+        product_id TEXT NOT NULL,
+        target_store TEXT NOT NULL,
+        match_count INTEGER DEFAULT 0,
+        computed_at TIMESTAMP,
+        PRIMARY KEY (product_id, target_store)
+    )
+    ''',
+    # Чекпоинты пакетного пересчёта: диапазоны products.id
+    # (chunk_end NULL - до конца таблицы)
+    '''
+    CREATE TABLE IF NOT EXISTS product_matches_checkpoints (
+        target_store TEXT NOT NULL,
+        chunk_start INTEGER NOT NULL,
+        chunk_end INTEGER,
+        run_started_at TIMESTAMP,
+        completed_at TIMESTAMP,
+        PRIMARY KEY (target_store, chunk_start)
+    )
+    ''',
+]
+
+# Сводка по магазину для веб-приложения (пересчитывают скраперы после сохранения)
+CATEGORIES_SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS categories (
+        name TEXT PRIMARY KEY,
+        product_count INTEGER NOT NULL DEFAULT 0,
+        min_price REAL,
+        max_price REAL,
+        updated_at TIMESTAMP
+    )
+'''
+
+STORE_STATS_SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS store_stats (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        product_count INTEGER NOT NULL DEFAULT 0,
+        category_count INTEGER NOT NULL DEFAULT 0,
+        min_price REAL,
+        max_price REAL,
+        updated_at TIMESTAMP
+    )
+'''
+
+# Пересчёт сводки из products (цена 0 - нет в наличии, в min/max не входит)
+STORE_SUMMARY_REFRESH = (
+    'DELETE FROM categories',
+    '''
+    INSERT INTO categories (name, product_count, min_price, max_price, updated_at)
+    SELECT category, COUNT(*), MIN(NULLIF(current_price, 0)), MAX(NULLIF(current_price, 0)),
+           datetime('now', 'localtime')
+    FROM products
+    WHERE category IS NOT NULL AND category != ''
+    GROUP BY category
+    ''',
+    '''
+    INSERT OR REPLACE INTO store_stats (id, product_count, category_count, min_price, max_price, updated_at)
+    SELECT 1, COUNT(*), (SELECT COUNT(*) FROM categories),
+           MIN(NULLIF(current_price, 0)), MAX(NULLIF(current_price, 0)),
+           datetime('now', 'localtime')
+    FROM products
+    ''',
+)
+
+# Потоковые прогоны скраперов: итоги прогона и сохранённые категории.
+# ndjson_offset - размер NDJSON-файла после записи категории
+SCRAPE_RUNS_SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS scrape_runs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        scraped_at TEXT NOT NULL,
+        ndjson_path TEXT,
+        new_count INTEGER DEFAULT 0,
+        updated_count INTEGER DEFAULT 0,
+        price_changed_count INTEGER DEFAULT 0,
+        finished_at TIMESTAMP
+    )
+'''
+
+SCRAPE_RUN_CATEGORIES_SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS scrape_run_categories (
+        run_id INTEGER NOT NULL,
+        category TEXT NOT NULL,
+        product_count INTEGER DEFAULT 0,
+        ndjson_offset INTEGER DEFAULT 0,
+        committed_at TIMESTAMP,
+        PRIMARY KEY (run_id, category)
+    )
+'''
+
+# События изменения цены для сервиса уведомлений (пишут скраперы вместе
+# с price_history). id только растёт (AUTOINCREMENT) - по нему читатель
+# помнит, до какого события дошёл
+PRICE_EVENTS_SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS price_events (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        product_id TEXT NOT NULL,
+        old_price REAL,
+        new_price REAL NOT NULL,
+        recorded_at TIMESTAMP
+    )
+'''
+
+# Колонки, появившиеся позже исходной схемы: (имя, определение)
+PRODUCTS_ADDED_COLUMNS = [
+    ('rating', 'REAL DEFAULT 0'),
+    ('reviews', 'INTEGER DEFAULT 0'),
+    ('image_url', 'TEXT'),
+    ('name_normalized', 'TEXT'),
+    ('tokens', 'TEXT'),
+]
+
+# Миграции схемы (migrations.py). Новые миграции - только в конец списка
+STORE_MIGRATIONS = [
+    Migration(1, 'Индекс истории цен товара по времени', (
+        'CREATE INDEX IF NOT EXISTS idx_price_history_product_time '
+        'ON price_history(product_id, recorded_at)',
+    )),
+    Migration(2, 'Индексы каталога: фильтр по категории и сортировки', (
+        'CREATE INDEX IF NOT EXISTS idx_products_category_updated '
+        'ON products(category, last_updated)',
+        'CREATE INDEX IF NOT EXISTS idx_products_category_price '
+        'ON products(category, current_price)',
+        'CREATE INDEX IF NOT EXISTS idx_products_updated ON products(last_updated)',
+        'CREATE INDEX IF NOT EXISTS idx_products_price ON products(current_price)',
+    )),
+    Migration(3, 'Сводные таблицы categories и store_stats', (
+        CATEGORIES_SCHEMA,
+        STORE_STATS_SCHEMA,
+        *STORE_SUMMARY_REFRESH,
+    )),
+    Migration(4, 'Прогоны скраперов по категориям (product_storage.CategoryPipeline)', (
+        SCRAPE_RUNS_SCHEMA,
+        SCRAPE_RUN_CATEGORIES_SCHEMA,
+    )),
+    Migration(5, 'События изменения цены для уведомлений (price_events)', (
+        PRICE_EVENTS_SCHEMA,
+    )),
+]
+
+# Горячие запросы для отчёта о миграции
+STORE_PLAN_QUERIES = {
+    'История цен товара': (
+        'SELECT price, old_price, recorded_at FROM price_history '
+        'WHERE product_id = ? ORDER BY recorded_at ASC', ('',)),
+    'Последние цены товара': (
+        'SELECT price, recorded_at FROM price_history '
+        'WHERE product_id = ? ORDER BY recorded_at DESC LIMIT 2', ('',)),
+    'Каталог: новые': (
+        'SELECT * FROM products ORDER BY last_updated DESC LIMIT 24', ()),
+    'Каталог: категория, новые': (
+        'SELECT * FROM products WHERE category = ? ORDER BY last_updated DESC LIMIT 24', ('',)),
+    'Каталог: категория, по цене': (
+        'SELECT * FROM products WHERE category = ? ORDER BY current_price ASC LIMIT 24', ('',)),
+    'Каталог: по цене': (
+        'SELECT * FROM products ORDER BY current_price ASC LIMIT 24', ()),
+    'Товаров в категории': (
+        'SELECT COUNT(*) FROM products WHERE category = ?', ('',)),
+    'Список категорий': (
+        "SELECT DISTINCT category FROM products "
+        "WHERE category IS NOT NULL AND category != '' ORDER BY category", ()),
+}
+
+# Размер пачки для backfill
+BACKFILL_BATCH_SIZE = 5000
+
+
+def get_columns(conn, table: str) -> List[str]:
+    """Список колонок таблицы"""
+    return [row[1] for row in conn.execute(f'PRAGMA table_info({table})').fetchall()]
+
+
+def db_file_signature(db_path: str) -> Optional[tuple]:
+    """
+    Сигнатура файлов базы (основной файл + WAL) для отслеживания изменений.
+    None если файла нет.
+    """
+    try:
+        st = os.stat(db_path)
+    except OSError:
+        return None
+    signature = [st.st_ino, st.st_mtime_ns, st.st_size]
+    try:
+        wal = os.stat(db_path + '-wal')
+        signature += [wal.st_mtime_ns, wal.st_size]
+    except OSError:
+        pass
+    return tuple(signature)
+
+
+def ensure_store_schema(conn):
+    """Создаёт таблицы магазина, добавляет недостающие колонки и применяет миграции"""
+    conn.execute(PRODUCTS_SCHEMA)
+    conn.execute(PRICE_HISTORY_SCHEMA)
+    ensure_attributes_schema(conn)
+    for statement in PRODUCT_MATCHES_SCHEMA:
+        conn.execute(statement)
+
+    existing = set(get_columns(conn, 'products'))
+    for column, definition in PRODUCTS_ADDED_COLUMNS:
+        if column not in existing:
+            conn.execute(f'ALTER TABLE products ADD COLUMN {column} {definition}')
+
+    conn.commit()
+    run_migrations(conn, STORE_MIGRATIONS, STORE_PLAN_QUERIES)
+
+
+def refresh_store_summary(conn):
+    """Пересчитывает categories и store_stats (после сохранения товаров скрапером)"""
+    for statement in STORE_SUMMARY_REFRESH:
+        conn.execute(statement)
+    conn.commit()
+
+
+def backfill_normalized(conn, recompute_all: bool = False) -> int:
+    """
+    Заполняет name_normalized и tokens у существующих товаров
+
+    Args:
+        recompute_all: пересчитать для всех товаров, а не только для пустых
+
+    Returns:
+        количество обновлённых товаров
+    """
+    ensure_store_schema(conn)
+
+    query = 'SELECT id, name FROM products'
+    if not recompute_all:
+        query += ' WHERE name_normalized IS NULL OR tokens IS NULL'
+
+    rows = conn.execute(query).fetchall()
+    updated = 0
+
+    for start in range(0, len(rows), BACKFILL_BATCH_SIZE):
+        batch = rows[start:start + BACKFILL_BATCH_SIZE]
+        conn.executemany(
+            'UPDATE products SET name_normalized = ?, tokens = ? WHERE id = ?',
+            [(*normalize_product_name(name or ''), row_id) for row_id, name in batch]
+        )
+        conn.commit()
+        updated += len(batch)
+
+    return updated
+
+
+def main():
+    """Точка входа"""
+    parser = argparse.ArgumentParser(description='Обслуживание баз магазинов')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    backfill = subparsers.add_parser('backfill', help='Заполнить name_normalized и tokens')
+    backfill.add_argument('--store', choices=list(STORE_DATABASES),
+                          help='Только указанный магазин')
+    backfill.add_argument('--all', action='store_true',
+                          help='Пересчитать для всех товаров')
+
+    attributes = subparsers.add_parser('attributes', help='Обновить таблицу product_attributes')
+    attributes.add_argument('--store', choices=list(STORE_DATABASES),
+                            help='Только указанный магазин')
+    attributes.add_argument('--all', action='store_true',
+                            help='Разобрать заново все названия')
+
+    migrate = subparsers.add_parser('migrate', help='Применить миграции схемы')
+    migrate.add_argument('--store', choices=list(STORE_DATABASES),
+                         help='Только указанный магазин')
+    migrate.add_argument('--plans', action='store_true',
+                         help='Показать планы горячих запросов')
+    args = parser.parse_args()
+
+    stores = [args.store] if args.store else list(STORE_DATABASES)
+    for store_id in stores:
+        db_file = STORE_DATABASES[store_id]
+        if not os.path.exists(db_file):
+            print(f"[SKIP] {db_file} не найдена")
+            continue
+        conn = sqlite3.connect(db_file)
+        if args.command == 'backfill':
+            updated = backfill_normalized(conn, recompute_all=args.all)
+            print(f"[OK] {db_file}: обновлено товаров: {updated}")
+        elif args.command == 'attributes':
+            ensure_store_schema(conn)
+            parsed = refresh_product_attributes(conn, recompute_all=args.all)
+            print(f"[OK] {db_file}: разобрано названий: {parsed}")
+        elif args.command == 'migrate':
+            ensure_store_schema(conn)
+            print(f"[OK] {db_file}: версия схемы {schema_version(conn)}")
+            if args.plans:
+                for name, plan in query_plans(conn, STORE_PLAN_QUERIES).items():
+                    print(f"    {name}: {'; '.join(plan)}")
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
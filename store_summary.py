@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+"""
+Кэш сводки магазина: категории и статистика
+
+Читает таблицы categories и store_stats, которые пересчитывают
+скраперы после сохранения товаров (store_db.refresh_store_summary).
+Кэш живёт в процессе и перечитывается, когда меняется
+PRAGMA data_version собственного соединения (другое соединение
+записало в базу) или файл базы заменён.
+"""
+
+import os
+import sqlite3
+import threading
+from typing import Dict, List, Optional
+
+# Сводка для базы без таблиц сводки (до миграции) - считается по products
+_FALLBACK_CATEGORIES_SQL = '''
+    SELECT category AS name, COUNT(*) AS product_count,
+           MIN(NULLIF(current_price, 0)) AS min_price, MAX(NULLIF(current_price, 0)) AS max_price,
+           NULL AS updated_at
+    FROM products
+    WHERE category IS NOT NULL AND category != ''
+    GROUP BY category
+'''
+
+_FALLBACK_STATS_SQL = '''
+    SELECT COUNT(*) AS product_count,
+           MIN(NULLIF(current_price, 0)) AS min_price, MAX(NULLIF(current_price, 0)) AS max_price,
+           NULL AS updated_at
+    FROM products
+'''
+
+
+class StoreSummary:
+    """Сводка одного магазина"""
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._conn = None
+        self._inode = None
+        self._data_version = None
+        self._categories: List[Dict] = []
+        self._counts: Dict[str, int] = {}
+        self._stats: Optional[Dict] = None
+
+    def _close(self):
+        if self._conn:
+            self._conn.close()
+            self._conn = None
+        self._data_version = None
+        self._categories = []
+        self._counts = {}
+        self._stats = None
+
+    def _refresh_if_changed(self):
+        """Перечитать сводку, если база изменилась с прошлой проверки"""
+        try:
+            inode = os.stat(self.db_path).st_ino
+        except OSError:
+            self._close()
+            return
+
+        if self._conn is None or inode != self._inode:
+            # Новый файл базы - новое соединение
+            self._close()
+            self._conn = sqlite3.connect(f'file:{self.db_path}?mode=ro', uri=True,
+                                         check_same_thread=False)
+            self._conn.row_factory = sqlite3.Row
+            self._inode = inode
+
+        data_version = self._conn.execute('PRAGMA data_version').fetchone()[0]
+        if data_version != self._data_version:
+            self._load()
+            self._data_version = data_version
+
+    def _load(self):
+        try:
+            categories = self._conn.execute(
+                'SELECT name, product_count, min_price, max_price, updated_at '
+                'FROM categories ORDER BY name'
+            ).fetchall()
+            stats = self._conn.execute(
+                'SELECT product_count, min_price, max_price, updated_at FROM store_stats WHERE id = 1'
+            ).fetchone()
+        except sqlite3.OperationalError:
+            # Таблиц сводки ещё нет
+            categories = self._conn.execute(_FALLBACK_CATEGORIES_SQL + ' ORDER BY category').fetchall()
+            stats = self._conn.execute(_FALLBACK_STATS_SQL).fetchone()
+
+        self._categories = [dict(row) for row in categories]
+        self._counts = {item['name']: item['product_count'] for item in self._categories}
+        self._stats = dict(stats) if stats else {
+            'product_count': 0, 'min_price': None, 'max_price': None, 'updated_at': None
+        }
+        self._stats['category_count'] = len(self._categories)
+
+    def categories(self) -> List[Dict]:
+        """
+        Категории по алфавиту: name, product_count, min_price, max_price, updated_at.
+        Список общий для всех вызовов - не изменять.
+        """
+        with self._lock:
+            self._refresh_if_changed()
+            return self._categories
+
+    def category_count(self, category: str) -> int:
+        """Количество товаров в категории"""
+        with self._lock:
+            self._refresh_if_changed()
+            return self._counts.get(category, 0)
+
+    def stats(self) -> Optional[Dict]:
+        """
+        Статистика магазина: product_count, category_count, min_price,
+        max_price, updated_at. None если базы нет.
+        """
+        with self._lock:
+            self._refresh_if_changed()
+            return dict(self._stats) if self._stats is not None else None
+
+
+# Сводки по пути к базе
+_summaries: Dict[str, StoreSummary] = {}
+_summaries_lock = threading.Lock()
+
+
+def get_store_summary(db_path: str) -> StoreSummary:
+    """Получить (или создать) сводку для базы магазина"""
+    with _summaries_lock:
+        summary = _summaries.get(db_path)
+        if summary is None:
+            summary = StoreSummary(db_path)
+            _summaries[db_path] = summary
+        return summary
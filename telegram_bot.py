@@ -28,6 +28,7 @@ except ImportError:
     print("[!] python-telegram-bot не установлен. Установите: pip install python-telegram-bot")
 
 from config import TELEGRAM_BOT_TOKEN, TELEGRAM_BOT_USERNAME, APP_URL, DATABASES
+import db_pool
 
 # Настройка логирования
 logging.basicConfig(
@@ -40,10 +41,8 @@ logger = logging.getLogger(__name__)
 USERS_DB = 'users.db'
 
 def get_users_db():
-    """Подключение к базе пользователей"""
-    conn = sqlite3.connect(USERS_DB)
-    conn.row_factory = sqlite3.Row
-    return conn
+    """Подключение к базе пользователей (из пула db_pool)"""
+    return db_pool.connect(USERS_DB, must_exist=False)
 
 
 def generate_linking_code(chat_id: int) -> str:
@@ -0,0 +1,193 @@
+# -*- coding: utf-8 -*-
+"""
+Параллельная отправка сообщений в Telegram с соблюдением лимитов Bot API
+
+Сообщения отправляют несколько asyncio-задач (не больше
+TELEGRAM_SEND_CONCURRENCY запросов одновременно). Частота
+ограничивается вёдрами токенов:
+    - общее на бота: TELEGRAM_GLOBAL_RATE сообщений в секунду;
+    - своё на каждый чат: TELEGRAM_PER_CHAT_RATE в секунду.
+Если Telegram всё же ответил RetryAfter (429), отправка приостанавливается
+для всех задач на указанное время, и сообщение отправляется повторно.
+
+Замер на локальном сервере-заглушке Bot API: python -m benchmarks.telegram_delivery
+"""
+
+import asyncio
+import time
+import warnings
+from collections import OrderedDict
+from itertools import zip_longest
+from typing import Awaitable, Callable, Dict, Iterable, List, NamedTuple, Optional
+
+try:
+    from config import TELEGRAM_GLOBAL_RATE, TELEGRAM_PER_CHAT_RATE, TELEGRAM_SEND_CONCURRENCY
+except ImportError:
+    TELEGRAM_GLOBAL_RATE = 30
+    TELEGRAM_PER_CHAT_RATE = 1.0
+    TELEGRAM_SEND_CONCURRENCY = 16
+
+# Повторов одного сообщения после RetryAfter
+MAX_RETRY_AFTER = 3
+
+
+class TokenBucket:
+    """
+    Ведро токенов для asyncio: rate токенов в секунду, не больше
+    capacity подряд. Токены резервируются сразу (счёт может уйти
+    в минус), поэтому очередь ожидающих соблюдается без блокировок.
+    """
+
+    def __init__(self, rate: float, capacity: float = 1.0):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+
+    def reserve(self) -> float:
+        """Забрать токен. Возвращает, сколько секунд ждать до его появления"""
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+        self._tokens -= 1
+        return -self._tokens / self.rate if self._tokens < 0 else 0.0
+
+    async def acquire(self):
+        delay = self.reserve()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+class Message(NamedTuple):
+    """Сообщение к отправке"""
+    chat_id: str
+    text: str
+    key: object = None  # для вызывающего (например, id подписки)
+
+
+class DeliveryResult(NamedTuple):
+    """Итог отправки сообщения"""
+    message: Message
+    ok: bool
+    error: str = ''
+    attempts: int = 1
+
+
+def retry_after_seconds(error: Exception) -> Optional[float]:
+    """Пауза из RetryAfter (telegram.error) или None для других ошибок"""
+    with warnings.catch_warnings():
+        # python-telegram-bot 22.2+ предупреждает о целых секундах
+        warnings.simplefilter('ignore')
+        value = getattr(error, 'retry_after', None)
+    if value is None:
+        return None
+    return value.total_seconds() if hasattr(value, 'total_seconds') else float(value)
+
+
+def interleave_chats(messages: Iterable[Message]) -> List[Message]:
+    """
+    Порядок по кругу между чатами: несколько сообщений одному чату
+    не занимают всех отправителей ожиданием его лимита
+    """
+    by_chat = OrderedDict()
+    for message in messages:
+        by_chat.setdefault(message.chat_id, []).append(message)
+    return [message for group in zip_longest(*by_chat.values()) for message in group if message]
+
+
+class DeliveryEngine:
+    """
+    Отправка пачки сообщений с ограничением параллельности и частоты
+
+    send(chat_id, text) - корутина отправки, при ошибке бросает исключение
+    (RetryAfter - с атрибутом retry_after).
+    """
+
+    def __init__(self, send: Callable[[str, str], Awaitable],
+                 concurrency: int = TELEGRAM_SEND_CONCURRENCY,
+                 global_rate: float = TELEGRAM_GLOBAL_RATE,
+                 per_chat_rate: float = TELEGRAM_PER_CHAT_RATE,
+                 max_retries: int = MAX_RETRY_AFTER):
+        self.send = send
+        self.concurrency = max(1, concurrency)
+        self.global_bucket = TokenBucket(global_rate)
+        self.per_chat_rate = per_chat_rate
+        self.max_retries = max_retries
+        self._chat_buckets: Dict[str, TokenBucket] = {}
+        self._paused_until = 0.0
+        self.stats = {'sent': 0, 'failed': 0, 'retry_after': 0}
+
+    def _chat_bucket(self, chat_id: str) -> TokenBucket:
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            bucket = self._chat_buckets[chat_id] = TokenBucket(self.per_chat_rate)
+        return bucket
+
+    async def _wait_pause(self):
+        """Пауза после RetryAfter - общая для всех отправителей"""
+        while True:
+            delay = self._paused_until - time.monotonic()
+            if delay <= 0:
+                return
+            await asyncio.sleep(delay)
+
+    async def _deliver_one(self, message: Message) -> DeliveryResult:
+        attempts = 0
+        while True:
+            attempts += 1
+            await self._wait_pause()
+            # Лимит чата - последним, прямо перед отправкой: ожидание общего
+            # лимита не сближает сообщения одному чату (чаты чередуются
+            # interleave_chats, поэтому ждать чата приходится редко)
+            await self.global_bucket.acquire()
+            await self._chat_bucket(message.chat_id).acquire()
+            try:
+                await self.send(message.chat_id, message.text)
+                self.stats['sent'] += 1
+                return DeliveryResult(message, True, attempts=attempts)
+            except Exception as e:
+                retry_after = retry_after_seconds(e)
+                if retry_after is None or attempts > self.max_retries:
+                    self.stats['failed'] += 1
+                    return DeliveryResult(message, False, str(e), attempts)
+                self.stats['retry_after'] += 1
+                self._paused_until = max(self._paused_until, time.monotonic() + retry_after)
+
+    async def deliver(self, messages: Iterable[Message],
+                      on_result: Optional[Callable[[DeliveryResult], None]] = None) -> List[DeliveryResult]:
+        """
+        Отправить сообщения. Результаты - в порядке отправки;
+        on_result вызывается сразу после каждого (в том числе если
+        отправку прервут).
+        """
+        queue = asyncio.Queue()
+        for message in interleave_chats(messages):
+            queue.put_nowait(message)
+        results = []
+
+        async def worker():
+            while True:
+                try:
+                    message = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                result = await self._deliver_one(message)
+                results.append(result)
+                if on_result:
+                    on_result(result)
+
+        await asyncio.gather(*(worker() for _ in range(min(self.concurrency, queue.qsize()))))
+        return results
+
+
+def make_bot(token: str, base_url: Optional[str] = None,
+             concurrency: int = TELEGRAM_SEND_CONCURRENCY):
+    """
+    Bot с пулом HTTP-соединений под параллельную отправку
+    (по умолчанию у python-telegram-bot одно соединение)
+    """
+    from telegram import Bot
+    from telegram.request import HTTPXRequest
+
+    kwargs = {'base_url': base_url} if base_url else {}
+    return Bot(token=token, request=HTTPXRequest(connection_pool_size=concurrency), **kwargs)
@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+"""
+Нормализация и токенизация текста для поиска и сравнения товаров
+
+Модуль не зависит от Flask и используется веб-приложением,
+поисковым индексом и скраперами.
+"""
+
+import re
+from typing import List, Tuple
+
+# Разделители токенов поискового запроса
+TOKEN_SEPARATORS = re.compile(r'[\s,.\-_/\\()]+')
+
+# Слова для сравнения названий (минимум 3 буквы)
+WORD_PATTERN = re.compile(r'[а-яёa-z]{3,}')
+
+
+def normalize_text(text: str) -> str:
+    """Нормализация текста для поиска (Python-сторона)"""
+    if not text:
+        return ""
+    # Приводим к нижнему регистру (работает с кириллицей!)
+    text = text.lower()
+    # Заменяем ё на е
+    text = text.replace('ё', 'е')
+    # Убираем лишние пробелы
+    text = ' '.join(text.split())
+    return text
+
+
+def tokenize_query(query: str) -> List[str]:
+    """Разбиваем запрос на токены (слова)"""
+    query = normalize_text(query)
+    # Разбиваем по пробелам и знакам препинания
+    tokens = TOKEN_SEPARATORS.split(query)
+    # Фильтруем пустые и короткие токены
+    tokens = [t for t in tokens if len(t) >= 2]
+    return tokens
+
+
+def extract_words(name_normalized: str) -> List[str]:
+    """Слова нормализованного названия (минимум 3 буквы)"""
+    return WORD_PATTERN.findall(name_normalized)
+
+
+def split_tokens(tokens: str) -> List[str]:
+    """Разбор колонки products.tokens"""
+    return tokens.split() if tokens else []
+
+
+def normalize_product_name(name: str) -> Tuple[str, str]:
+    """
+    Значения колонок name_normalized и tokens для товара
+
+    Returns:
+        (нормализованное название, слова через пробел)
+    """
+    name_normalized = normalize_text(name)
+    return name_normalized, ' '.join(extract_words(name_normalized))